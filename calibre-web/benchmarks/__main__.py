@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from .library import generate_library
+from .harness import Benchmark, peak_rss_mb
+
+# a scenario is reported as regression if its median latency grows by this factor and at least MIN_REGRESSION_MS
+DEFAULT_THRESHOLD = 1.25
+MIN_REGRESSION_MS = 2.0
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, results, threshold):
+    """Prints the changes against a stored baseline, returns the names of regressed scenarios"""
+    regressions = list()
+    print("\n{:<22}{:>12}{:>12}{:>9}{:>10}{:>10}".format("scenario", "base p50", "p50", "change", "base q",
+                                                       "queries"))
+    for name, result in results.items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            print("{:<22}{:>12}{:>12.2f}".format(name, "-", result["p50_ms"]))
+            continue
+        change = result["p50_ms"] / old["p50_ms"] if old["p50_ms"] else 1.0
+        slower = change > threshold and result["p50_ms"] - old["p50_ms"] > MIN_REGRESSION_MS
+        more_queries = result["queries_median"] > old["queries_median"]
+        if slower or more_queries:
+            regressions.append(name)
+        print("{:<22}{:>12.2f}{:>12.2f}{:>8.0f}%{:>10}{:>10}{}".format(
+            name, old["p50_ms"], result["p50_ms"], (change - 1) * 100, old["queries_median"],
+            result["queries_median"], "  REGRESSION" if slower or more_queries else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Benchmarks Calibre-Web against a generated Calibre library")
+    parser.add_argument("--books", type=int, default=10000, help="number of books in the library, e.g. "
+                                                                  "10000, 100000 or 500000")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the library generator")
+    parser.add_argument("--no-covers", action="store_true", help="generate books without cover files")
+    parser.add_argument("--library", metavar="path", help="directory of the generated library, "
+                                                          "reused while books and seed are unchanged")
+    parser.add_argument("--iterations", type=int, default=20, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=2, help="unmeasured requests per scenario")
+    parser.add_argument("--scenario", action="append", help="run only this scenario, can be repeated")
+    parser.add_argument("--output", metavar="file", help="write the results as json baseline")
+    parser.add_argument("--compare", metavar="file", help="compare the results with a json baseline and "
+                                                          "exit with status 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="factor of median latency growth reported as regression")
+    args = parser.parse_args()
+
+    library = args.library or os.path.join(tempfile.gettempdir(), "calibre-web-benchmark",
+                                           "library-{}-{}".format(args.books, args.seed))
+    started = time.time()
+    generate_library(library, args.books, args.seed, covers=not args.no_covers)
+    print("Library with {} books ready in {}, {:.1f}s".format(args.books, library, time.time() - started))
+
+    with tempfile.TemporaryDirectory(prefix="calibre-web-benchmark-") as work_dir:
+        benchmark = Benchmark(library, work_dir, iterations=args.iterations, warmup=args.warmup)
+
+        def progress(name, result):
+            print("{:<22} p50 {:>9.2f} ms  p90 {:>9.2f} ms  p99 {:>9.2f} ms  queries {:>4}  rss {} MB".format(
+                name, result["p50_ms"], result["p90_ms"], result["p99_ms"], result["queries_median"],
+                result["peak_rss_mb"]))
+
+        benchmark.setup()
+        try:
+            results, failures = benchmark.run(args.scenario, progress)
+        finally:
+            benchmark.teardown()
+        for name, reason in failures.items():
+            print("{:<22} FAILED: {}".format(name, reason))
+
+    import sqlalchemy
+    report = {
+        "meta": {
+            "books": args.books,
+            "seed": args.seed,
+            "covers": not args.no_covers,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "revision": git_revision(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sqlalchemy": sqlalchemy.__version__,
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        "scenarios": results,
+        "failures": failures,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print("Results written to {}".format(args.output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("books") != args.books:
+            print("Baseline was measured with {} books".format(baseline.get("meta", {}).get("books")))
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print("\nRegressions: {}".format(", ".join(regressions)))
+            return 1
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
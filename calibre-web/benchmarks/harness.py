@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Drives the Flask app in-process with the werkzeug test client and measures every scenario"""
+
+import base64
+import math
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# {book_id} in path is replaced by a different book with cover in every iteration, a scenario fails if a response is
+# not successful or the median number of statements exceeds query_budget
+Scenario = namedtuple('Scenario', 'name, path, method, data, auth, before, query_budget',
+                      defaults=("GET", None, None, None, None))
+
+BENCHMARK_USER = "admin"
+
+
+def peak_rss_mb():
+    if not resource:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+class BenchmarkFailure(Exception):
+    pass
+
+
+class QueryCounter:
+    """Counts the statements executed by the benchmark thread, background tasks are ignored"""
+
+    def __init__(self):
+        self.count = 0
+        self.thread = threading.get_ident()
+
+    def install(self):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        event.listen(Engine, "before_cursor_execute", self._count)
+
+    def _count(self, *__):
+        if threading.get_ident() == self.thread:
+            self.count += 1
+
+
+class Benchmark:
+    def __init__(self, library_path, work_dir, iterations=20, warmup=2):
+        self.library_path = library_path
+        self.work_dir = work_dir
+        self.iterations = iterations
+        self.warmup = warmup
+        self.queries = QueryCounter()
+        self.app = None
+        self.client = None
+        self.kobo_token = None
+
+    def setup(self):
+        # cps reads its settings location from the environment and the command line while it is imported and created
+        os.environ["CALIBRE_DBPATH"] = self.work_dir
+        os.environ["CACHE_DIR"] = os.path.join(self.work_dir, "cache")
+        argv = sys.argv
+        sys.argv = [argv[0], "-m", "-o", os.path.join(self.work_dir, "calibre-web.log")]
+        try:
+            from cps import create_app, config, calibre_db, constants, db, ub, limiter
+            from cps.main import register_blueprints
+
+            app = create_app()
+        finally:
+            sys.argv = argv
+        # relations missing in the load profile of a view raise instead of being loaded one by one
+        calibre_db.strict_loading = True
+        config.config_calibre_dir = self.library_path
+        config.config_kobo_sync = True
+        config.config_ratelimiter = False
+        config.save()
+        db.CalibreDB.update_config(config, self.library_path, ub.app_DB_path)
+        config.store_calibre_uuid(calibre_db, db.Library_Id)
+        if limiter:
+            limiter.enabled = False
+        register_blueprints(app)
+        app.config.update(WTF_CSRF_ENABLED=False)
+
+        user = ub.session.query(ub.User).filter(ub.User.name == BENCHMARK_USER).one()
+        token = ub.RemoteAuthToken()
+        token.user_id = user.id
+        token.expiration = datetime.max
+        token.token_type = 1
+        ub.session.add(token)
+        ub.session.commit()
+        self.kobo_token = token.auth_token
+
+        self.app = app
+        self.client = app.test_client()
+        response = self.client.post("/login", data={"username": BENCHMARK_USER,
+                                                    "password": constants.DEFAULT_PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError("Login of benchmark user failed with status {}".format(response.status_code))
+        self.queries.install()
+
+    def teardown(self):
+        # stops the updater thread and the scheduler the same way a server shutdown does
+        from cps import web_server
+        web_server.stop()
+
+    def library_ids(self):
+        """Returns ids of entries with many books, the scenarios use them to hit realistic pages"""
+        from cps import calibre_db, db
+        from sqlalchemy import func
+        with self.app.app_context():
+            session = calibre_db.session
+            author = (session.query(db.books_authors_link.c.author)
+                      .group_by(db.books_authors_link.c.author)
+                      .order_by(func.count(db.books_authors_link.c.book).desc()).first())[0]
+            tag = (session.query(db.books_tags_link.c.tag)
+                   .group_by(db.books_tags_link.c.tag)
+                   .order_by(func.count(db.books_tags_link.c.book).desc()).first())[0]
+            books = session.query(func.count(db.Books.id)).scalar()
+            covers = [book_id for book_id, in session.query(db.Books.id).filter(db.Books.has_cover == 1)
+                      .order_by(db.Books.id).limit(self.iterations + self.warmup)]
+            custom_columns = session.query(db.CustomColumns.id, db.CustomColumns.datatype).all()
+        return {"author": author, "tag": tag, "books": books, "covers": covers, "custom_columns": custom_columns}
+
+    @staticmethod
+    def advanced_search_form(ids, **values):
+        """Returns the fields the advanced search form posts, filled with values"""
+        form = {"authors": "", "title": "", "publisher": "", "publishstart": "", "publishend": "",
+                "ratinghigh": "", "ratinglow": "", "comments": "", "read_status": "Any"}
+        for cc_id, datatype in ids["custom_columns"]:
+            name = "custom_column_{}".format(cc_id)
+            if datatype == "bool":
+                form[name] = "Any"
+            elif datatype == "datetime":
+                form.update({name + "_start": "", name + "_end": ""})
+            elif datatype in ("int", "float"):
+                form.update({name + "_low": "", name + "_high": ""})
+            else:
+                form[name] = ""
+        form.update(values)
+        return form
+
+    def scenarios(self):
+        from cps import config, ub
+        ids = self.library_ids()
+        middle_page = max(1, ids["books"] // config.config_books_per_page // 2)
+        covers = ids["covers"] or [1]
+
+        def reset_kobo_sync():
+            # every iteration measures the first page of an initial sync
+            user = ub.session.query(ub.User).filter(ub.User.name == BENCHMARK_USER).one()
+            ub.session.query(ub.KoboSyncedBooks).filter(ub.KoboSyncedBooks.user_id == user.id).delete()
+            ub.session.commit()
+
+        # budgets leave some room above the measured statements, a relation loaded once per book exceeds them.
+        # Advanced and OPDS search render every hit, their statements grow with the library
+        return [
+            Scenario("index", "/", query_budget=25),
+            Scenario("index_middle_page", "/page/{}".format(middle_page), query_budget=25),
+            Scenario("author_list", "/author", query_budget=5),
+            Scenario("search", "/search?query=river", query_budget=15),
+            Scenario("advanced_search", "/advsearch", "POST",
+                     self.advanced_search_form(ids, title="shadow", include_tag=str(ids["tag"]))),
+            Scenario("books_table", "/ajax/listbooks?offset=0&limit=50&sort=title&order=asc", query_budget=30),
+            Scenario("books_table_middle",
+                     "/ajax/listbooks?offset={}&limit=50&sort=authors&order=desc".format(ids["books"] // 2),
+                     query_budget=30),
+            Scenario("opds_root", "/opds", auth=True, query_budget=5),
+            Scenario("opds_new", "/opds/new", auth=True, query_budget=5),
+            Scenario("opds_author", "/opds/author/{}".format(ids["author"]), auth=True, query_budget=5),
+            Scenario("opds_search", "/opds/search/shadow", auth=True),
+            # one sync answers at most SYNC_ITEM_LIMIT books
+            Scenario("kobo_sync", "/kobo/{}/v1/library/sync".format(self.kobo_token), before=reset_kobo_sync,
+                     query_budget=2100),
+            Scenario("cover", "/cover/{book_id}", query_budget=5),
+        ], covers
+
+    def request(self, scenario, path):
+        from cps import constants
+        headers = dict()
+        if scenario.auth:
+            credentials = "{}:{}".format(BENCHMARK_USER, constants.DEFAULT_PASSWORD).encode()
+            headers["Authorization"] = "Basic " + base64.b64encode(credentials).decode()
+        response = self.client.open(path, method=scenario.method, data=scenario.data, headers=headers,
+                                    follow_redirects=True)
+        # streamed responses do their work while the body is consumed
+        size = len(response.get_data())
+        response.close()
+        return response.status_code, size
+
+    def measure(self, scenario, covers):
+        latencies = list()
+        queries = list()
+        statuses = set()
+        size = 0
+        cold = None
+        for iteration in range(self.warmup + self.iterations):
+            path = scenario.path.replace("{book_id}", str(covers[iteration % len(covers)]))
+            if scenario.before:
+                with self.app.app_context():
+                    scenario.before()
+            self.queries.count = 0
+            start = time.perf_counter()
+            status, size = self.request(scenario, path)
+            duration = (time.perf_counter() - start) * 1000
+            statuses.add(status)
+            if not 200 <= status < 300:
+                raise BenchmarkFailure("{} answered {} for {}".format(scenario.name, status, path))
+            if cold is None:
+                cold = duration
+            if iteration >= self.warmup:
+                latencies.append(duration)
+                queries.append(self.queries.count)
+        queries_median = percentile(queries, 50)
+        if scenario.query_budget is not None and queries_median > scenario.query_budget:
+            raise BenchmarkFailure("{} needed {} statements, its budget is {}".format(
+                scenario.name, queries_median, scenario.query_budget))
+        return {
+            "cold_ms": round(cold, 2),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p90_ms": round(percentile(latencies, 90), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "mean_ms": round(sum(latencies) / len(latencies), 2),
+            "max_ms": round(max(latencies), 2),
+            "queries_median": queries_median,
+            "queries_max": max(queries),
+            "status": sorted(statuses),
+            "response_bytes": size,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def run(self, selected=None, progress=None):
+        """Returns the results of the scenarios and the reasons of the failed ones by name"""
+        scenarios, covers = self.scenarios()
+        if selected:
+            unknown = set(selected) - set(scenario.name for scenario in scenarios)
+            if unknown:
+                raise ValueError("Unknown scenario: {}".format(", ".join(sorted(unknown))))
+        results = dict()
+        failures = dict()
+        for scenario in scenarios:
+            if selected and scenario.name not in selected:
+                continue
+            try:
+                results[scenario.name] = self.measure(scenario, covers)
+            except BenchmarkFailure as ex:
+                failures[scenario.name] = str(ex)
+                continue
+            if progress:
+                progress(scenario.name, results[scenario.name])
+        return results, failures
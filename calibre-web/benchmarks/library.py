@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Generates synthetic Calibre libraries
+
+The same number of books and seed always produce the same metadata.db. Popularity of authors, tags, series and
+publishers is skewed, so a few of them own many books like in real libraries.
+"""
+
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import uuid
+from datetime import datetime, timedelta, timezone
+
+# bump if the generated content changes, libraries generated by an older version are recreated
+GENERATOR_VERSION = 1
+# books written per transaction
+CHUNK_SIZE = 5000
+
+CALIBRE_DATE_FORMAT = "%Y-%m-%d %H:%M:%S+00:00"
+DEFAULT_PUBDATE = "0101-01-01 00:00:00+00:00"
+
+SCHEMA = """
+CREATE TABLE books (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    title TEXT NOT NULL DEFAULT 'Unknown' COLLATE NOCASE,
+                    sort TEXT COLLATE NOCASE,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    pubdate TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    series_index REAL NOT NULL DEFAULT 1.0,
+                    author_sort TEXT COLLATE NOCASE,
+                    isbn TEXT DEFAULT '' COLLATE NOCASE,
+                    lccn TEXT DEFAULT '' COLLATE NOCASE,
+                    path TEXT NOT NULL DEFAULT '',
+                    flags INTEGER NOT NULL DEFAULT 1,
+                    uuid TEXT,
+                    has_cover BOOL DEFAULT 0,
+                    last_modified TIMESTAMP NOT NULL DEFAULT '2000-01-01 00:00:00+00:00');
+CREATE TABLE authors (id INTEGER PRIMARY KEY, name TEXT NOT NULL COLLATE NOCASE, sort TEXT COLLATE NOCASE,
+                      link TEXT NOT NULL DEFAULT '', UNIQUE(name));
+CREATE TABLE books_authors_link (id INTEGER PRIMARY KEY, book INTEGER NOT NULL, author INTEGER NOT NULL,
+                                 UNIQUE(book, author));
+CREATE TABLE tags (id INTEGER PRIMARY KEY, name TEXT NOT NULL COLLATE NOCASE, link TEXT NOT NULL DEFAULT '',
+                   UNIQUE (name));
+CREATE TABLE books_tags_link (id INTEGER PRIMARY KEY, book INTEGER NOT NULL, tag INTEGER NOT NULL,
+                              UNIQUE(book, tag));
+CREATE TABLE series (id INTEGER PRIMARY KEY, name TEXT NOT NULL COLLATE NOCASE, sort TEXT COLLATE NOCASE,
+                     link TEXT NOT NULL DEFAULT '', UNIQUE (name));
+CREATE TABLE books_series_link (id INTEGER PRIMARY KEY, book INTEGER NOT NULL, series INTEGER NOT NULL,
+                                UNIQUE(book));
+CREATE TABLE ratings (id INTEGER PRIMARY KEY, rating INTEGER CHECK(rating > -1 AND rating < 11),
+                      link TEXT NOT NULL DEFAULT '', UNIQUE (rating));
+CREATE TABLE books_ratings_link (id INTEGER PRIMARY KEY, book INTEGER NOT NULL, rating INTEGER NOT NULL,
+                                 UNIQUE(book, rating));
+CREATE TABLE publishers (id INTEGER PRIMARY KEY, name TEXT NOT NULL COLLATE NOCASE, sort TEXT COLLATE NOCASE,
+                         link TEXT NOT NULL DEFAULT '', UNIQUE(name));
+CREATE TABLE books_publishers_link (id INTEGER PRIMARY KEY, book INTEGER NOT NULL, publisher INTEGER NOT NULL,
+                                    UNIQUE(book));
+CREATE TABLE languages (id INTEGER PRIMARY KEY, lang_code TEXT NOT NULL COLLATE NOCASE,
+                        link TEXT NOT NULL DEFAULT '', UNIQUE(lang_code));
+CREATE TABLE books_languages_link (id INTEGER PRIMARY KEY, book INTEGER NOT NULL, lang_code INTEGER NOT NULL,
+                                   item_order INTEGER NOT NULL DEFAULT 0, UNIQUE(book, lang_code));
+CREATE TABLE comments (id INTEGER PRIMARY KEY, book INTEGER NOT NULL, text TEXT NOT NULL COLLATE NOCASE,
+                       UNIQUE(book));
+CREATE TABLE data (id INTEGER PRIMARY KEY, book INTEGER NOT NULL, format TEXT NOT NULL COLLATE NOCASE,
+                   uncompressed_size INTEGER NOT NULL, name TEXT NOT NULL, UNIQUE(book, format));
+CREATE TABLE identifiers (id INTEGER PRIMARY KEY, book INTEGER NOT NULL, type TEXT NOT NULL DEFAULT 'isbn' COLLATE NOCASE,
+                          val TEXT NOT NULL COLLATE NOCASE, UNIQUE(book, type));
+CREATE TABLE custom_columns (id INTEGER PRIMARY KEY AUTOINCREMENT, label TEXT NOT NULL, name TEXT NOT NULL,
+                             datatype TEXT NOT NULL, mark_for_delete BOOL DEFAULT 0 NOT NULL,
+                             editable BOOL DEFAULT 1 NOT NULL, display TEXT DEFAULT '{}' NOT NULL,
+                             is_multiple BOOL DEFAULT 0 NOT NULL, normalized BOOL NOT NULL, UNIQUE(label));
+CREATE TABLE library_id (id INTEGER PRIMARY KEY, uuid TEXT NOT NULL, UNIQUE(uuid));
+CREATE TABLE metadata_dirtied (id INTEGER PRIMARY KEY, book INTEGER NOT NULL, UNIQUE(book));
+CREATE INDEX authors_idx ON books (author_sort COLLATE NOCASE);
+CREATE INDEX books_idx ON books (sort COLLATE NOCASE);
+CREATE INDEX books_authors_link_aidx ON books_authors_link (author);
+CREATE INDEX books_authors_link_bidx ON books_authors_link (book);
+CREATE INDEX books_tags_link_aidx ON books_tags_link (tag);
+CREATE INDEX books_tags_link_bidx ON books_tags_link (book);
+CREATE INDEX books_series_link_aidx ON books_series_link (series);
+CREATE INDEX books_series_link_bidx ON books_series_link (book);
+CREATE INDEX books_ratings_link_aidx ON books_ratings_link (rating);
+CREATE INDEX books_ratings_link_bidx ON books_ratings_link (book);
+CREATE INDEX books_publishers_link_aidx ON books_publishers_link (publisher);
+CREATE INDEX books_publishers_link_bidx ON books_publishers_link (book);
+CREATE INDEX books_languages_link_aidx ON books_languages_link (lang_code);
+CREATE INDEX books_languages_link_bidx ON books_languages_link (book);
+CREATE INDEX comments_idx ON comments (book);
+CREATE INDEX data_idx ON data (book);
+CREATE INDEX formats_idx ON data (format);
+CREATE INDEX series_idx ON series (name COLLATE NOCASE);
+CREATE INDEX tags_idx ON tags (name COLLATE NOCASE);
+CREATE INDEX publishers_idx ON publishers (name COLLATE NOCASE);
+"""
+
+# label, name, datatype, is_multiple, normalized, display
+CUSTOM_COLUMNS = (
+    ("genre", "Genre", "text", True, True, {"is_names": False, "description": ""}),
+    ("read", "Read", "bool", False, False, {"description": ""}),
+    ("pages", "Pages", "int", False, False, {"number_format": None, "description": ""}),
+    ("myrating", "My Rating", "rating", False, True, {"allow_half_stars": False, "description": ""}),
+    ("finished", "Finished", "datetime", False, False, {"date_format": None, "description": ""}),
+)
+
+FIRST_NAMES = ("James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William", "Elizabeth",
+               "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+               "Ana", "Pablo", "Lucía", "Jörg", "Søren", "Amélie", "François", "Giulia", "Marco", "Yuki",
+               "Haruki", "Olga", "Ivan", "Chloé", "Mateo", "Sofia", "Lars", "Ingrid", "Kofi", "Amara",
+               "Wei", "Mei", "Arjun", "Priya", "Omar", "Leila", "Nikos", "Eleni", "Tomasz", "Zofia")
+LAST_NAMES = ("Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+              "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+              "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson",
+              "Müller", "Schmidt", "Dubois", "Rossi", "Tanaka", "Ivanov", "Nowak", "Jensen", "Andersson", "Silva",
+              "O'Brien", "Van der Berg", "Kowalski", "Papadopoulos", "Nakamura", "Chen", "Wang", "Kumar", "Haddad",
+              "Mensah", "Fischer", "Weber", "Moreau", "Ricci", "Novak", "Horvath", "Yilmaz", "Costa", "Lindqvist",
+              "Okafor")
+WORDS = ("shadow", "river", "night", "garden", "empire", "silence", "winter", "secret", "stone", "city", "light",
+         "ocean", "memory", "storm", "crown", "forest", "dream", "fire", "glass", "journey", "kingdom", "letter",
+         "mountain", "house", "war", "star", "daughter", "king", "island", "machine", "season", "song", "blood",
+         "bridge", "clock", "desert", "engine", "harbor", "hunter", "iron", "lantern", "map", "mirror", "orchard",
+         "promise", "queen", "road", "salt", "thief", "tower", "valley", "voice", "wind", "wolf", "year", "zero")
+LOREM = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do", "eiusmod",
+         "tempor", "incididunt", "ut", "labore", "et", "dolore", "magna", "aliqua", "enim", "ad", "minim", "veniam",
+         "quis", "nostrud", "exercitation", "ullamco", "laboris", "nisi", "aliquip", "ex", "ea", "commodo",
+         "consequat", "duis", "aute", "irure", "in", "reprehenderit", "voluptate", "velit", "esse", "cillum",
+         "fugiat", "nulla", "pariatur", "excepteur", "sint", "occaecat", "cupidatat", "non", "proident", "sunt",
+         "culpa", "qui", "officia", "deserunt", "mollit", "anim", "id", "est", "laborum")
+GENRES = ("Fiction", "Fantasy", "Science Fiction", "Mystery", "Thriller", "Romance", "Horror", "History",
+          "Biography", "Philosophy", "Poetry", "Travel", "Cooking", "Science", "Mathematics", "Computers",
+          "Economics", "Politics", "Religion", "Art", "Music", "Children", "Young Adult", "Comics", "Drama",
+          "Classics", "Adventure", "Crime", "Health", "Psychology", "Sports", "Nature", "Law", "Education",
+          "Languages", "Essays", "Humor", "War", "Westerns", "Short Stories")
+QUALIFIERS = ("", "Modern", "Historical", "Contemporary", "Epic", "Dark", "Literary", "Military", "Urban",
+              "Medieval")
+PUBLISHER_WORDS = ("Penguin", "Harbor", "Orbit", "Northern", "Silver", "Atlas", "Beacon", "Crescent", "Granite",
+                   "Meridian", "Pioneer", "Quill", "Riverside", "Summit", "Tidewater", "Vanguard")
+PUBLISHER_SUFFIXES = ("Books", "Press", "Publishing", "House", "Editions", "& Sons")
+# language codes with their relative frequency
+LANGUAGES = (("eng", 60), ("spa", 10), ("deu", 8), ("fra", 7), ("ita", 4), ("jpn", 3), ("rus", 3), ("por", 2),
+             ("nld", 2), ("pol", 1))
+# format, probability of a book having it, relative size
+FORMATS = (("EPUB", 0.85, 1), ("PDF", 0.3, 4), ("MOBI", 0.15, 1), ("AZW3", 0.1, 1), ("CBZ", 0.03, 20))
+
+GENERIC_COVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "cps", "static", "generic_cover.jpg")
+
+
+def _skewed(rng, count, exponent=2):
+    """Returns an index below count, small indices are much more likely than large ones"""
+    return int(count * rng.random() ** exponent)
+
+
+def _safe_filename(value):
+    return re.sub(r'[^\w\- ]', '_', value).strip()[:60] or "Unknown"
+
+
+def _title_sort(title):
+    match = re.match(r'^(The|A|An)\s+(.*)$', title)
+    return "{}, {}".format(match.group(2), match.group(1)) if match else title
+
+
+def _author_names(rng, count):
+    names = list()
+    for index in range(count):
+        first = FIRST_NAMES[index % len(FIRST_NAMES)]
+        last = LAST_NAMES[(index // len(FIRST_NAMES)) % len(LAST_NAMES)]
+        middle = index // (len(FIRST_NAMES) * len(LAST_NAMES))
+        if middle:
+            first = "{} {}.".format(first, chr(ord("A") + (middle - 1) % 26))
+            if middle > 26:
+                last = "{} {}".format(last, (middle - 1) // 26 + 1)
+        names.append((first + " " + last, last + ", " + first))
+    rng.shuffle(names)
+    return names
+
+
+def _phrase(rng, words, minimum, maximum):
+    return " ".join(rng.choice(words) for __ in range(rng.randint(minimum, maximum)))
+
+
+def _comment(rng):
+    paragraphs = list()
+    for __ in range(rng.randint(1, 4)):
+        sentences = (_phrase(rng, LOREM, 6, 18).capitalize() + "." for __ in range(rng.randint(2, 6)))
+        paragraphs.append("<p>" + " ".join(sentences) + "</p>")
+    return "".join(paragraphs)
+
+
+def _isbn(rng):
+    digits = [9, 7, 8] + [rng.randint(0, 9) for __ in range(9)]
+    checksum = (10 - sum(digit * (1 if index % 2 == 0 else 3) for index, digit in enumerate(digits)) % 10) % 10
+    return "".join(str(digit) for digit in digits + [checksum])
+
+
+def _write_cover(library_path, book_path):
+    directory = os.path.join(library_path, book_path)
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, "cover.jpg")
+    if os.path.exists(target):
+        return
+    # hard links keep the size of large libraries small while every book still has its own file
+    try:
+        os.link(GENERIC_COVER, target)
+    except OSError:
+        shutil.copyfile(GENERIC_COVER, target)
+
+
+def _create_custom_columns(cursor):
+    column_ids = dict()
+    for label, name, datatype, is_multiple, normalized, display in CUSTOM_COLUMNS:
+        cursor.execute("INSERT INTO custom_columns (label, name, datatype, is_multiple, normalized, display) "
+                       "VALUES (?, ?, ?, ?, ?, ?)", (label, name, datatype, is_multiple, normalized,
+                                                     json.dumps(display)))
+        column_id = cursor.lastrowid
+        column_ids[label] = column_id
+        value_type = {"text": "TEXT NOT NULL COLLATE NOCASE", "bool": "BOOL NOT NULL", "int": "INT NOT NULL",
+                      "rating": "INT NOT NULL", "datetime": "timestamp NOT NULL"}[datatype]
+        if normalized:
+            cursor.execute("CREATE TABLE custom_column_{0} (id INTEGER PRIMARY KEY AUTOINCREMENT, value {1}, "
+                           "link TEXT NOT NULL DEFAULT '', UNIQUE(value))".format(column_id, value_type))
+            cursor.execute("CREATE TABLE books_custom_column_{0}_link (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                           "book INTEGER NOT NULL, value INTEGER NOT NULL, UNIQUE(book, value))"
+                           .format(column_id))
+            cursor.execute("CREATE INDEX books_custom_column_{0}_link_aidx ON books_custom_column_{0}_link (value)"
+                           .format(column_id))
+            cursor.execute("CREATE INDEX books_custom_column_{0}_link_bidx ON books_custom_column_{0}_link (book)"
+                           .format(column_id))
+        else:
+            cursor.execute("CREATE TABLE custom_column_{0} (id INTEGER PRIMARY KEY AUTOINCREMENT, book INTEGER, "
+                           "value {1}, UNIQUE(book))".format(column_id, value_type))
+    return column_ids
+
+
+def _is_current(path, settings):
+    try:
+        with open(os.path.join(path, "library.json")) as f:
+            return json.load(f) == settings
+    except (OSError, ValueError):
+        return False
+
+
+def generate_library(path, books, seed=0, covers=True, force=False):
+    """Creates a Calibre library with the given number of books in path
+
+    An existing library generated with the same parameters is reused unless force is set, returns the path to the
+    metadata.db
+    """
+    settings = {"version": GENERATOR_VERSION, "books": books, "seed": seed, "covers": covers}
+    dbpath = os.path.join(path, "metadata.db")
+    if not force and os.path.exists(dbpath) and _is_current(path, settings):
+        return dbpath
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    rng = random.Random(seed)
+    connection = sqlite3.connect(dbpath)
+    cursor = connection.cursor()
+    cursor.executescript(SCHEMA)
+    cursor.execute("INSERT INTO library_id (uuid) VALUES (?)", (str(uuid.UUID(int=rng.getrandbits(128), version=4)),))
+    column_ids = _create_custom_columns(cursor)
+
+    authors = _author_names(rng, max(50, books // 8))
+    cursor.executemany("INSERT INTO authors (id, name, sort) VALUES (?, ?, ?)",
+                       ((index + 1, name, sort) for index, (name, sort) in enumerate(authors)))
+    tags = [(qualifier + " " + genre).strip() for genre in GENRES for qualifier in QUALIFIERS]
+    rng.shuffle(tags)
+    cursor.executemany("INSERT INTO tags (id, name) VALUES (?, ?)",
+                       ((index + 1, name) for index, name in enumerate(tags)))
+    series_count = max(10, books // 20)
+    series = ["{} {}".format(" ".join(word.capitalize() for word in (rng.choice(WORDS), rng.choice(WORDS))),
+                             "Saga" if index % 3 else "Chronicles") + ("" if index < 1000 else " " + str(index))
+              for index in range(series_count)]
+    series = list(dict.fromkeys(series))
+    cursor.executemany("INSERT INTO series (id, name, sort) VALUES (?, ?, ?)",
+                       ((index + 1, name, _title_sort(name)) for index, name in enumerate(series)))
+    publishers = list(dict.fromkeys("{} {}".format(word, suffix) for word in PUBLISHER_WORDS
+                                    for suffix in PUBLISHER_SUFFIXES))
+    cursor.executemany("INSERT INTO publishers (id, name, sort) VALUES (?, ?, ?)",
+                       ((index + 1, name, name) for index, name in enumerate(publishers)))
+    cursor.executemany("INSERT INTO ratings (id, rating) VALUES (?, ?)", ((value + 1, value) for value in range(11)))
+    language_codes = [code for code, __ in LANGUAGES]
+    language_weights = [weight for __, weight in LANGUAGES]
+    cursor.executemany("INSERT INTO languages (id, lang_code) VALUES (?, ?)",
+                       ((index + 1, code) for index, code in enumerate(language_codes)))
+    genres = list(GENRES)
+    cursor.executemany("INSERT INTO custom_column_{} (id, value) VALUES (?, ?)".format(column_ids["genre"]),
+                       ((index + 1, name) for index, name in enumerate(genres)))
+    cursor.executemany("INSERT INTO custom_column_{} (id, value) VALUES (?, ?)".format(column_ids["myrating"]),
+                       ((value + 1, value * 2) for value in range(6)))
+
+    series_position = dict()
+    start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    added_range = int(timedelta(days=10 * 365).total_seconds())
+    rows = dict()
+    for book_id in range(1, books + 1):
+        title = " ".join(word.capitalize() for word in (["The"] if rng.random() < 0.3 else [])
+                         + _phrase(rng, WORDS, 1, 4).split())
+        book_authors = list(dict.fromkeys(_skewed(rng, len(authors), 1.5) + 1
+                                          for __ in range(1 if rng.random() < 0.85 else rng.randint(2, 3))))
+        author_name, author_sort = authors[book_authors[0] - 1]
+        book_path = "{}/{} ({})".format(_safe_filename(author_name), _safe_filename(title), book_id)
+        added = start + timedelta(seconds=rng.randrange(added_range))
+        modified = added + timedelta(seconds=rng.randrange(90 * 24 * 3600))
+        pubdate = (DEFAULT_PUBDATE if rng.random() < 0.1 else
+                   datetime(rng.randint(1850, 2025), rng.randint(1, 12), rng.randint(1, 28),
+                            tzinfo=timezone.utc).strftime(CALIBRE_DATE_FORMAT))
+        has_cover = covers and rng.random() < 0.9
+        book_series = _skewed(rng, len(series), 1.5) + 1 if rng.random() < 0.35 else None
+        series_index = 1.0
+        if book_series:
+            series_index = series_position[book_series] = series_position.get(book_series, 0.0) + 1.0
+        book_uuid = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        rows.setdefault("books", []).append((book_id, title, _title_sort(title), added.strftime(CALIBRE_DATE_FORMAT),
+                                             pubdate, series_index, author_sort, book_path, book_uuid,
+                                             has_cover, modified.strftime(CALIBRE_DATE_FORMAT)))
+        rows.setdefault("books_authors_link", []).extend((book_id, author) for author in book_authors)
+        book_tags = {_skewed(rng, len(tags)) + 1 for __ in range(rng.randint(0, 6))}
+        rows.setdefault("books_tags_link", []).extend((book_id, tag) for tag in book_tags)
+        if book_series:
+            rows.setdefault("books_series_link", []).append((book_id, book_series))
+        if rng.random() < 0.6:
+            rows.setdefault("books_ratings_link", []).append((book_id, rng.randint(1, 10) + 1))
+        if rng.random() < 0.8:
+            rows.setdefault("books_publishers_link", []).append((book_id, _skewed(rng, len(publishers)) + 1))
+        language = rng.choices(range(len(language_codes)), language_weights)[0] + 1
+        rows.setdefault("books_languages_link", []).append((book_id, language))
+        if rng.random() < 0.9:
+            rows.setdefault("comments", []).append((book_id, _comment(rng)))
+        book_formats = [(name, size) for name, probability, size in FORMATS if rng.random() < probability] \
+            or [(FORMATS[0][0], FORMATS[0][2])]
+        file_name = _safe_filename("{} - {}".format(title, author_name))
+        rows.setdefault("data", []).extend((book_id, name, rng.randint(200, 5000) * 1024 * size, file_name)
+                                           for name, size in book_formats)
+        if rng.random() < 0.7:
+            rows.setdefault("identifiers", []).append((book_id, "isbn", _isbn(rng)))
+        if rng.random() < 0.2:
+            rows.setdefault("identifiers", []).append((book_id, "amazon", "B0" + "".join(
+                rng.choice("ABCDEFGHJKLMNPQRSTUVWXYZ0123456789") for __ in range(8))))
+        if rng.random() < 0.5:
+            rows.setdefault("genre", []).extend((book_id, genre) for genre in
+                                                {_skewed(rng, len(genres)) + 1 for __ in range(rng.randint(1, 3))})
+        if rng.random() < 0.4:
+            rows.setdefault("read", []).append((book_id, rng.random() < 0.6))
+        if rng.random() < 0.7:
+            rows.setdefault("pages", []).append((book_id, rng.randint(40, 1200)))
+        if rng.random() < 0.2:
+            rows.setdefault("myrating", []).append((book_id, rng.randint(1, 6)))
+        if rng.random() < 0.15:
+            rows.setdefault("finished", []).append(
+                (book_id, (modified + timedelta(days=rng.randint(1, 400))).strftime(CALIBRE_DATE_FORMAT)))
+        if has_cover:
+            _write_cover(path, book_path)
+        if book_id % CHUNK_SIZE == 0 or book_id == books:
+            _write_rows(cursor, rows, column_ids)
+            connection.commit()
+            rows = dict()
+    connection.close()
+    with open(os.path.join(path, "library.json"), "w") as f:
+        json.dump(settings, f)
+    return dbpath
+
+
+def _write_rows(cursor, rows, column_ids):
+    statements = {
+        "books": "INSERT INTO books (id, title, sort, timestamp, pubdate, series_index, author_sort, path, uuid, "
+                 "has_cover, last_modified) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        "books_authors_link": "INSERT INTO books_authors_link (book, author) VALUES (?, ?)",
+        "books_tags_link": "INSERT INTO books_tags_link (book, tag) VALUES (?, ?)",
+        "books_series_link": "INSERT INTO books_series_link (book, series) VALUES (?, ?)",
+        "books_ratings_link": "INSERT INTO books_ratings_link (book, rating) VALUES (?, ?)",
+        "books_publishers_link": "INSERT INTO books_publishers_link (book, publisher) VALUES (?, ?)",
+        "books_languages_link": "INSERT INTO books_languages_link (book, lang_code) VALUES (?, ?)",
+        "comments": "INSERT INTO comments (book, text) VALUES (?, ?)",
+        "data": "INSERT INTO data (book, format, uncompressed_size, name) VALUES (?, ?, ?, ?)",
+        "identifiers": "INSERT INTO identifiers (book, type, val) VALUES (?, ?, ?)",
+    }
+    for label, __, __, __, normalized, __ in CUSTOM_COLUMNS:
+        if normalized:
+            statements[label] = "INSERT INTO books_custom_column_{}_link (book, value) VALUES (?, ?)" \
+                .format(column_ids[label])
+        else:
+            statements[label] = "INSERT INTO custom_column_{} (book, value) VALUES (?, ?)".format(column_ids[label])
+    for table, values in rows.items():
+        cursor.executemany(statements[table], values)
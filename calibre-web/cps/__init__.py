@@ -36,9 +36,11 @@ from .reverseproxy import ReverseProxied
 from .server import WebServer
 from .dep_check import dependency_check
 from .updater import Updater
+from .profiler import SQLProfiler
 from . import config_sql
 from . import cache_buster
 from . import ub, db
+from . import metrics
 
 try:
     from flask_limiter import Limiter
@@ -111,6 +113,8 @@ web_server = WebServer()
 
 updater_thread = Updater()
 
+sql_profiler = SQLProfiler()
+
 if limiter_present:
     limiter = Limiter(key_func=True, headers_enabled=True, auto_check=False, swallow_errors=False)
 else:
@@ -187,6 +191,8 @@ def create_app():
     app.secret_key = os.getenv('SECRET_KEY', config_sql.get_flask_session_key(ub.session))
 
     web_server.init_app(app, config)
+    sql_profiler.init_app(app, config)
+    metrics.init_app(app)
     from .cw_babel import babel, get_locale
     if hasattr(babel, "localeselector"):
         babel.init_app(app)
@@ -223,7 +229,10 @@ def create_app():
         limiter.init_app(app)
 
     # Register scheduled tasks
-    from .schedule import register_scheduled_tasks, register_startup_tasks
+    from .schedule import register_scheduled_tasks, register_startup_tasks, configure_task_lanes, \
+        resume_journaled_tasks
+    configure_task_lanes()
+    resume_journaled_tasks()
     register_scheduled_tasks(config.schedule_reconnect)
     register_startup_tasks()
 
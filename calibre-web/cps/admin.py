@@ -43,9 +43,9 @@ from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy.exc import IntegrityError, OperationalError, InvalidRequestError, ArgumentError
 from sqlalchemy.sql.expression import func, or_, text
 
-from . import constants, logger, helper, services, cli_param, converter
+from . import constants, logger, helper, services, cli_param, converter, metrics
 from . import db, calibre_db, ub, web_server, config, updater_thread, gdriveutils, \
-    kobo_sync_status, schedule
+    kobo_sync_status, schedule, sql_profiler
 try:
     from . import admin_stats
     stats_available = True
@@ -56,8 +56,8 @@ from .helper import check_valid_domain, send_test_mail, reset_password, generate
 from .embed_helper import get_calibre_binarypath
 from .gdriveutils import is_gdrive_ready, gdrive_support
 from .render_template import render_title_template, get_sidebar_config
-from .services.worker import WorkerThread
-from .usermanagement import user_login_required
+from .services.worker import WorkerThread, DEFAULT_LANE_CONCURRENCY, MAX_LANE_CONCURRENCY
+from .usermanagement import user_login_required, requires_basic_auth_if_no_ano, auth
 from .cw_babel import get_available_translations, get_available_locale, get_user_locale_language
 from . import debug_info
 from .string_helper import strip_whitespaces
@@ -1287,6 +1287,7 @@ def _configuration_gdrive_helper(to_save):
     config.config_use_google_drive = new_gdrive_value
     if _config_string(to_save, "config_google_drive_folder"):
         gdriveutils.deleteDatabaseOnChange()
+    _config_int(to_save, "config_google_drive_cache_size")
     return gdrive_error
 
 
@@ -1325,6 +1326,8 @@ def _configuration_logfile_helper(to_save):
     if not logger.is_valid_logfile(config.config_access_logfile):
         return reboot_required, \
                _configuration_result(_('Access Logfile Location is not Valid, Please Enter Correct Path'))
+    _config_checkbox(to_save, "config_query_profiler")
+    _config_checkbox(to_save, "config_server_timing")
     return reboot_required, None
 
 
@@ -1515,6 +1518,8 @@ def edit_scheduledtasks():
                                  config=content,
                                  starttime=time_field,
                                  duration=duration_field,
+                                 lanes=DEFAULT_LANE_CONCURRENCY,
+                                 max_lane_concurrency=MAX_LANE_CONCURRENCY,
                                  title=_("Edit Scheduled Tasks Settings"))
 
 
@@ -1537,7 +1542,21 @@ def update_scheduledtasks():
     _config_checkbox(to_save, "schedule_generate_book_covers")
     _config_checkbox(to_save, "schedule_generate_series_covers")
     _config_checkbox(to_save, "schedule_metadata_backup")
+    _config_checkbox(to_save, "schedule_warm_export_cache")
+    _config_checkbox(to_save, "schedule_enrich_metadata")
+    _config_checkbox(to_save, "schedule_enrich_metadata_apply")
     _config_checkbox(to_save, "schedule_reconnect")
+    for lane in DEFAULT_LANE_CONCURRENCY:
+        field = "schedule_lane_" + lane
+        try:
+            valid = 1 <= int(to_save.get(field, 1)) <= MAX_LANE_CONCURRENCY
+        except ValueError:
+            valid = False
+        if valid:
+            _config_int(to_save, field)
+        else:
+            flash(_("Invalid number of parallel tasks specified"), category="error")
+            error = True
 
     if not error:
         try:
@@ -1549,6 +1568,7 @@ def update_scheduledtasks():
 
             # Re-register tasks with new settings
             schedule.register_scheduled_tasks(config.schedule_reconnect)
+            schedule.configure_task_lanes()
         except IntegrityError:
             ub.session.rollback()
             log.error("An unknown error occurred while saving scheduled tasks settings")
@@ -1622,6 +1642,35 @@ def view_logfile():
                                  page="logfile")
 
 
+@admi.route("/metrics")
+@requires_basic_auth_if_no_ano
+def export_metrics():
+    if not auth.current_user().role_admin():
+        abort(403)
+    response = make_response(metrics.export())
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
+
+
+@admi.route("/admin/queries")
+@user_login_required
+@admin_required
+def view_queries():
+    return render_title_template("query_inspector.html",
+                                 title=_("Database Queries"),
+                                 profiler_enable=sql_profiler.enabled,
+                                 summary=sql_profiler.summary(),
+                                 page="queries")
+
+
+@admi.route("/admin/queries/clear", methods=["POST"])
+@user_login_required
+@admin_required
+def clear_queries():
+    sql_profiler.clear()
+    return redirect(url_for('admin.view_queries'))
+
+
 @admi.route("/ajax/log/<int:logtype>")
 @user_login_required
 @admin_required
@@ -1888,6 +1937,7 @@ def _db_configuration_update_helper():
         if db_change:
             log.info("Calibre Database changed, all Calibre-Web info related to old Database gets deleted")
             ub.session.query(ub.Downloads).delete()
+            ub.session.query(ub.BookDownloadCount).delete()
             ub.session.query(ub.ArchivedBook).delete()
             ub.session.query(ub.ReadBook).delete()
             ub.session.query(ub.BookShelf).delete()
@@ -1932,6 +1982,7 @@ def _configuration_update_helper():
         _config_checkbox_int(to_save, "config_uploading")
         _config_checkbox_int(to_save, "config_unicode_filename")
         _config_checkbox_int(to_save, "config_embed_metadata")
+        _config_int(to_save, "config_export_cache_size")
         # Reboot on config_anonbrowse with enabled ldap, as decoraters are changed in this case
         reboot_required |= (_config_checkbox_int(to_save, "config_anonbrowse")
                             and config.config_login_type == constants.LOGIN_LDAP)
@@ -2174,7 +2225,7 @@ def _delete_user(content):
             # Delete all books in shelfs belonging to user, all shelfs of user, downloadstat of user, read status
             # and user itself
             ub.session.query(ub.ReadBook).filter(content.id == ub.ReadBook.user_id).delete()
-            ub.session.query(ub.Downloads).filter(content.id == ub.Downloads.user_id).delete()
+            ub.delete_user_downloads(content.id)
             for us in ub.session.query(ub.Shelf).filter(content.id == ub.Shelf.user_id):
                 ub.session.query(ub.BookShelf).filter(us.id == ub.BookShelf.shelf).delete()
             ub.session.query(ub.Shelf).filter(content.id == ub.Shelf.user_id).delete()
@@ -2189,6 +2240,8 @@ def _delete_user(content):
             for kobo_entry in kobo_entries:
                 ub.session.delete(kobo_entry)
             ub.session_commit()
+            ub.invalidate_user_sessions(content.id)
+            ub.invalidate_shelves()
             log.info("User {} deleted".format(content.name))
             return _("User '%(nick)s' deleted", nick=content.name)
         else:
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Single pages of comic archives for the comic reader
+
+The sorted page list of an archive is parsed once per file version, pages of zip and tar archives are read directly
+from their offset in the file afterwards
+"""
+
+import tarfile
+import threading
+import zipfile
+from collections import namedtuple
+
+from . import config, logger
+from .constants import CACHE_TYPE_COMIC_PREVIEWS
+from .disk_cache import DiskCache
+from .library_cache import LibraryCache
+from .zip_index import file_key, read_entry, zip_entry
+
+try:
+    from natsort import natsorted as sort
+except ImportError:
+    sort = sorted  # Just use regular sort then, may cause issues with badly named pages in cbz/cbr files
+
+try:
+    import rarfile
+    use_rarfile = True
+except (ImportError, SyntaxError):
+    use_rarfile = False
+
+log = logger.create()
+
+PAGE_MIMETYPES = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+    'svg': 'image/svg+xml',
+}
+# pages the reader loads ahead of the current one
+PREFETCH_PAGES = 3
+PREVIEW_HEIGHT = 300
+# the pages of one version of an archive never change
+PAGE_MAX_AGE = 86400
+PREVIEW_CACHE_SIZE = 256
+
+# entry is the zip_index.ZipEntry of pages in zip archives, offset is None for tar pages which have to be read through
+# the tar library
+Page = namedtuple('Page', 'name, mimetype, offset, size, entry')
+
+comic_indexes = LibraryCache(64, name="comic_indexes")
+preview_cache = DiskCache(CACHE_TYPE_COMIC_PREVIEWS, lambda: PREVIEW_CACHE_SIZE, "comic_previews")
+# keys of the archives whose previews are generated right now, waiting tasks are deduplicated by the worker
+previews_running = set()
+previews_lock = threading.Lock()
+
+
+class ComicIndex:
+    def __init__(self, path, archive_type, key, pages):
+        self.path = path
+        self.archive_type = archive_type
+        # changes with the file, used for etags and preview names
+        self.key = key
+        self.pages = pages
+        # numbers of pages which couldn't be turned into a preview
+        self.failed_previews = set()
+
+    def read_page(self, number):
+        page = self.pages[number]
+        if self.archive_type == 'zip':
+            return read_entry(self.path, page.entry)
+        if self.archive_type == 'tar':
+            if page.offset is not None:
+                with open(self.path, 'rb') as f:
+                    f.seek(page.offset)
+                    return f.read(page.size)
+            with tarfile.open(self.path) as tf:
+                return tf.extractfile(page.name).read()
+        rarfile.UNRAR_TOOL = config.config_rarfile_location
+        with rarfile.RarFile(self.path) as rf:
+            return rf.read(page.name)
+
+    def preview_name(self, number):
+        return "{}_{}.jpg".format(self.key, number)
+
+    def previews_missing(self):
+        """Returns whether the previews have to be generated, pages are done in order and the last one tells"""
+        last = len(self.pages) - 1
+        with previews_lock:
+            if last < 0 or last in self.failed_previews or self.key in previews_running:
+                return False
+        return not preview_cache.contains(self.preview_name(last))
+
+    def start_previews(self):
+        """Marks the previews as being generated, returns False if they already are"""
+        with previews_lock:
+            if self.key in previews_running:
+                return False
+            previews_running.add(self.key)
+            return True
+
+    def end_previews(self):
+        with previews_lock:
+            previews_running.discard(self.key)
+
+
+def archive_type(book_format):
+    book_format = book_format.lower()
+    if book_format in ('cbz', 'zip'):
+        return 'zip'
+    if book_format in ('cbt', 'tar'):
+        return 'tar'
+    if book_format in ('cbr', 'rar') and use_rarfile and config.config_rarfile_location:
+        return 'rar'
+    return None
+
+
+def _page(name):
+    mimetype = PAGE_MIMETYPES.get(name.rpartition('.')[-1].lower())
+    # files of Apple devices with image extensions are no images
+    return mimetype if mimetype and '__MACOSX' not in name else None
+
+
+def _parse(path, archive):
+    pages = list()
+    if archive == 'zip':
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                mimetype = _page(info.filename)
+                if mimetype and not info.is_dir():
+                    pages.append(Page(info.filename, mimetype, info.header_offset, info.file_size, zip_entry(info)))
+    elif archive == 'tar':
+        try:
+            tf = tarfile.open(path, 'r:')
+            plain = True
+        except tarfile.ReadError:
+            tf = tarfile.open(path)
+            plain = False
+        with tf:
+            for info in tf.getmembers():
+                mimetype = _page(info.name)
+                if mimetype and info.isfile():
+                    pages.append(Page(info.name, mimetype, info.offset_data if plain else None, info.size, None))
+    else:
+        rarfile.UNRAR_TOOL = config.config_rarfile_location
+        with rarfile.RarFile(path) as rf:
+            for info in rf.infolist():
+                mimetype = _page(info.filename)
+                if mimetype and not info.is_dir():
+                    pages.append(Page(info.filename, mimetype, None, info.file_size, None))
+    by_name = {page.name: page for page in pages}
+    return [by_name[name] for name in sort(by_name)]
+
+
+def get_index(path, book_format):
+    """Returns the page index of a comic archive, None if the format can't be read on the server"""
+    archive = archive_type(book_format)
+    if not archive:
+        return None
+    key = file_key(path)
+    return comic_indexes.get(key, lambda: ComicIndex(path, archive, key, _parse(path, archive)))
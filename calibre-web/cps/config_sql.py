@@ -92,6 +92,8 @@ class _Settings(_Base):
     config_logfile = Column(String, default=logger.DEFAULT_LOG_FILE)
     config_access_log = Column(SmallInteger, default=0)
     config_access_logfile = Column(String, default=logger.DEFAULT_ACCESS_LOG)
+    config_query_profiler = Column(Boolean, default=False)
+    config_server_timing = Column(Boolean, default=False)
 
     config_uploading = Column(SmallInteger, default=0)
     config_anonbrowse = Column(SmallInteger, default=0)
@@ -114,6 +116,7 @@ class _Settings(_Base):
     config_use_google_drive = Column(Boolean, default=False)
     config_google_drive_folder = Column(String)
     config_google_drive_watch_changes_response = Column(JSON, default={})
+    config_google_drive_cache_size = Column(Integer, default=1024)
 
     config_use_goodreads = Column(Boolean, default=False)
     config_goodreads_api_key = Column(String)
@@ -162,6 +165,7 @@ class _Settings(_Base):
     config_upload_formats = Column(String, default=','.join(constants.EXTENSIONS_UPLOAD))
     config_unicode_filename = Column(Boolean, default=False)
     config_embed_metadata = Column(Boolean, default=True)
+    config_export_cache_size = Column(Integer, default=512)
 
     config_updatechannel = Column(Integer, default=constants.UPDATE_STABLE)
 
@@ -174,6 +178,14 @@ class _Settings(_Base):
     schedule_generate_series_covers = Column(Boolean, default=False)
     schedule_reconnect = Column(Boolean, default=False)
     schedule_metadata_backup = Column(Boolean, default=False)
+    schedule_warm_export_cache = Column(Boolean, default=False)
+    schedule_enrich_metadata = Column(Boolean, default=False)
+    schedule_enrich_metadata_apply = Column(Boolean, default=False)
+    schedule_lane_conversion = Column(Integer, default=1)
+    schedule_lane_mail = Column(Integer, default=2)
+    schedule_lane_thumbnails = Column(Integer, default=1)
+    schedule_lane_tts = Column(Integer, default=1)
+    schedule_lane_maintenance = Column(Integer, default=1)
 
     config_password_policy = Column(Boolean, default=True)
     config_password_min_length = Column(Integer, default=8)
@@ -310,6 +322,9 @@ class ConfigSQL(object):
     def get_scheduled_task_settings(self):
         return {k: v for k, v in self.__dict__.items() if k.startswith('schedule_')}
 
+    def get_task_lane_settings(self):
+        return {k[len('schedule_lane_'):]: v for k, v in self.__dict__.items() if k.startswith('schedule_lane_')}
+
     def set_from_dictionary(self, dictionary, field, convertor=None, default=None, encode=None):
         """Possibly updates a field of this object.
         The new value, if present, is grabbed from the given dictionary, and optionally passed through a convertor.
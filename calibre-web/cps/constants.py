@@ -184,6 +184,9 @@ NIGHTLY_VERSION[1] = '$Format:%cI$'
 
 # CACHE
 CACHE_TYPE_THUMBNAILS    = 'thumbnails'
+CACHE_TYPE_EXPORTS       = 'exports'
+CACHE_TYPE_GDRIVE        = 'gdrive'
+CACHE_TYPE_COMIC_PREVIEWS = 'comic_previews'
 
 # Thumbnail Types
 THUMBNAIL_TYPE_COVER     = 1
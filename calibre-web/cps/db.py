@@ -20,6 +20,9 @@
 import os
 import re
 import json
+import random
+import hashlib
+from array import array
 from datetime import datetime, timezone
 from urllib.parse import quote
 import unidecode
@@ -27,10 +30,10 @@ import unidecode
 from uuid import uuid4
 
 from sqlite3 import OperationalError as sqliteOperationalError
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy import Table, Column, ForeignKey, CheckConstraint
 from sqlalchemy import String, Integer, Boolean, TIMESTAMP, Float
-from sqlalchemy.orm import relationship, sessionmaker, scoped_session
+from sqlalchemy.orm import relationship, sessionmaker, scoped_session, selectinload, raiseload
 from sqlalchemy.orm.collections import InstrumentedList
 from sqlalchemy.ext.declarative import DeclarativeMeta
 from sqlalchemy.exc import OperationalError
@@ -40,7 +43,7 @@ try:
 except ImportError:
     from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.pool import StaticPool
-from sqlalchemy.sql.expression import and_, true, false, text, func, or_
+from sqlalchemy.sql.expression import and_, true, false, text, func, or_, case
 from sqlalchemy.ext.associationproxy import association_proxy
 from .cw_login import current_user
 from flask_babel import gettext as _
@@ -50,9 +53,27 @@ from flask import flash, g, Flask
 from . import logger, ub, isoLanguages
 from .pagination import Pagination
 from .string_helper import strip_whitespaces
+from .library_cache import LibraryCache
+from .typeahead import TypeaheadIndex
 
 log = logger.create()
 
+# ids of all books visible with the same common_filters, used to pick random books
+random_book_ids = LibraryCache(max_entries=32, name="random_books")
+# typeahead indexes of the names of authors, tags, series and publishers
+typeahead_indexes = LibraryCache(max_entries=8, name="typeahead")
+
+# rows fetched at once when streaming result sets
+STREAM_CHUNK_SIZE = 100
+
+# Relations of the books used by the templates of a view. They are loaded together with the books of a page, one
+# select per relation instead of one per book and relation. "custom_columns" stands for all custom columns
+LOAD_PROFILES = {
+    'list': ('authors', 'series', 'data', 'ratings'),
+    'table': ('authors', 'tags', 'series', 'languages', 'publishers', 'comments', 'custom_columns'),
+    'feed': ('authors', 'tags', 'series', 'data', 'ratings', 'languages', 'publishers', 'comments', 'custom_columns'),
+}
+
 cc_exceptions = ['composite', 'series']
 cc_classes = {}
 
@@ -543,6 +564,9 @@ class CalibreDB:
     config = None
     config_calibre_dir = None
     app_db_path = None
+    commit_count = 0
+    # raise on lazy loading relations missing in the load profile, used by tests and benchmarks
+    strict_loading = False
 
     def __init__(self, _app: Flask=None):  # , expire_on_commit=True, init=False):
         """ Initialize a new CalibreDB session
@@ -664,6 +688,26 @@ class CalibreDB:
             g.lib_sql = self.connect()
         return g.lib_sql
 
+    @classmethod
+    def _count_commit(cls, __):
+        cls.commit_count += 1
+
+    @classmethod
+    def library_generation(cls):
+        """Returns a value which changes whenever the library is changed by Calibre-Web or by calibre itself
+
+        Calibre-Web's own commits are counted, changes from outside are detected by the modification of metadata.db
+        """
+        dbpath = os.path.join(cls.config_calibre_dir or "", "metadata.db")
+        generation = [dbpath, cls.commit_count]
+        for path in (dbpath, dbpath + "-wal"):
+            try:
+                stat = os.stat(path)
+                generation.extend((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                generation.extend((0, 0))
+        return tuple(generation)
+
     @classmethod
     def update_config(cls, config, config_calibre_dir, app_db_path):
         cls.config = config
@@ -696,6 +740,7 @@ class CalibreDB:
                 connection.execute(text('PRAGMA cache_size = 10000;'))
                 connection.execute(text("attach database '{}' as calibre;".format(dbpath)))
                 connection.execute(text("attach database '{}' as app_settings;".format(app_db_path)))
+            event.listen(engine, "commit", cls._count_commit)
 
             conn = engine.connect()
             # conn.text_factory = lambda b: b.decode(errors = 'ignore') possible fix for #1302
@@ -763,6 +808,25 @@ class CalibreDB:
             self.session.rollback()
             log.error("Database error: {}".format(e))
 
+    def common_filters_signature(self, allow_show_archived=False, return_all_languages=False):
+        """Returns a hashable value, which is equal for all users seeing the same books with common_filters()"""
+        if not allow_show_archived:
+            archived_books = (ub.session.query(ub.ArchivedBook.book_id)
+                              .filter(ub.ArchivedBook.user_id == int(current_user.id))
+                              .filter(ub.ArchivedBook.is_archived == True)
+                              .order_by(ub.ArchivedBook.book_id)
+                              .all())
+            archived = hashlib.sha1(",".join(str(book.book_id) for book in archived_books).encode()).hexdigest()
+        else:
+            archived = None
+        language = "all" if return_all_languages else current_user.filter_language()
+        signature = (language, archived, tuple(current_user.list_denied_tags()),
+                     tuple(current_user.list_allowed_tags()))
+        if self.config.config_restricted_column:
+            signature += (self.config.config_restricted_column, current_user.allowed_column_value,
+                          current_user.denied_column_value)
+        return signature
+
     # Language and content filters for displaying in the UI
     def common_filters(self, allow_show_archived=False, return_all_languages=False):
         if not allow_show_archived:
@@ -846,27 +910,86 @@ class CalibreDB:
             outcome.reverse()
         return outcome[offset:offset + limit]
 
+    @staticmethod
+    def get_checkbox_sort_order(state, column, order=""):
+        """Returns the order_by clauses of get_checkbox_sorted, selected ids first in given order, then all others"""
+        order_by = [case({element: index for index, element in enumerate(state)}, value=column, else_=len(state)),
+                    column] if state else [column]
+        if order == "asc":
+            return [element.desc() for element in order_by]
+        return order_by
+
+    def load_options(self, load_profile):
+        """Returns the query options loading the relations of the books listed in LOAD_PROFILES[load_profile]"""
+        options = list()
+        for relation in LOAD_PROFILES.get(load_profile, ()):
+            if relation == 'custom_columns':
+                options.extend(selectinload(getattr(Books, 'custom_column_' + str(cc_id))) for cc_id in cc_classes
+                               if hasattr(Books, 'custom_column_' + str(cc_id)))
+            else:
+                options.append(selectinload(getattr(Books, relation)))
+        if load_profile and self.strict_loading:
+            options.append(raiseload('*'))
+        return options
+
     # Fill indexpage with all requested data from database
     def fill_indexpage(self, page, pagesize, database, db_filter, order,
-                       join_archive_read=False, config_read_column=0, *join):
+                       join_archive_read=False, config_read_column=0, *join, load_profile='list'):
         return self.fill_indexpage_with_archived_books(page, database, pagesize, db_filter, order, False,
-                                                       join_archive_read, config_read_column, *join)
+                                                       join_archive_read, config_read_column, *join,
+                                                       load_profile=load_profile)
 
     def fill_indexpage_with_archived_books(self, page, database, pagesize, db_filter, order, allow_show_archived,
-                                           join_archive_read, config_read_column, *join):
+                                           join_archive_read, config_read_column, *join, load_profile='list'):
         pagesize = pagesize or self.config.config_books_per_page
         if current_user.show_detail_random():
-            random_query = self.generate_linked_query(config_read_column, database)
-            randm = (random_query.filter(self.common_filters(allow_show_archived))
-                     .order_by(func.random())
-                     .limit(self.config.config_random_books).all())
+            randm = self.get_random_books(config_read_column, database, self.config.config_random_books,
+                                          allow_show_archived)
         else:
             randm = false()
+        query = self._indexpage_query(database, db_filter, allow_show_archived, join_archive_read, config_read_column,
+                                      *join)
+        if database is Books:
+            query = query.options(*self.load_options(load_profile))
+        off = int(int(pagesize) * (page - 1))
+        entries = list()
+        pagination = list()
+        try:
+            pagination = Pagination(page, pagesize, query.count())
+            entries = query.order_by(*order).offset(off).limit(pagesize).all()
+        except Exception as ex:
+            log.error_or_exception(ex)
+        # display authors in right order
+        entries = self.order_authors(entries, True, join_archive_read)
+        return entries, randm, pagination
+
+    def stream_indexpage(self, database, db_filter, order, join_archive_read=False, config_read_column=0, *join,
+                         load_profile='list'):
+        """Returns a generator yielding all entries of an index page without holding the complete result in memory
+
+        Entries are fetched in chunks of STREAM_CHUNK_SIZE and removed from the session after being consumed
+        """
+        query = self._indexpage_query(database, db_filter, False, join_archive_read, config_read_column, *join)
+        if database is Books:
+            query = query.options(*self.load_options(load_profile))
+        return self._stream_entries(query.order_by(*order), join_archive_read)
+
+    def _stream_entries(self, query, combined):
+        try:
+            for entry in query.yield_per(STREAM_CHUNK_SIZE):
+                # display authors in right order
+                self.order_authors([entry], True, combined)
+                yield entry
+                # ordering the authors changed the book, it would be kept by the session otherwise
+                self.session.expunge(entry.Books if combined else entry)
+        except Exception as ex:
+            log.error_or_exception(ex)
+
+    def _indexpage_query(self, database, db_filter, allow_show_archived, join_archive_read, config_read_column, *join):
         if join_archive_read:
             query = self.generate_linked_query(config_read_column, database)
         else:
             query = self.session.query(database)
-        off = int(int(pagesize) * (page - 1))
 
         indx = len(join)
         element = 0
@@ -883,34 +1006,41 @@ class CalibreDB:
                 query = query.outerjoin(join[element])
                 indx -= 1
                 element += 1
-        query = query.filter(db_filter)\
+        return query.filter(db_filter)\
             .filter(self.common_filters(allow_show_archived))
-        entries = list()
-        pagination = list()
-        try:
-            pagination = Pagination(page, pagesize, query.count())
-            entries = query.order_by(*order).offset(off).limit(pagesize).all()
-        except Exception as ex:
-            log.error_or_exception(ex)
-        # display authors in right order
-        entries = self.order_authors(entries, True, join_archive_read)
-        return entries, randm, pagination
+
+    def get_random_books(self, config_read_column, database, count, allow_show_archived=False):
+        """Returns up to count random visible books, without sorting the whole library by random()"""
+        key = (self.library_generation(), self.common_filters_signature(allow_show_archived))
+        book_ids = random_book_ids.get(key, lambda: array('l', (book.id for book in self.session.query(Books.id)
+                                                                .filter(self.common_filters(allow_show_archived)))))
+        picked_ids = [book_ids[i] for i in random.sample(range(len(book_ids)), min(count, len(book_ids)))]
+        if not picked_ids:
+            return list()
+        entries = (self.generate_linked_query(config_read_column, database)
+                   .options(*self.load_options('list'))
+                   .filter(Books.id.in_(picked_ids)).all())
+        random.shuffle(entries)
+        return entries
 
     # Orders all Authors in the list according to authors sort
     def order_authors(self, entries, list_return=False, combined=False):
         for entry in entries:
             if combined:
                 sort_authors = entry.Books.author_sort.split('&')
-                ids = [a.id for a in entry.Books.authors]
+                authors = entry.Books.authors
 
             else:
                 sort_authors = entry.author_sort.split('&')
-                ids = [a.id for a in entry.authors]
+                authors = entry.authors
+            ids = [a.id for a in authors]
             authors_ordered = list()
             # error = False
             for auth in sort_authors:
                 auth = strip_whitespaces(auth)
-                results = self.session.query(Authors).filter(Authors.sort == auth).all()
+                # the authors of the book are usually loaded already, the database is only asked for unknown names
+                results = [a for a in authors if a.sort == auth] \
+                    or self.session.query(Authors).filter(Authors.sort == auth).all()
                 # ToDo: How to handle not found author name
                 if not len(results):
                     book_id = entry.id if isinstance(entry, Books) else entry[0].id
@@ -922,8 +1052,7 @@ class CalibreDB:
                         authors_ordered.append(r)
                         ids.remove(r.id)
             for author_id in ids:
-                result = self.session.query(Authors).filter(Authors.id == author_id).first()
-                authors_ordered.append(result)
+                authors_ordered.extend(a for a in authors if a.id == author_id)
 
             if list_return:
                 if combined:
@@ -934,15 +1063,15 @@ class CalibreDB:
                 return authors_ordered
         return entries
 
-    def get_typeahead(self, database, query, replace=('', ''), tag_filter=true()):
-        query = query or ''
-        self.create_functions()
-        # self.session.connection().connection.connection.create_function("lower", 1, lcase)
-        entries = self.session.query(database).filter(tag_filter). \
-            filter(func.lower(database.name).ilike("%" + query + "%")).all()
-        # json_dumps = json.dumps([dict(name=escape(r.name.replace(*replace))) for r in entries])
-        json_dumps = json.dumps([dict(name=r.name.replace(*replace)) for r in entries])
-        return json_dumps
+    def get_typeahead(self, database, query, replace=('', ''), visible=None):
+        """Returns the best matching names of the table for the typeahead as json
+
+        visible is an optional predicate on the names, used to hide tags the user is not allowed to see
+        """
+        def load():
+            return TypeaheadIndex(name.replace(*replace) for (name,) in self.session.query(database.name))
+        index = typeahead_indexes.get((database.__tablename__, replace, self.library_generation()), load)
+        return json.dumps([dict(name=name) for name in index.search(query or '', visible=visible)])
 
     def check_exists_book(self, authr, title):
         self.create_functions()
@@ -1004,24 +1133,31 @@ class CalibreDB:
         return cc
 
     # read search results from calibre-database and return it (function is used for feed and simple search
-    def get_search_results(self, term, config, offset=None, order=None, limit=None, *join):
+    def get_search_results(self, term, config, offset=None, order=None, limit=None, *join, load_profile='list'):
         order = order[0] if order else [Books.sort]
         pagination = None
-        result = self.search_query(term, config, *join).order_by(*order).all()
-        result_count = len(result)
+        query = self.search_query(term, config, *join).order_by(*order)
+        # the ids of all hits are stored for navigating between them, only the requested page is loaded completely
+        result_ids = query.with_entities(Books.id).all()
+        result_count = len(result_ids)
+        query = query.options(*self.load_options(load_profile))
         if offset is not None and limit is not None:
             offset = int(offset)
-            limit_all = offset + int(limit)
             pagination = Pagination((offset / (int(limit)) + 1), limit, result_count)
-        else:
-            offset = 0
-            limit_all = result_count
+            query = query.offset(offset).limit(int(limit))
 
-        ub.store_combo_ids(result)
-        entries = self.order_authors(result[offset:limit_all], list_return=True, combined=True)
+        ub.store_ids(result_ids)
+        entries = self.order_authors(query.all(), list_return=True, combined=True)
 
         return entries, result_count, pagination
 
+    def stream_search_results(self, term, config, *join, load_profile='list'):
+        """Returns the number of hits and a generator yielding all of them in chunks like stream_indexpage"""
+        query = self.search_query(term, config, *join).order_by(Books.sort)
+        result_ids = query.with_entities(Books.id).all()
+        ub.store_ids(result_ids)
+        return len(result_ids), self._stream_entries(query.options(*self.load_options(load_profile)), True)
+
     # Creates for all stored languages a translated speaking name in the array for the UI
     def speaking_language(self, languages=None, return_all_languages=False, with_count=False, reverse_order=False):
 
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from uuid import uuid4
+
+from . import fs, logger, metrics
+from .library_cache import cache_hits, cache_misses, cache_entries
+
+log = logger.create()
+
+
+class KeyLock:
+    """Lets concurrent requests of the same key wait for the one producing the value"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = dict()
+
+    def __call__(self, key):
+        return _HeldKey(self, key)
+
+
+class _HeldKey:
+    def __init__(self, owner, key):
+        self.owner = owner
+        self.key = key
+
+    def __enter__(self):
+        with self.owner._lock:
+            lock, waiting = self.owner._locks.get(self.key, (None, 0))
+            lock = lock or threading.Lock()
+            self.owner._locks[self.key] = (lock, waiting + 1)
+        lock.acquire()
+
+    def __exit__(self, *__):
+        with self.owner._lock:
+            lock, waiting = self.owner._locks[self.key]
+            if waiting == 1:
+                del self.owner._locks[self.key]
+            else:
+                self.owner._locks[self.key] = (lock, waiting - 1)
+        lock.release()
+
+
+class DiskCache:
+    """Size bounded LRU of files in a folder of the cache directory
+
+    Hits update the modification time of the file, so the order of eviction survives a restart. The maximum size is
+    read from get_max_size on every store, 0 disables the cache
+    """
+
+    def __init__(self, cache_type, get_max_size, name):
+        self.cache_type = cache_type
+        self.get_max_size = get_max_size
+        self.name = name
+        self.cache = fs.FileSystem()
+        self.key_lock = KeyLock()
+        self._lock = threading.Lock()
+        self._entries = None
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        metrics.register_collector(self._collect_metrics)
+
+    @property
+    def max_size(self):
+        return max(0, self.get_max_size() or 0) * 1024 * 1024
+
+    def contains(self, filename):
+        with self._lock:
+            self._load()
+            return filename in self._entries
+
+    def lookup(self, filename):
+        """Returns the path of a cached file or None"""
+        with self._lock:
+            self._load()
+            if filename not in self._entries:
+                self.misses += 1
+                return None
+            path = self.cache.get_cache_file_path(filename, self.cache_type)
+            try:
+                os.utime(path)
+            except OSError:
+                # removed from outside
+                self._size -= self._entries.pop(filename)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(filename)
+            self.hits += 1
+            return path
+
+    def store(self, source, filename):
+        """Moves the file source into the cache and returns its new path"""
+        path = self.cache.get_cache_file_path(filename, self.cache_type)
+        # the temp folder may be located on another device, the file becomes visible under its name at once
+        partial = path + "." + uuid4().hex
+        shutil.move(source, partial)
+        os.replace(partial, path)
+        self._added(filename, os.path.getsize(path))
+        return path
+
+    def store_data(self, data, filename):
+        path = self.cache.get_cache_file_path(filename, self.cache_type)
+        partial = path + "." + uuid4().hex
+        with open(partial, "wb") as f:
+            f.write(data)
+        os.replace(partial, path)
+        self._added(filename, len(data))
+        return path
+
+    def clear(self):
+        with self._lock:
+            self.cache.delete_cache_dir(self.cache_type)
+            self._entries = None
+            self._size = 0
+
+    def _added(self, filename, size):
+        with self._lock:
+            self._load()
+            self._size += size - self._entries.get(filename, 0)
+            self._entries[filename] = size
+            self._entries.move_to_end(filename)
+            self._evict(keep=filename)
+
+    def _load(self):
+        # the files of former runs are indexed once, oldest first
+        if self._entries is not None:
+            return
+        files = list()
+        root = self.cache.get_cache_dir(self.cache_type)
+        for directory, __, names in os.walk(root):
+            for name in names:
+                try:
+                    stat = os.stat(os.path.join(directory, name))
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, name, stat.st_size))
+        files.sort()
+        self._entries = OrderedDict((name, size) for __, name, size in files)
+        self._size = sum(self._entries.values())
+
+    def _evict(self, keep):
+        while self._size > self.max_size and len(self._entries) > 1:
+            filename, size = next(iter(self._entries.items()))
+            if filename == keep:
+                break
+            del self._entries[filename]
+            self._size -= size
+            try:
+                self.cache.delete_cache_file(filename, self.cache_type)
+            except OSError:
+                # a download of the file may still be running on platforms which lock open files
+                pass
+
+    def _collect_metrics(self):
+        cache_hits.set(self.hits, self.name)
+        cache_misses.set(self.misses, self.name)
+        cache_entries.set(len(self._entries or ()), self.name)
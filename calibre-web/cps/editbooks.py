@@ -23,6 +23,7 @@
 import os
 from datetime import datetime, timezone
 import json
+from collections import namedtuple
 from shutil import copyfile
 
 from markupsafe import escape, Markup  # dependency of flask
@@ -34,8 +35,9 @@ from flask_babel import lazy_gettext as N_
 from flask_babel import get_locale
 from .cw_login import current_user
 from sqlalchemy.exc import OperationalError, IntegrityError, InterfaceError
+from sqlalchemy.orm import selectinload
 from sqlalchemy.orm.exc import StaleDataError
-from sqlalchemy.sql.expression import func
+from sqlalchemy.sql.expression import func, and_, exists
 
 from . import constants, logger, isoLanguages, gdriveutils, uploader, helper, kobo_sync_status
 from .clean_html import clean_string
@@ -244,6 +246,7 @@ def edit_selected_books():
     languages = d.get('languages')
     publishers = d.get('publishers')
     comments = d.get('comments')
+    dry_run = d.get('dry_run') is True
 
     if not (
       title or title_sort or authors or categories or series or languages or publishers or comments) or not selections:
@@ -255,56 +258,229 @@ def edit_selected_books():
         "checkT": d.get('checkT'),
     }
     res = list()
-    if title:
+    # title and author changes move the folders of the books, so they are applied and committed book by book
+    if title and not dry_run:
         vals['value'] = title
         out = edit_book_param('title', vals, True)
         if out[0].get('success') != True:
             res.extend(out)
-    if title_sort:
-        vals['value'] = title_sort
-        out = edit_book_param('sort', vals, True)
-        if out[0].get('success') != True:
-            res.extend(out)
-    if author_sort:
-        vals['value'] = author_sort
-        out = edit_book_param('author_sort', vals, True)
-        if out[0].get('success') != True:
-            res.extend(out)
-    if authors:
+    if authors and not dry_run:
         vals['value'] = authors
         out = edit_book_param('authors', vals, True)
         if out[0].get('success') != True:
             res.extend(out)
-    if categories:
-        vals['value'] = categories
-        out = edit_book_param('tags', vals, True)
-        if out[0].get('success') != True:
-            res.extend(out)
-    if series:
-        vals['value'] = series
-        out = edit_book_param('series', vals, True)
-        if out[0].get('success') != True:
-            res.extend(out)
-    if languages:
-        vals['value'] = languages
-        out = edit_book_param('languages', vals, True)
-        if out[0].get('success') != True:
-            res.extend(out)
-    if publishers:
-        vals['value'] = publishers
-        out = edit_book_param('publishers', vals, True)
-        if out[0].get('success') != True:
-            res.extend(out)
-    if comments:
-        vals['value'] = comments
-        out = edit_book_param('comments', vals, True)
-        if out[0].get('success') != True:
-            res.extend(out)
+    calibre_db.create_functions(config)
+    bulk = BulkEdit(calibre_db.session, selections, dry_run)
+    try:
+        if dry_run:
+            if title:
+                bulk.preview('title', lambda book: book.title, title)
+            if authors:
+                bulk.preview('authors', lambda book: ' & '.join(author.name.replace('|', ',')
+                                                               for author in book.authors),
+                             ' & '.join(strip_whitespaces(author) for author in authors.split('&')))
+        if title_sort:
+            bulk.set_column('sort', title_sort)
+        if author_sort:
+            bulk.set_column('author_sort', author_sort)
+        if categories:
+            bulk.set_links('tags', helper.uniq([strip_whitespaces(tag) for tag in categories.split(',')]))
+        if series:
+            bulk.set_links('series', [strip_whitespaces(series)])
+        if languages:
+            invalid = list()
+            lang_codes = isoLanguages.get_language_code_from_name(get_locale(), languages.split(','), invalid)
+            if invalid:
+                res.append({"success": False, "msg": _("'%(langname)s' is not a valid language",
+                                                        langname=', '.join(invalid))})
+            else:
+                bulk.set_links('languages', lang_codes)
+        if publishers:
+            bulk.set_links('publishers', [strip_whitespaces(publishers)])
+        if comments:
+            bulk.set_comments(comments)
+        bulk.commit()
+    except (OperationalError, IntegrityError, StaleDataError) as e:
+        calibre_db.session.rollback()
+        log.error_or_exception("Database error: {}".format(e))
+        res.append({"success": False, "msg": 'Database error: {}'.format(e.orig if hasattr(e, "orig") else e)})
+    if dry_run:
+        return jsonify({"changes": bulk.changes, "count": bulk.change_count, "errors": res})
     if len(res) == 0:
         return jsonify([{'success': True, "msg": _("Changes successfully applied")}])
     else:
         return jsonify(res)
 
+
+# books loaded and changed per statement, stays below the sqlite limit of bound variables
+BULK_CHUNK_SIZE = 500
+# changes listed in the preview of a bulk edit
+BULK_PREVIEW_LIMIT = 200
+
+# db_type is the type used by modify_database_object, key the attribute holding the name of the element
+BulkLink = namedtuple('BulkLink', 'db_object, link, column, relation, db_type, key')
+BULK_LINKS = {
+    'tags': BulkLink(db.Tags, db.books_tags_link, 'tag', 'tags', 'tags', 'name'),
+    'series': BulkLink(db.Series, db.books_series_link, 'series', 'series', 'series', 'name'),
+    'publishers': BulkLink(db.Publishers, db.books_publishers_link, 'publisher', 'publishers', 'publisher', 'name'),
+    'languages': BulkLink(db.Languages, db.books_languages_link, 'lang_code', 'languages', 'languages', 'lang_code'),
+}
+
+
+def _chunks(items, size=BULK_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class BulkEdit:
+    """Applies the same change to many books with one statement per chunk of books, committed in one transaction
+
+    Tags, series, publishers and languages are replaced by inserting and deleting rows of the link tables, the
+    elements no book links to afterwards are deleted like in modify_database_object. With dry_run nothing is
+    written, changes lists what would change
+    """
+
+    def __init__(self, session, book_ids, dry_run=False):
+        self.session = session
+        self.dry_run = dry_run
+        self.books = list()
+        for chunk in _chunks(list(dict.fromkeys(book_ids))):
+            self.books.extend(session.query(db.Books).filter(db.Books.id.in_(chunk))
+                              .options(selectinload(db.Books.authors), selectinload(db.Books.tags),
+                                       selectinload(db.Books.series), selectinload(db.Books.publishers),
+                                       selectinload(db.Books.languages), selectinload(db.Books.comments)).all())
+        self.modified = set()
+        self.changes = list()
+        self.change_count = 0
+
+    def _record(self, book, field, old, new):
+        self.modified.add(book.id)
+        self.change_count += 1
+        if len(self.changes) < BULK_PREVIEW_LIMIT:
+            self.changes.append({"id": book.id, "title": book.title, "field": field, "old": old, "new": new})
+
+    def preview(self, field, get_value, value):
+        for book in self.books:
+            if get_value(book) != value:
+                self._record(book, field, get_value(book), value)
+
+    def set_column(self, field, value):
+        changed = [book.id for book in self.books if getattr(book, field) != value]
+        self.preview(field, lambda book: getattr(book, field), value)
+        if not self.dry_run:
+            for chunk in _chunks(changed):
+                (self.session.query(db.Books).filter(db.Books.id.in_(chunk))
+                 .update({getattr(db.Books, field): value}, synchronize_session=False))
+
+    def set_comments(self, comments):
+        comments = clean_string(comments)
+        updates = list()
+        inserts = list()
+        for book in self.books:
+            old = book.comments[0].text if book.comments else ""
+            if old != comments:
+                self._record(book, 'comments', old, comments)
+                if book.comments:
+                    updates.append(book.id)
+                else:
+                    inserts.append({"book": book.id, "text": comments})
+        if not self.dry_run:
+            for chunk in _chunks(updates):
+                (self.session.query(db.Comments).filter(db.Comments.book.in_(chunk))
+                 .update({db.Comments.text: comments}, synchronize_session=False))
+            if inserts:
+                self.session.execute(db.Comments.__table__.insert(), inserts)
+
+    def set_links(self, field, names):
+        bulk = BULK_LINKS[field]
+        targets, new_names, renamed = self._resolve(bulk, [name for name in names if name != ''])
+        target_ids = set(element.id for element in targets)
+        link_column = bulk.link.c[bulk.column]
+        changed = list()
+        inserts = list()
+        removed = set()
+        for book in self.books:
+            current = getattr(book, bulk.relation)
+            # elements renamed by _resolve are listed with the name they had before
+            old_names = [renamed.get(element.id, getattr(element, bulk.key)) for element in current]
+            current_ids = set(element.id for element in current)
+            if current_ids == target_ids and sorted(old_names) == sorted(new_names):
+                continue
+            self._record(book, field, self._display(field, old_names), self._display(field, new_names))
+            if current_ids == target_ids:
+                # only the case of a name changed, the links stay
+                continue
+            changed.append(book.id)
+            removed.update(current_ids - target_ids)
+            inserts.extend({"book": book.id, bulk.column: element_id} for element_id in target_ids - current_ids)
+        if self.dry_run or not changed:
+            return
+        for chunk in _chunks(changed):
+            self.session.execute(bulk.link.delete().where(and_(bulk.link.c.book.in_(chunk),
+                                                               link_column.notin_(target_ids))))
+        if inserts:
+            self.session.execute(bulk.link.insert(), inserts)
+        for chunk in _chunks(list(removed)):
+            (self.session.query(bulk.db_object)
+             .filter(bulk.db_object.id.in_(chunk), ~exists().where(link_column == bulk.db_object.id))
+             .delete(synchronize_session=False))
+
+    def _resolve(self, bulk, names):
+        """Returns the elements with the names, their new names and the former names of renamed elements by id
+
+        Names are matched through the lower function of the database like in add_objects, existing elements are
+        renamed to the given case like in create_objects_for_addition, missing ones are created unless it's a dry run
+        """
+        column = getattr(bulk.db_object, bulk.key)
+        found = dict()
+        for chunk in _chunks(names):
+            for element in self.session.query(bulk.db_object).filter(
+                    func.lower(column).in_([db.lcase(name) for name in chunk])):
+                found.setdefault(db.lcase(getattr(element, bulk.key)), list()).append(element)
+        existing = dict()
+        renamed = dict()
+        elements = list()
+        new_names = list()
+        for name in names:
+            folded = db.lcase(name)
+            element = existing.get(folded)
+            if element is None:
+                candidates = found.get(folded)
+                if not candidates:
+                    element = create_db_element(bulk.db_object, bulk.db_type, name)
+                    if not self.dry_run:
+                        self.session.add(element)
+                else:
+                    # several elements differing in case, prefer the one with exactly this name
+                    element = next((candidate for candidate in candidates
+                                    if getattr(candidate, bulk.key) == name), candidates[0])
+                    if getattr(element, bulk.key) != name:
+                        renamed[element.id] = getattr(element, bulk.key)
+                        if not self.dry_run:
+                            create_objects_for_addition(element, name, bulk.db_type)
+                existing[folded] = element
+                elements.append(element)
+                new_names.append(name)
+        if not self.dry_run:
+            self.session.flush()
+        return elements, new_names, renamed
+
+    @staticmethod
+    def _display(field, names):
+        if field == 'languages':
+            names = [isoLanguages.get_language_name(get_locale(), code) for code in names]
+        return ', '.join(names)
+
+    def commit(self):
+        if self.dry_run:
+            return
+        now = datetime.now(timezone.utc)
+        for chunk in _chunks(sorted(self.modified)):
+            (self.session.query(db.Books).filter(db.Books.id.in_(chunk))
+             .update({db.Books.last_modified: now}, synchronize_session=False))
+        self.session.commit()
+
+
 # Separated from /editbooks so that /editselectedbooks can also use this
 #
 # param: the property of the book to be changed
@@ -738,6 +914,10 @@ def do_edit_book(book_id, upload_formats=None):
 
         calibre_db.session.merge(book)
         calibre_db.session.commit()
+        # suggestions of the metadata enrichment were reviewed with the edit
+        if not upload_formats:
+            ub.session.query(ub.MetadataSuggestion).filter(ub.MetadataSuggestion.book_id == book_id).delete()
+            ub.session_commit()
         if config.config_use_google_drive:
             gdriveutils.updateGdriveCalibreFromLocal()
         if edit_error is not True and title_author_error is not True and cover_upload_success is not False:
@@ -1001,6 +1181,8 @@ def delete_whole_book(book_id, book):
     # delete book from shelves, Downloads, Read list
     ub.session.query(ub.BookShelf).filter(ub.BookShelf.book_id == book_id).delete()
     ub.session.query(ub.ReadBook).filter(ub.ReadBook.book_id == book_id).delete()
+    ub.session.query(ub.MetadataSuggestion).filter(ub.MetadataSuggestion.book_id == book_id).delete()
+    ub.session.query(ub.MetadataSearch).filter(ub.MetadataSearch.book_id == book_id).delete()
     ub.delete_download(book_id)
     ub.session_commit()
 
@@ -1615,16 +1797,7 @@ def add_objects(db_book_object, db_object, db_session, db_type, add_elements):
         db_element = db_session.query(db_object).filter((func.lower(db_filter).ilike(add_element))).all()
         # if no element is found add it
         if not db_element:
-            if db_type == 'author':
-                new_element = db_object(add_element, helper.get_sorted_author(add_element.replace('|', ',')))
-            elif db_type == 'series':
-                new_element = db_object(add_element, add_element)
-            elif db_type == 'custom':
-                new_element = db_object(value=add_element)
-            elif db_type == 'publisher':
-                new_element = db_object(add_element, None)
-            else:  # db_type should be tag or language
-                new_element = db_object(add_element)
+            new_element = create_db_element(db_object, db_type, add_element)
             db_session.add(new_element)
             db_book_object.append(new_element)
         else:
@@ -1639,6 +1812,19 @@ def add_objects(db_book_object, db_object, db_session, db_type, add_elements):
     return changed
 
 
+def create_db_element(db_object, db_type, add_element):
+    if db_type == 'author':
+        return db_object(add_element, helper.get_sorted_author(add_element.replace('|', ',')))
+    elif db_type == 'series':
+        return db_object(add_element, add_element)
+    elif db_type == 'custom':
+        return db_object(value=add_element)
+    elif db_type == 'publisher':
+        return db_object(add_element, None)
+    # db_type should be tag or language
+    return db_object(add_element)
+
+
 def create_objects_for_addition(db_element, add_element, db_type):
     if db_type == 'custom':
         if db_element.value != add_element:
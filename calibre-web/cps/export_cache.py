@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Book files with embedded metadata, kept on disk so repeated downloads skip calibredb export and kepubify"""
+
+import hashlib
+import os
+
+from . import config, db, logger
+from .constants import CACHE_TYPE_EXPORTS
+from .disk_cache import DiskCache
+from .library_cache import LibraryCache
+
+log = logger.create()
+
+# the custom column definitions change rarely, their signature is computed once per library generation
+_schema_cache = LibraryCache(4)
+
+
+def custom_column_signature(session):
+    """Returns a digest of the custom column definitions, every definition is part of the embedded metadata"""
+    def load():
+        columns = (session.query(db.CustomColumns.id, db.CustomColumns.label, db.CustomColumns.name,
+                                 db.CustomColumns.datatype, db.CustomColumns.is_multiple,
+                                 db.CustomColumns.display, db.CustomColumns.normalized)
+                   .filter(db.CustomColumns.mark_for_delete == 0)
+                   .order_by(db.CustomColumns.id).all())
+        return hashlib.sha1(repr([tuple(column) for column in columns]).encode()).hexdigest()
+    return _schema_cache.get(db.CalibreDB.library_generation(), load)
+
+
+def source_state(path):
+    """Returns modification time and size of a local book file, a replaced format yields a different artifact"""
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+def artifact_key(session, book, book_format, *variant):
+    """Returns the cache name of a book format with embedded metadata
+
+    Besides book and format the key contains the last modification of the book, the custom column schema and the
+    variant, e.g. the state of the source file or the language of the embedded metadata
+    """
+    parts = (book.id, book_format.lower(), str(book.last_modified), custom_column_signature(session)) + variant
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+class ExportCache(DiskCache):
+    """Generated book files with embedded metadata, concurrent requests of the same artifact wait for a single
+    generation
+    """
+
+    def __init__(self):
+        super().__init__(CACHE_TYPE_EXPORTS, lambda: config.config_export_cache_size, "exports")
+
+    def get(self, key, book_format, generate):
+        """Returns directory and name (without extension) of the artifact
+
+        generate() has to return directory and name of a new file like embed_helper.do_calibre_export, it is called
+        if the artifact is not cached. With a disabled cache or on failure the generated file is returned as it is
+        """
+        if not self.max_size:
+            return generate()
+        filename = key + "." + book_format
+        with self.key_lock(filename):
+            path = self.lookup(filename)
+            if path:
+                return os.path.dirname(path), key
+            tmp_dir, tmp_name = generate()
+            if not tmp_dir:
+                return tmp_dir, tmp_name
+            try:
+                path = self.store(os.path.join(tmp_dir, tmp_name + "." + book_format), filename)
+            except OSError as ex:
+                log.error("Storing export of %s in cache failed: %s", filename, ex)
+                return tmp_dir, tmp_name
+            return os.path.dirname(path), key
+
+
+export_cache = ExportCache()
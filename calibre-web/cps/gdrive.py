@@ -138,6 +138,7 @@ try:
             response = gdriveutils.getChangeById(gdriveutils.Gdrive.Instance().drive, j['id'])
             log.debug('%r', response)
             if response:
+                gdriveutils.applyChange(response)
                 dbpath = os.path.join(config.config_calibre_dir, "metadata.db").encode()
                 if not response['deleted'] and response['file']['title'] == 'metadata.db' \
                   and response['file']['md5Checksum'] != hashlib.md5(dbpath):  # nosec
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Read-through cache of Google Drive files, split into blocks of fixed size which are fetched in parallel"""
+
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config, logger
+from .constants import CACHE_TYPE_GDRIVE
+from .disk_cache import DiskCache
+
+log = logger.create()
+
+BLOCK_SIZE = 1024 * 1024
+# blocks requested at the same time while a file is read
+PARALLEL_BLOCKS = 4
+
+
+class GdriveBlockCache(DiskCache):
+    def __init__(self):
+        super().__init__(CACHE_TYPE_GDRIVE, lambda: config.config_google_drive_cache_size, "gdrive_blocks")
+        self._executor = ThreadPoolExecutor(max_workers=PARALLEL_BLOCKS * 2, thread_name_prefix="GdriveBlocks")
+
+    @staticmethod
+    def file_key(df):
+        # a changed file keeps its id, but gets a new checksum
+        version = df.metadata.get('md5Checksum') or df.metadata.get('modifiedDate')
+        return hashlib.sha1("{}:{}".format(df.metadata.get('id'), version).encode()).hexdigest()
+
+    def stream(self, df, start=0, stop=None):
+        """Yields the content of the byte range start to stop (exclusive) of the Google Drive file df"""
+        total_size = int(df.metadata.get('fileSize'))
+        stop = total_size if stop is None else min(stop, total_size)
+        if start >= stop:
+            return
+        key = self.file_key(df)
+        first = start // BLOCK_SIZE
+        last = (stop - 1) // BLOCK_SIZE
+        for window in range(first, last + 1, PARALLEL_BLOCKS):
+            indexes = range(window, min(window + PARALLEL_BLOCKS, last + 1))
+            blocks = self._executor.map(lambda index: self._block(df, key, index, total_size), indexes)
+            for index, block in zip(indexes, blocks):
+                block_start = index * BLOCK_SIZE
+                yield block[max(start - block_start, 0):stop - block_start]
+
+    def read(self, df):
+        return b"".join(self.stream(df))
+
+    def copy_to_file(self, df, output):
+        with open(output, "wb") as f:
+            for block in self.stream(df):
+                f.write(block)
+
+    def _block(self, df, key, index, total_size):
+        filename = "{}_{}".format(key, index)
+        if not self.max_size:
+            return self._fetch(df, index, total_size)
+        with self.key_lock(filename):
+            path = self.lookup(filename)
+            if path:
+                try:
+                    with open(path, "rb") as f:
+                        return f.read()
+                except OSError:
+                    # evicted in the meantime
+                    pass
+            block = self._fetch(df, index, total_size)
+            try:
+                self.store_data(block, filename)
+            except OSError as ex:
+                log.error("Storing block of Google Drive file in cache failed: %s", ex)
+            return block
+
+    @staticmethod
+    def _fetch(df, index, total_size):
+        start = index * BLOCK_SIZE
+        end = min(start + BLOCK_SIZE, total_size) - 1
+        # every request gets an own http object, httplib2 connections are not thread safe
+        resp, content = df.auth.Get_Http_Object().request(df.metadata.get('downloadUrl'),
+                                                          headers={"Range": 'bytes={}-{}'.format(start, end)})
+        if resp.status == 200:
+            return content[start:end + 1]
+        if resp.status != 206:
+            raise IOError('Google Drive returned status {} for bytes {}-{}'.format(resp.status, start, end))
+        return content
+
+
+block_cache = GdriveBlockCache()
@@ -19,16 +19,18 @@
 import os
 import json
 import shutil
-import chardet
+import threading
+import time
 import ssl
 import sqlite3
 import mimetypes
+from collections import OrderedDict
 
-from werkzeug.datastructures import Headers
-from flask import Response, stream_with_context
+from flask import Response, stream_with_context, request
+from werkzeug.datastructures import ContentRange
 from sqlalchemy import create_engine
 from sqlalchemy import Column, UniqueConstraint
-from sqlalchemy import String, Integer
+from sqlalchemy import String, Integer, Float, Text
 from sqlalchemy.orm import sessionmaker, scoped_session
 try:
     # Compatibility with sqlalchemy 2.0
@@ -55,25 +57,34 @@ try:
     from pydrive2.auth import GoogleAuth
     from pydrive2.drive import GoogleDrive
     from pydrive2.auth import RefreshError
-    from pydrive2.files import ApiRequestError
+    from pydrive2.files import ApiRequestError, GoogleDriveFile
 except ImportError as err:
     try:
         from pydrive.auth import GoogleAuth
         from pydrive.drive import GoogleDrive
         from pydrive.auth import RefreshError
-        from pydrive.files import ApiRequestError
+        from pydrive.files import ApiRequestError, GoogleDriveFile
     except ImportError as err:
         importError = err
         gdrive_support = False
 
 from . import logger, cli_param, config, db
 from .constants import CONFIG_DIR as _CONFIG_DIR
+from .gdrive_cache import block_cache
+from .txt_helper import serve_text
 
 
 SETTINGS_YAML  = os.path.join(_CONFIG_DIR, 'settings.yaml')
 CREDENTIALS    = os.path.join(_CONFIG_DIR, 'gdrive_credentials')
 CLIENT_SECRETS = os.path.join(_CONFIG_DIR, 'client_secrets.json')
 
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+# listings of book folders are trusted this long, subscribed change notifications keep them up to date in between
+LISTING_TTL = 3600
+LISTING_TTL_WATCHED = 7 * 24 * 3600
+MAX_CACHED_FOLDERS = 4096
+MAX_CACHED_PATHS = 65536
+
 log = logger.create()
 if gdrive_support:
     logger.get('googleapiclient.discovery_cache').setLevel(logger.logging.ERROR)
@@ -176,7 +187,22 @@ class PermissionAdded(Base):
         return str(self.gdrive_id)
 
 
-if not os.path.exists(cli_param.gd_path):
+class GdriveFile(Base):
+    __tablename__ = 'gdrive_files'
+
+    id = Column(Integer, primary_key=True)
+    folder_id = Column(String, index=True)
+    gdrive_id = Column(String, index=True)
+    title = Column(String)
+    file_metadata = Column(Text)
+    listed = Column(Float)
+
+    def __repr__(self):
+        return str(self.title)
+
+
+# tables added later on are created in existing databases as well, the engine connects only to a configured path
+if cli_param.gd_path:
     try:
         Base.metadata.create_all(engine)
     except Exception as ex:
@@ -184,6 +210,118 @@ if not os.path.exists(cli_param.gd_path):
         raise
 
 
+class FolderCache:
+    """Ids of folder paths and the metadata of the children of book folders
+
+    Every book folder is listed with one request, lookups of its files (book formats, cover.jpg, metadata.opf) are
+    answered from the listing afterwards. Listings are kept in memory and in gdrive.db, they are dropped on changes
+    made by Calibre-Web and on changes reported by the Google Drive change feed
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._folders = OrderedDict()
+        self._paths = OrderedDict()
+        self._invalidations = 0
+
+    @staticmethod
+    def ttl():
+        return LISTING_TTL_WATCHED if config.config_google_drive_watch_changes_response else LISTING_TTL
+
+    def get_path(self, path):
+        with self._lock:
+            return self._paths.get(path)
+
+    def remember_path(self, path, folder_id):
+        with self._lock:
+            self._paths[path] = folder_id
+            while len(self._paths) > MAX_CACHED_PATHS:
+                self._paths.popitem(last=False)
+
+    def forget_paths(self):
+        with self._lock:
+            self._paths.clear()
+
+    def children(self, folder_id, drive):
+        """Returns the metadata of all files and folders in a folder by title"""
+        now = time.time()
+        with self._lock:
+            entry = self._folders.get(folder_id)
+            if entry and now - entry[0] < self.ttl():
+                self._folders.move_to_end(folder_id)
+                return entry[1]
+            invalidations = self._invalidations
+        listed, children = self._load(folder_id, now)
+        if children is None:
+            listed = now
+            children = OrderedDict()
+            for f in drive.ListFile({'q': "'%s' in parents and trashed = false" % folder_id}).GetList():
+                children.setdefault(f['title'], f.metadata)
+            if invalidations == self._invalidations:
+                self._save(folder_id, children, listed)
+        with self._lock:
+            # a listing started before a change of the folder is returned once, but not kept
+            if invalidations == self._invalidations:
+                self._folders[folder_id] = (listed, children)
+                while len(self._folders) > MAX_CACHED_FOLDERS:
+                    self._folders.popitem(last=False)
+        return children
+
+    def forget(self, *ids):
+        """Drops the listings of the given folders and of all folders containing one of the given files"""
+        ids = [i for i in ids if i]
+        if not ids:
+            return
+        with self._lock:
+            self._invalidations += 1
+            for folder_id, (__, children) in list(self._folders.items()):
+                if folder_id in ids or any(child.get('id') in ids for child in children.values()):
+                    del self._folders[folder_id]
+        try:
+            folders = [row.folder_id for row in
+                       session.query(GdriveFile.folder_id).filter(GdriveFile.gdrive_id.in_(ids)).distinct()]
+            session.query(GdriveFile).filter(GdriveFile.folder_id.in_(ids + folders)).delete(synchronize_session=False)
+            session.commit()
+        except OperationalError as ex:
+            log.error_or_exception('Database error: {}'.format(ex))
+            session.rollback()
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += 1
+            self._folders.clear()
+            self._paths.clear()
+        try:
+            session.query(GdriveFile).delete()
+            session.commit()
+        except OperationalError as ex:
+            log.error_or_exception('Database error: {}'.format(ex))
+            session.rollback()
+
+    def _load(self, folder_id, now):
+        rows = session.query(GdriveFile).filter(GdriveFile.folder_id == folder_id).order_by(GdriveFile.id).all()
+        if not rows or now - rows[0].listed >= self.ttl():
+            return None, None
+        children = OrderedDict()
+        for row in rows:
+            children.setdefault(row.title, json.loads(row.file_metadata))
+        return rows[0].listed, children
+
+    def _save(self, folder_id, children, listed):
+        try:
+            session.query(GdriveFile).filter(GdriveFile.folder_id == folder_id).delete()
+            session.add_all([GdriveFile(folder_id=folder_id, gdrive_id=metadata.get('id'), title=title,
+                                        file_metadata=json.dumps(metadata), listed=listed)
+                             for title, metadata in children.items()])
+            session.commit()
+        except OperationalError as ex:
+            log.error_or_exception('Database error: {}'.format(ex))
+            session.rollback()
+
+
+folder_cache = FolderCache()
+
+
 def getDrive(drive=None, gauth=None):
     if not drive:
         if not gauth:
@@ -242,8 +380,12 @@ def getFolderInFolder(parentId, folderName, drive):
 
 # Search for id of root folder in gdrive database, if not found request from gdrive and store in internal database
 def getEbooksFolderId(drive=None):
+    cachedId = folder_cache.get_path('/')
+    if cachedId:
+        return cachedId
     storedPathName = session.query(GdriveId).filter(GdriveId.path == '/').first()
     if storedPathName:
+        folder_cache.remember_path('/', storedPathName.gdrive_id)
         return storedPathName.gdrive_id
     else:
         gDriveId = GdriveId()
@@ -274,11 +416,35 @@ def getFile(pathId, fileName, drive, nocase):
     return None
 
 
+# Looks up a file or folder in the cached listing of its parent folder
+def getCachedFile(pathId, fileName, drive, nocase):
+    children = folder_cache.children(pathId, drive)
+    metadata = children.get(fileName)
+    if not metadata and nocase:
+        metadata = next((m for title, m in children.items() if db.lcase(title) == db.lcase(fileName)), None)
+    if not metadata:
+        return None
+    return GoogleDriveFile(auth=drive.auth, metadata=dict(metadata), uploaded=True)
+
+
+def getSubFolderId(parentId, folderName, rootId, drive):
+    # the library root holds all author folders and is searched, deeper folders are looked up in their parent listing
+    if parentId == rootId:
+        currentFolder = getFolderInFolder(parentId, folderName, drive)
+        return currentFolder['id'] if currentFolder else None
+    child = folder_cache.children(parentId, drive).get(folderName)
+    return child['id'] if child and child.get('mimeType') == FOLDER_MIME_TYPE else None
+
+
 def getFolderId(path, drive):
     currentFolderId = None
     try:
         currentFolderId = getEbooksFolderId(drive)
         sqlCheckPath = path if path[-1] == '/' else path + '/'
+        cachedId = folder_cache.get_path(sqlCheckPath)
+        if cachedId:
+            return cachedId
+        rootId = currentFolderId
         storedPathName = session.query(GdriveId).filter(GdriveId.path == sqlCheckPath).first()
 
         if not storedPathName:
@@ -293,14 +459,14 @@ def getFolderId(path, drive):
                     if storedPathName:
                         currentFolderId = storedPathName.gdrive_id
                     else:
-                        currentFolder = getFolderInFolder(currentFolderId, x, drive)
-                        if currentFolder:
+                        subFolderId = getSubFolderId(currentFolderId, x, rootId, drive)
+                        if subFolderId:
                             gDriveId = GdriveId()
-                            gDriveId.gdrive_id = currentFolder['id']
+                            gDriveId.gdrive_id = subFolderId
                             gDriveId.path = currentPath
                             session.merge(gDriveId)
                             dbChange = True
-                            currentFolderId = currentFolder['id']
+                            currentFolderId = subFolderId
                         else:
                             currentFolderId = None
                             break
@@ -308,6 +474,8 @@ def getFolderId(path, drive):
                 session.commit()
         else:
             currentFolderId = storedPathName.gdrive_id
+        if currentFolderId:
+            folder_cache.remember_path(sqlCheckPath, currentFolderId)
     except (OperationalError, IntegrityError, StaleDataError, sqlite3.IntegrityError) as ex:
         log.error_or_exception('Database error: {}'.format(ex))
         session.rollback()
@@ -326,21 +494,33 @@ def getFileFromEbooksFolder(path, fileName, nocase=False):
         folderId = getFolderId(path, drive)
     else:
         folderId = getEbooksFolderId(drive)
-    if folderId:
-        return getFile(folderId, fileName, drive, nocase)
-    else:
+    if not folderId:
         return None
+    if path:
+        return getCachedFile(folderId, fileName, drive, nocase)
+    # files in the library root like metadata.db change often and are searched every time
+    return getFile(folderId, fileName, drive, nocase)
 
 
 def moveGdriveFileRemote(origin_file_id, new_title):
     origin_file_id['title'] = new_title
     origin_file_id.Upload()
+    folder_cache.forget(origin_file_id['id'])
 
 
-# Download metadata.db from gdrive
+# Download metadata.db or a book file from gdrive
 def downloadFile(path, filename, output):
     f = getFileFromEbooksFolder(path, filename)
-    f.GetContentFile(output)
+    if path:
+        copyFileToLocal(f, output)
+    else:
+        # metadata.db is replaced often and is not worth caching
+        f.GetContentFile(output)
+
+
+# Copies a book file from gdrive, read through the local block cache
+def copyFileToLocal(df, output):
+    block_cache.copy_to_file(df, output)
 
 
 def moveGdriveFolderRemote(origin_file, target_folder, single_book=False):
@@ -374,6 +554,7 @@ def moveGdriveFolderRemote(origin_file, target_folder, single_book=False):
                                          body={'title': target_folder},
                                          fields='title').execute()
 
+    folder_cache.forget(origin_file['id'], previous_parents, gFileTargetDir['id'] if single_book else None)
     # if previous_parents has no children anymore, delete original fileparent
     if len(children['items']) == 1:
         deleteDatabaseEntry(previous_parents)
@@ -392,6 +573,7 @@ def copyToDrive(drive, uploadFile, createRoot, replaceFiles,
         existingFolder = drive.ListFile({'q': "title = '%s' and '%s' in parents and trashed = false" %
                                               (os.path.basename(uploadFile).replace("'", r"\'"), parent['id'])}).GetList()
         if len(existingFolder) == 0 and (not isInitial or createRoot):
+            folder_cache.forget(parent['id'])
             parent = drive.CreateFile({'title': os.path.basename(uploadFile),
                                        'parents': [{"kind": "drive#fileLink", 'id': parent['id']}],
                                        "mimeType": "application/vnd.google-apps.folder"})
@@ -413,6 +595,7 @@ def copyToDrive(drive, uploadFile, createRoot, replaceFiles,
                                               'parents': [{"kind": "drive#fileLink", 'id': parent['id']}], })
             driveFile.SetContentFile(os.path.join(prevDir, uploadFile))
             driveFile.Upload()
+            folder_cache.forget(parent['id'])
 
 
 def uploadFileToEbooksFolder(destFile, f, string=False):
@@ -433,10 +616,12 @@ def uploadFileToEbooksFolder(destFile, f, string=False):
             else:
                 driveFile.SetContentString(f)
             driveFile.Upload()
+            folder_cache.forget(parent['id'])
         else:
             existing_Folder = drive.ListFile({'q': "title = '%s' and '%s' in parents and trashed = false" %
                                                    (x.replace("'", r"\'"), parent['id'])}).GetList()
             if len(existing_Folder) == 0:
+                folder_cache.forget(parent['id'])
                 parent = drive.CreateFile({'title': x, 'parents': [{"kind": "drive#fileLink", 'id': parent['id']}],
                                            "mimeType": "application/vnd.google-apps.folder"})
                 parent.Upload()
@@ -535,6 +720,7 @@ def getChangeById(drive, change_id):
 
 # Deletes the local hashes database to force search for new folder names
 def deleteDatabaseOnChange():
+    folder_cache.clear()
     try:
         session.query(GdriveId).delete()
         session.commit()
@@ -554,6 +740,7 @@ def updateGdriveCalibreFromLocal():
 # update gdrive.db on edit of books title
 def updateDatabaseOnEdit(ID, newPath):
     sqlCheckPath = newPath if newPath[-1] == '/' else newPath + '/'
+    folder_cache.forget_paths()
     storedPathName = session.query(GdriveId).filter(GdriveId.gdrive_id == ID).first()
     if storedPathName:
         storedPathName.path = sqlCheckPath
@@ -566,6 +753,8 @@ def updateDatabaseOnEdit(ID, newPath):
 
 # Deletes the hashes in database of deleted book
 def deleteDatabaseEntry(ID):
+    folder_cache.forget(ID)
+    folder_cache.forget_paths()
     session.query(GdriveId).filter(GdriveId.gdrive_id == ID).delete()
     try:
         session.commit()
@@ -574,6 +763,7 @@ def deleteDatabaseEntry(ID):
         session.rollback()
 
 def deleteDatabasePath(Pathname):
+    folder_cache.forget_paths()
     session.query(GdriveId).filter(GdriveId.path.contains(Pathname)).delete()
     try:
         session.commit()
@@ -582,6 +772,26 @@ def deleteDatabasePath(Pathname):
         session.rollback()
 
 
+# Keeps the cached folder ids and listings up to date with a change reported by the change feed
+def applyChange(change):
+    changedFile = change.get('file') or {}
+    fileId = change.get('fileId') or changedFile.get('id')
+    folder_cache.forget(fileId, *[parent['id'] for parent in changedFile.get('parents', [])])
+    if change.get('deleted') or changedFile.get('mimeType') == FOLDER_MIME_TYPE:
+        # a renamed, moved or deleted folder invalidates the stored ids of all paths below it
+        storedPaths = [row.path for row in session.query(GdriveId).filter(GdriveId.gdrive_id == fileId)]
+        if storedPaths:
+            folder_cache.forget_paths()
+            for storedPath in storedPaths:
+                session.query(GdriveId).filter(GdriveId.path.startswith(storedPath, autoescape=True)).delete(
+                    synchronize_session=False)
+            try:
+                session.commit()
+            except OperationalError as ex:
+                log.error_or_exception('Database error: {}'.format(ex))
+                session.rollback()
+
+
 # Gets cover file from gdrive
 # ToDo: Check is this right everyone get read permissions on cover files?
 def get_cover_via_gdrive(cover_path):
@@ -602,10 +812,7 @@ def get_cover_via_gdrive(cover_path):
             except (OperationalError, IntegrityError) as ex:
                 log.error_or_exception('Database error: {}'.format(ex))
                 session.rollback()
-        headers = Headers()
-        headers["Content-Type"] = 'image/jpeg'
-        resp, content = df.auth.Get_Http_Object().request(df.metadata.get('downloadUrl'), headers=headers)
-        return content
+        return block_cache.read(df)
     else:
         return None
 
@@ -634,34 +841,29 @@ def get_metadata_backup_via_gdrive(metadata_path):
         return None
 
 
-# Creates chunks for downloading big files
-def partial(total_byte_len, part_size_limit):
-    s = []
-    for p in range(0, total_byte_len, part_size_limit):
-        last = min(total_byte_len - 1, p + part_size_limit - 1)
-        s.append([p, last])
-    return s
-
-
-# downloads files in chunks from gdrive
+# streams files from gdrive, byte ranges requested by the client are answered with partial content
 def do_gdrive_download(df, headers, convert_encoding=False):
     total_size = int(df.metadata.get('fileSize'))
-    download_url = df.metadata.get('downloadUrl')
-    s = partial(total_size, 1024 * 1024)  # I'm downloading BIG files, so 100M chunk size is fine for me
-
-    def stream(convert_encoding):
-        for byte in s:
-            headers = {"Range": 'bytes={}-{}'.format(byte[0], byte[1])}
-            resp, content = df.auth.Get_Http_Object().request(download_url, headers=headers)
-            if resp.status == 206:
-                if convert_encoding:
-                    result = chardet.detect(content)
-                    content = content.decode(result['encoding']).encode('utf-8')
-                yield content
-            else:
-                log.warning('An error occurred: {}'.format(resp))
-                return
-    return Response(stream_with_context(stream(convert_encoding)), headers=headers)
+    if convert_encoding:
+        return serve_text((df.metadata.get('id'), df.metadata.get('md5Checksum')), total_size,
+                          lambda start, stop: block_cache.stream(df, start, stop), headers)
+    start, stop, status = 0, total_size, 200
+    if request.range:
+        byte_range = request.range.range_for_length(total_size)
+        if byte_range is None:
+            headers["Content-Range"] = ContentRange("bytes", None, None, total_size).to_header()
+            return Response(status=416, headers=headers)
+        start, stop = byte_range
+        status = 206
+        headers["Content-Range"] = ContentRange("bytes", start, stop, total_size).to_header()
+    headers["Content-Length"] = str(stop - start)
+
+    def stream():
+        try:
+            yield from block_cache.stream(df, start, stop)
+        except (IOError, OSError) as ex:
+            log.warning('An error occurred: {}'.format(ex))
+    return Response(stream_with_context(stream()), status=status, headers=headers)
 
 
 _SETTINGS_YAML_TEMPLATE = """
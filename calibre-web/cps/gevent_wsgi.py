@@ -19,6 +19,8 @@
 from datetime import datetime
 from gevent.pywsgi import WSGIHandler
 
+from . import metrics
+
 
 class MyWSGIHandler(WSGIHandler):
     def get_environ(self):
@@ -27,6 +29,12 @@ class MyWSGIHandler(WSGIHandler):
         env['RAW_URI'] = path
         return env
 
+    def log_request(self):
+        if self.time_finish:
+            metrics.observe_request(self.environ or {}, self._orig_status or self.status or '000',
+                                    self.time_finish - self.time_start)
+        super().log_request()
+
     def format_request(self):
         now = datetime.now().replace(microsecond=0)
         length = self.response_length or '-'
@@ -25,6 +25,7 @@ import re
 import regex
 import shutil
 import socket
+import string
 from datetime import datetime, timedelta, timezone
 import requests
 import unidecode
@@ -54,7 +55,7 @@ except ImportError as e:
 from . import calibre_db, cli_param
 from .string_helper import strip_whitespaces
 from .tasks.convert import TaskConvert
-from . import logger, config, db, ub, fs
+from . import logger, config, db, ub, fs, metrics
 from . import gdriveutils as gd
 from .constants import (STATIC_DIR as _STATIC_DIR, CACHE_TYPE_THUMBNAILS, THUMBNAIL_TYPE_COVER, THUMBNAIL_TYPE_SERIES,
                         SUPPORTED_CALIBRE_BINARIES)
@@ -66,9 +67,13 @@ from .tasks.metadata_backup import TaskBackupMetadata
 from .file_helper import get_temp_dir
 from .epub_helper import get_content_opf, create_new_metadata_backup, updateEpub, replace_metadata
 from .embed_helper import do_calibre_export
+from .export_cache import export_cache, artifact_key, source_state
 
 log = logger.create()
 
+thumbnail_requests = metrics.counter("calibreweb_cover_thumbnail_requests_total",
+                                     "Requests of cover thumbnails by cache result", ("result",))
+
 try:
     from wand.image import Image
     from wand.exceptions import MissingDelegateError, BlobError
@@ -763,8 +768,10 @@ def get_book_cover_internal(book, resolution=None):
             if thumbnail:
                 cache = fs.FileSystem()
                 if cache.get_cache_file_exists(thumbnail.filename, CACHE_TYPE_THUMBNAILS):
+                    thumbnail_requests.inc("hit")
                     return send_from_directory(cache.get_cache_file_dir(thumbnail.filename, CACHE_TYPE_THUMBNAILS),
                                                thumbnail.filename)
+            thumbnail_requests.inc("miss")
 
         # Send the book cover from Google Drive if configured
         if config.config_use_google_drive:
@@ -952,33 +959,41 @@ def do_download_file(book, book_format, client, data, headers):
             if config.config_embed_metadata and (
                  (book_format == "kepub" and config.config_kepubifypath) or
                  (book_format != "kepub" and config.config_binariesdir)):
-                output_path = os.path.join(config.config_calibre_dir, book.path)
-                if not os.path.exists(output_path):
-                    os.makedirs(output_path)
-                output = os.path.join(config.config_calibre_dir, book.path, book_name + "." + book_format)
-                gd.downloadFile(book.path, book_name + "." + book_format, output)
+                # the file is only fetched from Google Drive if its export is not cached
+                source = df.get('md5Checksum') or df.get('modifiedDate')
                 if book_format == "kepub" and config.config_kepubifypath:
-                    filename, download_name = do_kepubify_metadata_replace(book, output)
+                    filename, download_name = export_cache.get(
+                        _kepub_artifact_key(book, book_format, source), book_format,
+                        lambda: do_kepubify_metadata_replace(book, _download_gdrive_copy(book, book_name,
+                                                                                         book_format)))
                 elif book_format != "kepub" and config.config_binariesdir:
-                    filename, download_name = do_calibre_export(book.id, book_format)
+                    def generate():
+                        _download_gdrive_copy(book, book_name, book_format)
+                        return do_calibre_export(book.id, book_format)
+                    filename, download_name = export_cache.get(
+                        artifact_key(calibre_db.session, book, book_format, source), book_format, generate)
             else:
                 return gd.do_gdrive_download(df, headers)
         else:
             abort(404)
     else:
         filename = os.path.join(config.get_book_path(), book.path)
-        if not os.path.isfile(os.path.join(filename, book_name + "." + book_format)):
-            log.error('File not found: %s', os.path.join(filename, book_name + "." + book_format))
+        source = os.path.join(filename, book_name + "." + book_format)
+        if not os.path.isfile(source):
+            log.error('File not found: %s', source)
             abort(404)
 
         if client == "kobo" and book_format == "kepub":
             headers["Content-Disposition"] = headers["Content-Disposition"].replace(".kepub", ".kepub.epub")
 
         if book_format == "kepub" and config.config_kepubifypath and config.config_embed_metadata:
-            filename, download_name = do_kepubify_metadata_replace(book, os.path.join(filename,
-                                                                                      book_name + "." + book_format))
+            filename, download_name = export_cache.get(
+                _kepub_artifact_key(book, book_format, source_state(source)), book_format,
+                lambda: do_kepubify_metadata_replace(book, source))
         elif book_format != "kepub" and config.config_binariesdir and config.config_embed_metadata:
-            filename, download_name = do_calibre_export(book.id, book_format)
+            filename, download_name = export_cache.get(
+                artifact_key(calibre_db.session, book, book_format, source_state(source)), book_format,
+                lambda: do_calibre_export(book.id, book_format))
         else:
             download_name = book_name
 
@@ -991,6 +1006,20 @@ def do_download_file(book, book_format, client, data, headers):
     return response
 
 
+def _download_gdrive_copy(book, book_name, book_format):
+    output_path = os.path.join(config.config_calibre_dir, book.path)
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    output = os.path.join(output_path, book_name + "." + book_format)
+    gd.downloadFile(book.path, book_name + "." + book_format, output)
+    return output
+
+
+def _kepub_artifact_key(book, book_format, source):
+    # the embedded metadata of kepubify is translated to the language of the user
+    return artifact_key(calibre_db.session, book, book_format, source, str(current_user.locale), str(get_locale()))
+
+
 def do_kepubify_metadata_replace(book, file_path):
     custom_columns = (calibre_db.session.query(db.CustomColumns)
                       .filter(db.CustomColumns.mark_for_delete == 0)
@@ -1093,6 +1122,17 @@ def tags_filters():
     return and_(pos_content_tags_filter, ~neg_content_tags_filter)
 
 
+# tag names are compared with the NOCASE collation of the database, which only folds ASCII letters
+_NOCASE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def tags_visible():
+    """Returns a predicate on tag names matching the tags selected by tags_filters"""
+    denied = set(tag.translate(_NOCASE) for tag in current_user.list_denied_tags() if tag)
+    allowed = set(tag.translate(_NOCASE) for tag in current_user.list_allowed_tags() if tag)
+    return lambda name: name.translate(_NOCASE) not in denied and (not allowed or name.translate(_NOCASE) in allowed)
+
+
 # checks if domain is in database (including wildcards)
 # example SELECT * FROM @TABLE WHERE 'abcdefg' LIKE Name;
 # from https://code.luasoftware.com/tutorials/flask/execute-raw-sql-in-flask-sqlalchemy/
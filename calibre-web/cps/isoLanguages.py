@@ -15,14 +15,20 @@
 #
 #   You should have received a copy of the GNU General Public License
 #   along with this program. If not, see <http://www.gnu.org/licenses/>.
+import json
+import os
 import sys
+from functools import lru_cache
 
-from .iso_language_names import LANGUAGE_NAMES as _LANGUAGE_NAMES
 from . import logger
 from .string_helper import strip_whitespaces
 
 log = logger.create()
 
+# one json file per user language mapping iso639-3 codes to the translated language names, auto-generated from the
+# translations of Calibre
+LANGUAGE_NAMES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "language_names")
+
 
 try:
     from pycountry import languages as pyc_languages
@@ -46,21 +52,51 @@ except ImportError as ex:
     get = languages.get
 
 
+class _LanguageTable:
+    __slots__ = ("names", "codes")
+
+    def __init__(self, names):
+        self.names = names
+        # lower case names to codes, the first code wins if a name is used twice
+        self.codes = dict()
+        for code, name in names.items():
+            self.codes.setdefault(name.lower(), code)
+
+
+@lru_cache(maxsize=None)
+def _available_tables():
+    return frozenset(os.path.splitext(file)[0] for file in os.listdir(LANGUAGE_NAMES_DIR) if file.endswith(".json"))
+
+
+# Tables are only read on first use of a user language and kept afterwards
+@lru_cache(maxsize=None)
+def _load_table(name):
+    if name not in _available_tables():
+        return None
+    with open(os.path.join(LANGUAGE_NAMES_DIR, name + ".json"), encoding="utf-8") as f:
+        return _LanguageTable(json.load(f))
+
+
+def _get_table(locale):
+    table = _load_table(str(locale))
+    if table is None:
+        table = _load_table(locale.language)
+    return table
+
+
 def get_language_names(locale):
-    names = _LANGUAGE_NAMES.get(str(locale))
-    if names is None:
-        names = _LANGUAGE_NAMES.get(locale.language)
-    return names
+    table = _get_table(locale)
+    return table.names if table else None
 
 
 def get_language_name(locale, lang_code):
     UNKNOWN_TRANSLATION = "Unknown"
-    names = get_language_names(locale)
-    if names is None:
+    table = _get_table(locale)
+    if table is None:
         log.error(f"Missing language names for locale: {str(locale)}/{locale.language}")
         return UNKNOWN_TRANSLATION
 
-    name = names.get(lang_code, UNKNOWN_TRANSLATION)
+    name = table.names.get(lang_code, UNKNOWN_TRANSLATION)
     if name == UNKNOWN_TRANSLATION:
         log.error("Missing translation for language name: {}".format(lang_code))
 
@@ -68,26 +104,29 @@ def get_language_name(locale, lang_code):
 
 
 def get_language_code_from_name(locale, language_names, remainder=None):
-    language_names = set(strip_whitespaces(x).lower() for x in language_names if x)
+    codes = _get_table(locale).codes
     lang = list()
-    for key, val in get_language_names(locale).items():
-        val = val.lower()
-        if val in language_names:
-            lang.append(key)
-            language_names.remove(val)
-    if remainder is not None and language_names:
-        remainder.extend(language_names)
+    unknown = list()
+    for name in dict.fromkeys(strip_whitespaces(x).lower() for x in language_names if x):
+        code = codes.get(name)
+        if code is None:
+            unknown.append(name)
+        elif code not in lang:
+            lang.append(code)
+    if remainder is not None and unknown:
+        remainder.extend(unknown)
     return lang
 
 
 def get_valid_language_codes_from_code(locale, language_names, remainder=None):
+    names = _get_table(locale).names
     lang = list()
     if "" in language_names:
         language_names.remove("")
-    for k, __ in get_language_names(locale).items():
-        if k in language_names:
-            lang.append(k)
-            language_names.remove(k)
+    for code in list(dict.fromkeys(language_names)):
+        if code in names:
+            lang.append(code)
+            language_names.remove(code)
     if remainder is not None and len(language_names):
         remainder.extend(language_names)
     return lang
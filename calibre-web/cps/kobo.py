@@ -45,7 +45,7 @@ from sqlalchemy.sql import select
 import requests
 
 from . import config, logger, kobo_auth, db, calibre_db, helper, shelf as shelf_lib, ub, csrf, kobo_sync_status
-from . import isoLanguages
+from . import isoLanguages, metrics
 from .epub import get_epub_layout
 from .constants import COVER_THUMBNAIL_SMALL, COVER_THUMBNAIL_MEDIUM, COVER_THUMBNAIL_LARGE
 from .helper import get_download_link
@@ -65,6 +65,9 @@ kobo_auth.register_url_value_preprocessor(kobo)
 
 log = logger.create()
 
+kobo_syncs = metrics.counter("calibreweb_kobo_sync_requests_total", "Kobo library sync requests", ("mode",))
+kobo_sync_items = metrics.counter("calibreweb_kobo_sync_items_total", "Items sent to Kobo devices by type", ("type",))
+
 
 def get_store_url_for_current_request():
     # Programmatically modify the current url to point to the official Kobo store
@@ -304,6 +307,10 @@ def HandleSyncRequest():
     sync_token.archive_last_modified = new_archived_last_modified
     sync_token.reading_state_last_modified = new_reading_state_last_modified
 
+    kobo_syncs.inc("continue" if cont_sync else "complete")
+    for result in sync_results:
+        for item_type in result:
+            kobo_sync_items.inc(item_type)
     return generate_sync_response(sync_token, sync_results, cont_sync)
 
 
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+from collections import OrderedDict
+
+from . import metrics
+
+cache_hits = metrics.counter("calibreweb_cache_hits_total", "Lookups answered from a library cache", ("cache",))
+cache_misses = metrics.counter("calibreweb_cache_misses_total", "Lookups computed for a library cache", ("cache",))
+cache_entries = metrics.gauge("calibreweb_cache_entries", "Entries held by a library cache", ("cache",))
+
+
+class LibraryCache:
+    """Thread safe, size bounded LRU mapping for values computed from the Calibre library
+
+    Keys are expected to contain the library generation (CalibreDB.library_generation()), so entries of an outdated
+    library are never hit again and drop out as soon as newer entries are added. Named caches are exported as metrics
+    """
+
+    def __init__(self, max_entries=64, name=None):
+        self.max_entries = max_entries
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if name:
+            metrics.register_collector(self._collect_metrics)
+
+    def get(self, key, loader):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        # computed outside the lock, concurrent misses of the same key just compute the value twice
+        value = loader()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def discard(self, predicate):
+        """Removes all entries whose key matches predicate"""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _collect_metrics(self):
+        cache_hits.set(self.hits, self.name)
+        cache_misses.set(self.misses, self.name)
+        cache_entries.set(len(self), self.name)
+
+
+class TimedCache(LibraryCache):
+    """LibraryCache for values which can change without a new library generation, like users and their sessions
+
+    Entries expire ttl seconds after they were loaded, changes have to be announced with discard() or clear() to get
+    visible earlier. None is never cached, so failed lookups are repeated on every call
+    """
+
+    def __init__(self, ttl, max_entries=64, name=None):
+        super().__init__(max_entries, name)
+        self.ttl = ttl
+        # counts discard() and clear() calls, values loaded while one happened are not stored
+        self._invalidations = 0
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            invalidations = self._invalidations
+        value = loader()
+        with self._lock:
+            if value is None or invalidations != self._invalidations:
+                self._entries.pop(key, None)
+                return value
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def peek(self, key):
+        """Returns the value stored for key if it didn't expire yet, None otherwise. Nothing is loaded"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += 1
+            self._entries.clear()
+
+    def discard(self, predicate):
+        with self._lock:
+            self._invalidations += 1
+        super().discard(predicate)
@@ -27,9 +27,7 @@ def request_username():
     return request.authorization.username
 
 
-def main():
-    app = create_app()
-
+def register_blueprints(app):
     from .web import web
     from .basic import basic
     from .opds import opds
@@ -59,7 +57,6 @@ def main():
         oauth_available = False
         oauth = None
 
-    from . import web_server
     init_errorhandler()
 
     app.register_blueprint(search)
@@ -82,5 +79,12 @@ def main():
         limiter.limit("3/minute", key_func=get_remote_address)(kobo)
     if oauth_available:
         app.register_blueprint(oauth)
+
+
+def main():
+    app = create_app()
+    register_blueprints(app)
+
+    from . import web_server
     success = web_server.start()
     sys.exit(0 if success else 1)
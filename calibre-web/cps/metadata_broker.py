@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Runs the searches of the metadata providers
+
+All searches of a broker share one thread pool. A search waits for each provider at most PROVIDER_TIMEOUT seconds
+after the provider was started and returns after SEARCH_DEADLINE seconds with the results available by then. Results
+are cached per provider, query and locale, providers failing repeatedly are skipped for a while. Searches of the
+background enrichment use their own broker, so they can't fill the pool or open the breakers of interactive searches
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from . import logger
+from .library_cache import TimedCache
+
+log = logger.create()
+
+PROVIDER_TIMEOUT = 10
+SEARCH_DEADLINE = 15
+RESULT_TTL = 3600
+# consecutive failures after which a provider is skipped for BREAKER_PAUSE seconds
+BREAKER_FAILURES = 3
+BREAKER_PAUSE = 300
+MAX_WORKERS = 10
+BACKGROUND_WORKERS = 4
+# searches waiting for a free worker are checked this often whether they were started
+QUEUE_POLL = 0.5
+
+
+class CircuitBreaker:
+    def __init__(self, name):
+        self.name = name
+        self.failures = 0
+        self.open_until = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.failures < BREAKER_FAILURES:
+                return True
+            if time.monotonic() < self.open_until:
+                return False
+            # one trial search after the pause, its failure opens the breaker again
+            self.open_until = time.monotonic() + BREAKER_PAUSE
+            return True
+
+    def succeeded(self):
+        with self._lock:
+            self.failures = 0
+
+    def failed(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= BREAKER_FAILURES:
+                self.open_until = time.monotonic() + BREAKER_PAUSE
+                log.warning("Metadata provider %s failed %d times, skipping it for %d seconds",
+                            self.name, self.failures, BREAKER_PAUSE)
+
+
+def normalize_query(query):
+    return " ".join(query.casefold().split())
+
+
+class RunningSearch:
+    def __init__(self):
+        self.future = None
+        # time a worker of the pool started the search, None while it is queued
+        self.started = None
+
+
+class MetadataBroker:
+    def __init__(self, max_workers=MAX_WORKERS, name="metadata"):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="MetadataSearch")
+        # failed searches (None) are not cached by TimedCache
+        self.results = TimedCache(RESULT_TTL, 512, name=name + "_results")
+        self._breakers = dict()
+        # searches still running, identical searches of other requests wait for them
+        self._running = dict()
+        self._lock = threading.Lock()
+
+    def breaker(self, provider):
+        with self._lock:
+            if provider.__id__ not in self._breakers:
+                self._breakers[provider.__id__] = CircuitBreaker(provider.__name__)
+            return self._breakers[provider.__id__]
+
+    def search(self, providers, query, generic_cover, locale):
+        """Returns the records found by the providers for query, providers which are too slow are left out"""
+        deadline = time.monotonic() + SEARCH_DEADLINE
+        key = (normalize_query(query), str(locale), generic_cover)
+        # cached results are answered without the pool
+        found = [self.results.peek((provider.__id__,) + key) for provider in providers]
+        searches = [self._submit(provider, key, query, generic_cover, locale) if cached is None else None
+                    for provider, cached in zip(providers, found)]
+        records = list()
+        for provider, cached, search in zip(providers, found, searches):
+            if cached is not None:
+                records.extend(cached)
+            elif search is not None:
+                if not self._wait(search, deadline):
+                    log.warning("Metadata provider %s did not answer within %d seconds", provider.__name__,
+                                PROVIDER_TIMEOUT)
+                    continue
+                records.extend(search.future.result() or [])
+        return records
+
+    @staticmethod
+    def _wait(search, deadline):
+        """Waits until PROVIDER_TIMEOUT after the start of the search or the deadline, returns whether it finished"""
+        while True:
+            started = search.started
+            limit = deadline if started is None else min(started + PROVIDER_TIMEOUT, deadline)
+            timeout = limit - time.monotonic()
+            if started is None:
+                timeout = min(timeout, QUEUE_POLL)
+            done, __ = wait([search.future], timeout=max(0, timeout))
+            if done:
+                return True
+            if time.monotonic() >= limit:
+                return False
+
+    def _submit(self, provider, key, query, generic_cover, locale):
+        breaker = self.breaker(provider)
+        with self._lock:
+            running = self._running.get((provider.__id__, key))
+            if running:
+                return running
+            if not breaker.allow():
+                return None
+            search = RunningSearch()
+            search.future = self._executor.submit(self._search, search, provider, breaker, key, query,
+                                                  generic_cover, locale)
+            self._running[(provider.__id__, key)] = search
+        return search
+
+    def _search(self, search, provider, breaker, key, query, generic_cover, locale):
+        search.started = time.monotonic()
+
+        def load():
+            try:
+                found = provider.search(query, generic_cover, locale)
+            except Exception as ex:
+                log.error_or_exception("Metadata provider {} failed: {}".format(provider.__name__, ex))
+                found = None
+            # searches answering too late count as failures, although their results are cached for the next time
+            if found is None or time.monotonic() - search.started > PROVIDER_TIMEOUT:
+                breaker.failed()
+            else:
+                breaker.succeeded()
+            return [record for record in found if record] if found is not None else None
+        try:
+            return self.results.get((provider.__id__,) + key, load)
+        finally:
+            with self._lock:
+                self._running.pop((provider.__id__, key), None)
+
+
+broker = MetadataBroker()
+# used by the metadata enrichment task
+background_broker = MetadataBroker(BACKGROUND_WORKERS, "metadata_background")
@@ -26,7 +26,7 @@ try:
 except ImportError:
     pass
 
-from cps.services.Metadata import MetaRecord, MetaSourceInfo, Metadata
+from cps.services.Metadata import MetaRecord, MetaSourceInfo, Metadata, create_session, REQUEST_TIMEOUT
 import cps.logger as logger
 
 #from time import time
@@ -49,72 +49,70 @@ class Amazon(Metadata):
                'Priority' : 'u=0, i',
                'accept-encoding': 'gzip, deflate, br, zstd',
                'accept-language': 'en-US,en;q=0.9'}
-    session = requests.Session()
-    session.headers=headers
+    session = create_session(headers)
 
     def search(
         self, query: str, generic_cover: str = "", locale: str = "en"
     ) -> Optional[List[MetaRecord]]:
         def inner(link, index) -> [dict, int]:
-            with self.session as session:
+            try:
+                r = self.session.get(f"https://www.amazon.com/{link}", timeout=REQUEST_TIMEOUT)
+                r.raise_for_status()
+            except Exception as ex:
+                log.warning(ex)
+                return []
+            long_soup = BS(r.text, "lxml")  #~4sec :/
+            soup2 = long_soup.find("div", attrs={"cel_widget_id": "dpx-ppd_csm_instrumentation_wrapper"})
+            if soup2 is None:
+                return []
+            try:
+                match = MetaRecord(
+                    title = "",
+                    authors = "",
+                    source=MetaSourceInfo(
+                        id=self.__id__,
+                        description="Amazon Books",
+                        link="https://amazon.com/"
+                    ),
+                    url = f"https://www.amazon.com{link}",
+                    #the more searches the slower, these are too hard to find in reasonable time or might not even exist
+                    publisher= "",  # very unreliable
+                    publishedDate= "",  # very unreliable
+                    id = None,  # ?
+                    tags = []  # dont exist on amazon
+                )
+
                 try:
-                    r = session.get(f"https://www.amazon.com/{link}")
-                    r.raise_for_status()
-                except Exception as ex:
-                    log.warning(ex)
-                    return []
-                long_soup = BS(r.text, "lxml")  #~4sec :/
-                soup2 = long_soup.find("div", attrs={"cel_widget_id": "dpx-ppd_csm_instrumentation_wrapper"})
-                if soup2 is None:
-                    return []
+                    match.description = "\n".join(
+                        soup2.find("div", attrs={"data-feature-name": "bookDescription"}).stripped_strings)\
+                                            .replace("\xa0"," ")[:-9].strip().strip("\n")
+                except (AttributeError, TypeError):
+                    return []  # if there is no description it is not a book and therefore should be ignored
                 try:
-                    match = MetaRecord(
-                        title = "",
-                        authors = "",
-                        source=MetaSourceInfo(
-                            id=self.__id__,
-                            description="Amazon Books",
-                            link="https://amazon.com/"
-                        ),
-                        url = f"https://www.amazon.com{link}",
-                        #the more searches the slower, these are too hard to find in reasonable time or might not even exist
-                        publisher= "",  # very unreliable
-                        publishedDate= "",  # very unreliable
-                        id = None,  # ?
-                        tags = []  # dont exist on amazon
-                    )
-
-                    try:
-                        match.description = "\n".join(
-                            soup2.find("div", attrs={"data-feature-name": "bookDescription"}).stripped_strings)\
-                                                .replace("\xa0"," ")[:-9].strip().strip("\n")
-                    except (AttributeError, TypeError):
-                        return []  # if there is no description it is not a book and therefore should be ignored
-                    try:
-                        match.title = soup2.find("span", attrs={"id": "productTitle"}).text
-                    except (AttributeError, TypeError):
-                        match.title = ""
-                    try:
-                        match.authors = [next(
-                            filter(lambda i: i != " " and i != "\n" and not i.startswith("{"),
-                                   x.findAll(string=True))).strip()
-                                        for x in soup2.findAll("span", attrs={"class": "author"})]
-                    except (AttributeError, TypeError, StopIteration):
-                        match.authors = ""
-                    try:
-                        match.rating = int(
-                            soup2.find("span", class_="a-icon-alt").text.split(" ")[0].split(".")[
-                                0])  # first number in string
-                    except (AttributeError, ValueError):
-                        match.rating = 0
-                    try:
-                        match.cover = soup2.find("img", attrs={"class": "a-dynamic-image"})["src"]
-                    except (AttributeError, TypeError):
-                        match.cover = ""
-                    return match, index
-                except Exception as e:
-                    log.error_or_exception(e)
-                    return []
+                    match.title = soup2.find("span", attrs={"id": "productTitle"}).text
+                except (AttributeError, TypeError):
+                    match.title = ""
+                try:
+                    match.authors = [next(
+                        filter(lambda i: i != " " and i != "\n" and not i.startswith("{"),
+                               x.findAll(string=True))).strip()
+                                    for x in soup2.findAll("span", attrs={"class": "author"})]
+                except (AttributeError, TypeError, StopIteration):
+                    match.authors = ""
+                try:
+                    match.rating = int(
+                        soup2.find("span", class_="a-icon-alt").text.split(" ")[0].split(".")[
+                            0])  # first number in string
+                except (AttributeError, ValueError):
+                    match.rating = 0
+                try:
+                    match.cover = soup2.find("img", attrs={"class": "a-dynamic-image"})["src"]
+                except (AttributeError, TypeError):
+                    match.cover = ""
+                return match, index
+            except Exception as e:
+                log.error_or_exception(e)
+                return []
 
         val = list()
         if self.active:
@@ -122,14 +120,14 @@ class Amazon(Metadata):
                 results = self.session.get(
                     f"https://www.amazon.com/s?k={query.replace(' ', '+')}&i=digital-text&sprefix={query.replace(' ', '+')}"
                     f"%2Cdigital-text&ref=nb_sb_noss",
-                    headers=self.headers)
+                    headers=self.headers, timeout=REQUEST_TIMEOUT)
                 results.raise_for_status()
             except requests.exceptions.HTTPError as e:
                 log.error_or_exception(e)
-                return []
+                return None
             except Exception as e:
                 log.warning(e)
-                return []
+                return None
             soup = BS(results.text, 'html.parser')
             links_list = [next(filter(lambda i: "digital-text" in i["href"], x.findAll("a")))["href"] for x in
                           soup.findAll("div", attrs={"data-component-type": "s-search-result"})]
@@ -20,9 +20,8 @@
 from typing import Dict, List, Optional
 from urllib.parse import quote
 
-import requests
 from cps import logger
-from cps.services.Metadata import MetaRecord, MetaSourceInfo, Metadata
+from cps.services.Metadata import MetaRecord, MetaSourceInfo, Metadata, REQUEST_TIMEOUT
 
 log = logger.create()
 
@@ -50,9 +49,10 @@ class ComicVine(Metadata):
                 tokens = [quote(t.encode("utf-8")) for t in title_tokens]
                 query = "%20".join(tokens)
             try:
-                result = requests.get(
+                result = self.session.get(
                     f"{ComicVine.BASE_URL}{query}{ComicVine.QUERY_PARAMS}",
                     headers=ComicVine.HEADERS,
+                    timeout=REQUEST_TIMEOUT,
                 )
                 result.raise_for_status()
             except Exception as e:
@@ -19,12 +19,11 @@ import re
 from concurrent import futures
 from typing import List, Optional
 
-import requests
 from html2text import HTML2Text
 from lxml import etree
 
 from cps import logger
-from cps.services.Metadata import Metadata, MetaRecord, MetaSourceInfo
+from cps.services.Metadata import Metadata, MetaRecord, MetaSourceInfo, create_session, REQUEST_TIMEOUT
 
 log = logger.create()
 
@@ -62,11 +61,10 @@ class Douban(Metadata):
     DESCRIPTION_XPATH = "//div[@id='link-report']//div[@class='intro']"
     RATING_XPATH = "//div[@class='rating_self clearfix']/strong"
 
-    session = requests.Session()
-    session.headers = {
+    session = create_session({
         'user-agent':
         'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/98.0.4758.102 Safari/537.36 Edg/98.0.1108.56',
-    }
+    })
 
     def search(self,
                query: str,
@@ -106,7 +104,8 @@ class Douban(Metadata):
                                  params={
                                      "cat": 1001,
                                      "q": query
-                                 })
+                                 },
+                                 timeout=REQUEST_TIMEOUT)
             r.raise_for_status()
 
         except Exception as e:
@@ -128,7 +127,8 @@ class Douban(Metadata):
                                  params={
                                      "cat": 1001,
                                      "q": query
-                                 })
+                                 },
+                                 timeout=REQUEST_TIMEOUT)
             r.raise_for_status()
 
         except Exception as e:
@@ -151,7 +151,7 @@ class Douban(Metadata):
         log.debug(f"start parsing {url}")
 
         try:
-            r = self.session.get(url)
+            r = self.session.get(url, timeout=REQUEST_TIMEOUT)
             r.raise_for_status()
         except Exception as e:
             log.warning(e)
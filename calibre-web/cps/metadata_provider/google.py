@@ -21,11 +21,10 @@ from typing import Dict, List, Optional
 from urllib.parse import quote
 from datetime import datetime
 
-import requests
 
 from cps import logger, config
 from cps.isoLanguages import get_lang3, get_language_name
-from cps.services.Metadata import MetaRecord, MetaSourceInfo, Metadata
+from cps.services.Metadata import MetaRecord, MetaSourceInfo, Metadata, REQUEST_TIMEOUT
 
 log = logger.create()
 
@@ -51,11 +50,11 @@ class Google(Metadata):
                 tokens = [quote(t.encode("utf-8")) for t in title_tokens]
                 query = "+".join(tokens)
             try:
-                results = requests.get(Google.SEARCH_URL + query + Google.API_KEY)
+                results = self.session.get(Google.SEARCH_URL + query + Google.API_KEY, timeout=REQUEST_TIMEOUT)
                 results.raise_for_status()
             except Exception as e:
                 log.warning(e)
-                return []
+                return None
             for result in results.json().get("items", []):
                 val.append(
                     self._parse_search_result(
@@ -21,7 +21,6 @@ from multiprocessing.pool import ThreadPool
 from typing import List, Optional, Tuple, Union
 from urllib.parse import quote
 
-import requests
 from dateutil import parser
 from html2text import HTML2Text
 from lxml.html import HtmlElement, fromstring, tostring
@@ -29,7 +28,7 @@ from markdown2 import Markdown
 
 from cps import logger
 from cps.isoLanguages import get_language_name
-from cps.services.Metadata import MetaRecord, MetaSourceInfo, Metadata
+from cps.services.Metadata import MetaRecord, MetaSourceInfo, Metadata, REQUEST_TIMEOUT
 
 log = logger.create()
 
@@ -118,7 +117,7 @@ class LubimyCzytac(Metadata):
     ) -> Optional[List[MetaRecord]]:
         if self.active:
             try:
-                result = requests.get(self._prepare_query(title=query))
+                result = self.session.get(self._prepare_query(title=query), timeout=REQUEST_TIMEOUT)
                 result.raise_for_status()
             except Exception as e:
                 log.warning(e)
@@ -212,7 +211,7 @@ class LubimyCzytacParser:
         self, match: MetaRecord, generic_cover: str, locale: str
     ) -> MetaRecord:
         try:
-            response = requests.get(match.url)
+            response = self.metadata.session.get(match.url, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
         except Exception as e:
             log.warning(e)
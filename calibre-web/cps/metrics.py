@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Process wide metrics, exported in the Prometheus text format
+
+Counters and histograms are updated in place with a short lock, values which are only interesting at scrape time
+(queue depths, cache sizes) are provided by collectors registered with register_collector()
+"""
+
+import bisect
+import threading
+from collections import OrderedDict
+
+from . import logger
+
+log = logger.create()
+
+# upper bounds in seconds of the latency buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# environ key the flask app stores the endpoint of a request in, read by the wsgi servers
+ENVIRON_ENDPOINT = "cps.endpoint"
+
+_lock = threading.Lock()
+_metrics = OrderedDict()
+_collectors = list()
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"')
+                                            .replace("\n", "\\n"))
+                          for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = dict()
+
+    def header(self):
+        return ["# HELP {} {}".format(self.name, self.documentation),
+                "# TYPE {} {}".format(self.name, self.kind)]
+
+    def samples(self):
+        with _lock:
+            values = list(self.values.items())
+        return ["{}{} {}".format(self.name, _format_labels(self.labels, key), _format_value(value))
+                for key, value in values]
+
+    # used by collectors to publish values counted elsewhere
+    def set(self, value, *label_values):
+        with _lock:
+            self.values[label_values] = value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                # bucket counts, observation count, sum of observations
+                counts = self.values[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            if index < len(self.buckets):
+                counts[0][index] += 1
+            counts[1] += 1
+            counts[2] += value
+
+    def samples(self):
+        with _lock:
+            values = [(key, list(counts[0]), counts[1], counts[2]) for key, counts in self.values.items()]
+        lines = list()
+        for key, buckets, count, total in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, buckets):
+                cumulative += bucket_count
+                lines.append("{}_bucket{} {}".format(self.name, _format_labels(self.labels + ("le",),
+                                                                                key + (_format_value(bound),)),
+                                                    cumulative))
+            lines.append("{}_bucket{} {}".format(self.name, _format_labels(self.labels + ("le",), key + ("+Inf",)),
+                                                count))
+            lines.append("{}_count{} {}".format(self.name, _format_labels(self.labels, key), count))
+            lines.append("{}_sum{} {}".format(self.name, _format_labels(self.labels, key), _format_value(total)))
+        return lines
+
+
+def _register(metric):
+    with _lock:
+        existing = _metrics.get(metric.name)
+        if existing:
+            return existing
+        _metrics[metric.name] = metric
+    return metric
+
+
+def counter(name, documentation, labels=()):
+    return _register(Counter(name, documentation, labels))
+
+
+def gauge(name, documentation, labels=()):
+    return _register(Gauge(name, documentation, labels))
+
+
+def histogram(name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, documentation, labels, buckets))
+
+
+def register_collector(collector):
+    """Registers a function called before every export, used to update gauges from the current state"""
+    with _lock:
+        _collectors.append(collector)
+
+
+def export():
+    with _lock:
+        collectors = list(_collectors)
+    for collector in collectors:
+        try:
+            collector()
+        except Exception as ex:
+            log.debug("Metrics collector %s failed: %s", collector, ex)
+    with _lock:
+        metrics = list(_metrics.values())
+    lines = list()
+    for metric in metrics:
+        lines.extend(metric.header())
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+def init_app(app):
+    from flask import request
+
+    # the wsgi servers only know the path, the endpoint keeps the number of label values bounded
+    @app.before_request
+    def store_endpoint():
+        request.environ[ENVIRON_ENDPOINT] = request.endpoint
+
+
+request_duration = histogram("calibreweb_http_request_duration_seconds",
+                             "Time from receiving a request until the response is sent",
+                             ("endpoint", "method", "status"))
+
+
+def observe_request(environ, status, duration):
+    """Called by the wsgi servers after a response is sent"""
+    endpoint = environ.get(ENVIRON_ENDPOINT) or "unknown"
+    request_duration.observe(duration, endpoint, environ.get("REQUEST_METHOD", ""), str(status)[:1] + "xx")
@@ -21,12 +21,16 @@
 #  along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import datetime
+import hashlib
+import time
 # import json
+from functools import wraps
 from urllib.parse import unquote_plus
 
 from flask import Blueprint, request, render_template, make_response, abort, g, jsonify
 from flask_babel import get_locale
 from flask_babel import gettext as _
+from markupsafe import Markup
 
 
 from sqlalchemy.sql.expression import func, text, or_, and_, true
@@ -37,12 +41,62 @@ from .usermanagement import requires_basic_auth_if_no_ano, auth
 from .helper import get_download_link, get_book_cover
 from .pagination import Pagination
 from .web import render_read_books
+from .render_template import stream_template
+from .library_cache import LibraryCache
 
 
 opds = Blueprint('opds', __name__)
 
 log = logger.create()
 
+# Rendered feeds keyed by request, user visibility and library generation
+feed_cache = LibraryCache(max_entries=512, name="opds_feeds")
+# Rendered <entry> elements of books, keyed by book and its last modification
+entry_cache = LibraryCache(max_entries=4096, name="opds_entries")
+# [etag, time] of the last change of a feed per user, the visibility of a user can change without a change of the
+# library files
+feed_changes = LibraryCache(max_entries=4096)
+
+
+def cached_feed(f):
+    """Serves a feed from the feed cache and answers conditional requests with 304
+
+    Only usable for feeds depending on nothing else than the library content and the visibility settings of the user
+    """
+    @wraps(f)
+    def inner(*args, **kwargs):
+        generation = calibre_db.library_generation()
+        user = auth.current_user()
+        key = (request.script_root, request.full_path, str(get_locale()), user.sidebar_view,
+               config.config_calibre_web_title, config.config_books_per_page, config.config_read_column,
+               config.config_columns_to_ignore, generation, calibre_db.common_filters_signature())
+        etag = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        change = feed_changes.get((request.script_root, request.full_path, user.id), lambda: [None, 0])
+        if change[0] != etag:
+            change[:] = [etag, int(time.time())]
+        last_modified = datetime.datetime.fromtimestamp(max(generation[2] // 1000000000,
+                                                            generation[4] // 1000000000, change[1]),
+                                                        datetime.timezone.utc)
+        modified_since = request.if_modified_since
+        if modified_since and not modified_since.tzinfo:
+            # older werkzeug versions return naive datetimes in utc
+            modified_since = modified_since.replace(tzinfo=datetime.timezone.utc)
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            not_modified = modified_since is not None and modified_since >= last_modified
+        if not_modified:
+            response = make_response("", 304)
+        else:
+            g.opds_updated = last_modified
+            response = make_response(feed_cache.get(key, lambda: f(*args, **kwargs).get_data()))
+            response.headers["Content-Type"] = "application/atom+xml; charset=utf-8"
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+    return inner
+
 
 @opds.route("/opds/")
 @opds.route("/opds")
@@ -74,12 +128,14 @@ def feed_normal_search():
 
 @opds.route("/opds/books")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_booksindex():
     return render_element_index(db.Books.sort, None, 'opds.feed_letter_books')
 
 
 @opds.route("/opds/books/letter/<book_id>")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_letter_books(book_id):
     off = request.args.get("offset") or 0
     letter = true() if book_id == "00" else func.upper(db.Books.sort).startswith(book_id)
@@ -87,20 +143,23 @@ def feed_letter_books(book_id):
                                                         db.Books,
                                                         letter,
                                                         [db.Books.sort],
-                                                        True, config.config_read_column)
+                                                        True, config.config_read_column,
+                                                        load_profile='feed')
     cc = calibre_db.get_cc_columns(config, filter_config_custom_read=True)
     return render_xml_template('feed.xml', entries=entries, pagination=pagination, cc=cc)
 
 
 @opds.route("/opds/new")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_new():
     if not auth.current_user().check_visibility(constants.SIDEBAR_RECENT):
         abort(404)
     off = request.args.get("offset") or 0
     entries, __, pagination = calibre_db.fill_indexpage((int(off) / (int(config.config_books_per_page)) + 1), 0,
                                                         db.Books, True, [db.Books.timestamp.desc()],
-                                                        True, config.config_read_column)
+                                                        True, config.config_read_column,
+                                                        load_profile='feed')
     cc = calibre_db.get_cc_columns(config, filter_config_custom_read=True)
     return render_xml_template('feed.xml', entries=entries, pagination=pagination, cc=cc)
 
@@ -110,8 +169,7 @@ def feed_new():
 def feed_discover():
     if not auth.current_user().check_visibility(constants.SIDEBAR_RANDOM):
         abort(404)
-    query = calibre_db.generate_linked_query(config.config_read_column, db.Books)
-    entries = query.filter(calibre_db.common_filters()).order_by(func.random()).limit(config.config_books_per_page)
+    entries = calibre_db.get_random_books(config.config_read_column, db.Books, config.config_books_per_page)
     pagination = Pagination(1, config.config_books_per_page, int(config.config_books_per_page))
     cc = calibre_db.get_cc_columns(config, filter_config_custom_read=True)
     return render_xml_template('feed.xml', entries=entries, pagination=pagination, cc=cc)
@@ -119,6 +177,7 @@ def feed_discover():
 
 @opds.route("/opds/rated")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_best_rated():
     if not auth.current_user().check_visibility(constants.SIDEBAR_BEST_RATED):
         abort(404)
@@ -126,7 +185,8 @@ def feed_best_rated():
     entries, __, pagination = calibre_db.fill_indexpage((int(off) / (int(config.config_books_per_page)) + 1), 0,
                                                         db.Books, db.Books.ratings.any(db.Ratings.rating > 9),
                                                         [db.Books.timestamp.desc()],
-                                                        True, config.config_read_column)
+                                                        True, config.config_read_column,
+                                                        load_profile='feed')
     cc = calibre_db.get_cc_columns(config, filter_config_custom_read=True)
     return render_xml_template('feed.xml', entries=entries, pagination=pagination, cc=cc)
 
@@ -137,27 +197,20 @@ def feed_hot():
     if not auth.current_user().check_visibility(constants.SIDEBAR_HOT):
         abort(404)
     off = request.args.get("offset") or 0
-    all_books = ub.session.query(ub.Downloads, func.count(ub.Downloads.book_id)).order_by(
-        func.count(ub.Downloads.book_id).desc()).group_by(ub.Downloads.book_id)
-    hot_books = all_books.offset(off).limit(config.config_books_per_page)
-    entries = list()
-    for book in hot_books:
-        query = calibre_db.generate_linked_query(config.config_read_column, db.Books)
-        download_book = query.filter(calibre_db.common_filters()).filter(
-            book.Downloads.book_id == db.Books.id).first()
-        if download_book:
-            entries.append(download_book)
-        else:
-            ub.delete_download(book.Downloads.book_id)
-    num_books = entries.__len__()
-    pagination = Pagination((int(off) / (int(config.config_books_per_page)) + 1),
-                            config.config_books_per_page, num_books)
+    entries, __, pagination = calibre_db.fill_indexpage((int(off) / (int(config.config_books_per_page)) + 1), 0,
+                                                        db.Books, ub.BookDownloadCount.count > 0,
+                                                        [ub.BookDownloadCount.count.desc(), db.Books.id.desc()],
+                                                        True, config.config_read_column,
+                                                        ub.BookDownloadCount,
+                                                        db.Books.id == ub.BookDownloadCount.book_id,
+                                                        load_profile='feed')
     cc = calibre_db.get_cc_columns(config, filter_config_custom_read=True)
     return render_xml_template('feed.xml', entries=entries, pagination=pagination, cc=cc)
 
 
 @opds.route("/opds/author")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_authorindex():
     if not auth.current_user().check_visibility(constants.SIDEBAR_AUTHOR):
         abort(404)
@@ -166,6 +219,7 @@ def feed_authorindex():
 
 @opds.route("/opds/author/letter/<book_id>")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_letter_author(book_id):
     if not auth.current_user().check_visibility(constants.SIDEBAR_AUTHOR):
         abort(404)
@@ -184,12 +238,14 @@ def feed_letter_author(book_id):
 
 @opds.route("/opds/author/<int:book_id>")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_author(book_id):
     return render_xml_dataset(db.Authors, book_id)
 
 
 @opds.route("/opds/publisher")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_publisherindex():
     if not auth.current_user().check_visibility(constants.SIDEBAR_PUBLISHER):
         abort(404)
@@ -198,22 +254,24 @@ def feed_publisherindex():
         .join(db.books_publishers_link)\
         .join(db.Books).filter(calibre_db.common_filters())\
         .group_by(text('books_publishers_link.publisher'))\
-        .order_by(db.Publishers.sort)\
-        .limit(config.config_books_per_page).offset(off)
+        .order_by(db.Publishers.sort)
     pagination = Pagination((int(off) / (int(config.config_books_per_page)) + 1), config.config_books_per_page,
-                            len(calibre_db.session.query(db.Publishers).all()))
+                            entries.count())
+    entries = entries.limit(config.config_books_per_page).offset(off).all()
     cc = calibre_db.get_cc_columns(config, filter_config_custom_read=True)
     return render_xml_template('feed.xml', listelements=entries, folder='opds.feed_publisher', pagination=pagination, cc=cc)
 
 
 @opds.route("/opds/publisher/<int:book_id>")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_publisher(book_id):
     return render_xml_dataset(db.Publishers, book_id)
 
 
 @opds.route("/opds/category")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_categoryindex():
     if not auth.current_user().check_visibility(constants.SIDEBAR_CATEGORY):
         abort(404)
@@ -222,6 +280,7 @@ def feed_categoryindex():
 
 @opds.route("/opds/category/letter/<book_id>")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_letter_category(book_id):
     if not auth.current_user().check_visibility(constants.SIDEBAR_CATEGORY):
         abort(404)
@@ -242,12 +301,14 @@ def feed_letter_category(book_id):
 
 @opds.route("/opds/category/<int:book_id>")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_category(book_id):
     return render_xml_dataset(db.Tags, book_id)
 
 
 @opds.route("/opds/series")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_seriesindex():
     if not auth.current_user().check_visibility(constants.SIDEBAR_SERIES):
         abort(404)
@@ -256,6 +317,7 @@ def feed_seriesindex():
 
 @opds.route("/opds/series/letter/<book_id>")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_letter_series(book_id):
     if not auth.current_user().check_visibility(constants.SIDEBAR_SERIES):
         abort(404)
@@ -276,19 +338,22 @@ def feed_letter_series(book_id):
 
 @opds.route("/opds/series/<int:book_id>")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_series(book_id):
     off = request.args.get("offset") or 0
     entries, __, pagination = calibre_db.fill_indexpage((int(off) / (int(config.config_books_per_page)) + 1), 0,
                                                         db.Books,
                                                         db.Books.series.any(db.Series.id == book_id),
                                                         [db.Books.series_index],
-                                                        True, config.config_read_column)
+                                                        True, config.config_read_column,
+                                                        load_profile='feed')
     cc = calibre_db.get_cc_columns(config, filter_config_custom_read=True)
     return render_xml_template('feed.xml', entries=entries, pagination=pagination, cc=cc)
 
 
 @opds.route("/opds/ratings")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_ratingindex():
     if not auth.current_user().check_visibility(constants.SIDEBAR_RATING):
         abort(404)
@@ -312,12 +377,14 @@ def feed_ratingindex():
 
 @opds.route("/opds/ratings/<book_id>")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_ratings(book_id):
     return render_xml_dataset(db.Ratings, book_id)
 
 
 @opds.route("/opds/formats")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_formatindex():
     if not auth.current_user().check_visibility(constants.SIDEBAR_FORMAT):
         abort(404)
@@ -337,13 +404,15 @@ def feed_formatindex():
 
 @opds.route("/opds/formats/<book_id>")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_format(book_id):
     off = request.args.get("offset") or 0
     entries, __, pagination = calibre_db.fill_indexpage((int(off) / (int(config.config_books_per_page)) + 1), 0,
                                                         db.Books,
                                                         db.Books.data.any(db.Data.format == book_id.upper()),
                                                         [db.Books.timestamp.desc()],
-                                                        True, config.config_read_column)
+                                                        True, config.config_read_column,
+                                                        load_profile='feed')
     cc = calibre_db.get_cc_columns(config, filter_config_custom_read=True)
     return render_xml_template('feed.xml', entries=entries, pagination=pagination, cc=cc)
 
@@ -351,6 +420,7 @@ def feed_format(book_id):
 @opds.route("/opds/language")
 @opds.route("/opds/language/")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_languagesindex():
     if not auth.current_user().check_visibility(constants.SIDEBAR_LANGUAGE):
         abort(404)
@@ -369,13 +439,15 @@ def feed_languagesindex():
 
 @opds.route("/opds/language/<int:book_id>")
 @requires_basic_auth_if_no_ano
+@cached_feed
 def feed_languages(book_id):
     off = request.args.get("offset") or 0
     entries, __, pagination = calibre_db.fill_indexpage((int(off) / (int(config.config_books_per_page)) + 1), 0,
                                                         db.Books,
                                                         db.Books.languages.any(db.Languages.id == book_id),
                                                         [db.Books.timestamp.desc()],
-                                                        True, config.config_read_column)
+                                                        True, config.config_read_column,
+                                                        load_profile='feed')
     cc = calibre_db.get_cc_columns(config, filter_config_custom_read=True)
     return render_xml_template('feed.xml', entries=entries, pagination=pagination, cc=cc)
 
@@ -419,7 +491,8 @@ def feed_shelf(book_id):
                                                            ub.BookShelf.shelf == shelf.id,
                                                            [ub.BookShelf.order.asc()],
                                                            True, config.config_read_column,
-                                                           ub.BookShelf, ub.BookShelf.book_id == db.Books.id)
+                                                           ub.BookShelf, ub.BookShelf.book_id == db.Books.id,
+                                                           load_profile='feed')
         # delete shelf entries where book is not existent anymore, can happen if book is deleted outside calibre-web
         wrong_entries = calibre_db.session.query(ub.BookShelf) \
             .join(db.Books, ub.BookShelf.book_id == db.Books.id, isouter=True) \
@@ -517,20 +590,36 @@ class FeedObject:
 
 def feed_search(term):
     if term:
-        entries, __, ___ = calibre_db.get_search_results(term, config=config)
-        entries_count = len(entries) if len(entries) > 0 else 1
+        result_count, entries = calibre_db.stream_search_results(term, config, load_profile='feed')
+        entries_count = result_count if result_count > 0 else 1
         pagination = Pagination(1, entries_count, entries_count)
         cc = calibre_db.get_cc_columns(config, filter_config_custom_read=True)
-        return render_xml_template('feed.xml', searchterm=term, entries=entries, pagination=pagination, cc=cc)
+        # search results are not paginated, the feed can list the whole library
+        return render_xml_template('feed.xml', searchterm=term, entries=entries, pagination=pagination, cc=cc,
+                                   stream=True)
     else:
         return render_xml_template('feed.xml', searchterm="")
 
 
 
-def render_xml_template(*args, **kwargs):
+def render_feed_entry(entry, cc):
+    book = entry.Books
+    # dates and labels of the entry are rendered in the language of the user
+    key = (book.id, book.last_modified, request.script_root, str(get_locale()), tuple(c.id for c in cc))
+    return Markup(entry_cache.get(key, lambda: render_template('feed_entry.xml', entry=entry, cc=cc)))
+
+
+def render_xml_template(template_name, stream=False, **kwargs):
     # ToDo: return time in current timezone similar to %z
-    currtime = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S+00:00")
-    xml = render_template(current_time=currtime, instance=config.config_calibre_web_title, constants=constants.sidebar_settings, *args, **kwargs)
+    # cached feeds carry the modification time of the library to keep their content stable
+    currtime = g.get("opds_updated", datetime.datetime.now()).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+    cc = kwargs.get("cc", [])
+    context = dict(current_time=currtime, instance=config.config_calibre_web_title,
+                   constants=constants.sidebar_settings, render_entry=lambda entry: render_feed_entry(entry, cc),
+                   **kwargs)
+    if stream:
+        return stream_template(template_name, mimetype="application/atom+xml", **context)
+    xml = render_template(template_name, **context)
     response = make_response(xml)
     response.headers["Content-Type"] = "application/atom+xml; charset=utf-8"
     return response
@@ -542,7 +631,8 @@ def render_xml_dataset(data_table, book_id):
                                                         db.Books,
                                                         getattr(db.Books, data_table.__tablename__).any(data_table.id == book_id),
                                                         [db.Books.timestamp.desc()],
-                                                        True, config.config_read_column)
+                                                        True, config.config_read_column,
+                                                        load_profile='feed')
     cc = calibre_db.get_cc_columns(config, filter_config_custom_read=True)
     return render_xml_template('feed.xml', entries=entries, pagination=pagination, cc=cc)
 
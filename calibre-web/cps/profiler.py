@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+from collections import Counter, deque, OrderedDict
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from . import logger
+
+log = logger.create()
+
+# number of requests kept for the query inspector
+WINDOW_SIZE = 500
+# number of slowest statements kept per request and shown in the inspector
+SLOWEST_STATEMENTS = 10
+# a statement issued this often during one request is reported as N+1 pattern
+N_PLUS_ONE_THRESHOLD = 10
+
+
+class RequestProfile:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.time()
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.slowest = list()
+
+    def add(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+        self.slowest.append((duration, statement))
+        if len(self.slowest) > SLOWEST_STATEMENTS * 2:
+            self.slowest = sorted(self.slowest, reverse=True)[:SLOWEST_STATEMENTS]
+
+    def finish(self):
+        self.slowest = sorted(self.slowest, reverse=True)[:SLOWEST_STATEMENTS]
+
+    @property
+    def repeated(self):
+        return [(statement, count) for statement, count in self.statements.items()
+                if count >= N_PLUS_ONE_THRESHOLD]
+
+
+class SQLProfiler:
+    """Records the statements executed by all database engines during a request
+
+    Profiling is switched on and off with config_query_profiler, the last WINDOW_SIZE requests are kept in memory
+    """
+
+    def __init__(self, window_size=WINDOW_SIZE):
+        self.config = None
+        self.window = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def init_app(self, app, config):
+        self.config = config
+        event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    @property
+    def enabled(self):
+        return bool(self.config and self.config.config_query_profiler)
+
+    def _start_request(self):
+        self._local.profile = RequestProfile(request.endpoint) if self.enabled else None
+        self._local.started = list()
+
+    def _finish_request(self, response):
+        profile = getattr(self._local, "profile", None)
+        if profile:
+            self._local.profile = None
+            profile.finish()
+            with self._lock:
+                self.window.append(profile)
+            if self.config.config_server_timing:
+                response.headers.add("Server-Timing", 'db;dur={:.1f};desc="{} queries"'
+                                     .format(profile.duration * 1000, profile.count))
+            if profile.repeated:
+                log.debug("Request to %s repeated %d statements more than %d times", profile.endpoint,
+                          len(profile.repeated), N_PLUS_ONE_THRESHOLD - 1)
+        return response
+
+    # engine events are fired in every thread, only statements of profiled requests are recorded
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if getattr(self._local, "profile", None):
+            self._local.started.append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        profile = getattr(self._local, "profile", None)
+        if profile and self._local.started:
+            profile.add(statement, time.perf_counter() - self._local.started.pop())
+
+    def clear(self):
+        with self._lock:
+            self.window.clear()
+
+    def summary(self):
+        """Returns the recorded requests aggregated per endpoint, the slowest statements and N+1 patterns"""
+        with self._lock:
+            profiles = list(self.window)
+        endpoints = OrderedDict()
+        slowest = list()
+        repeated = dict()
+        for profile in profiles:
+            entry = endpoints.setdefault(profile.endpoint, {'endpoint': profile.endpoint, 'requests': 0,
+                                                            'queries': 0, 'max_queries': 0,
+                                                            'duration': 0.0, 'max_duration': 0.0})
+            entry['requests'] += 1
+            entry['queries'] += profile.count
+            entry['max_queries'] = max(entry['max_queries'], profile.count)
+            entry['duration'] += profile.duration
+            entry['max_duration'] = max(entry['max_duration'], profile.duration)
+            slowest.extend((duration, statement, profile.endpoint) for duration, statement in profile.slowest)
+            for statement, count in profile.repeated:
+                key = (profile.endpoint, statement)
+                repeated[key] = max(repeated.get(key, 0), count)
+        for entry in endpoints.values():
+            entry['avg_queries'] = entry['queries'] / entry['requests']
+            entry['avg_duration'] = entry['duration'] / entry['requests']
+        return {'requests': len(profiles),
+                'endpoints': sorted(endpoints.values(), key=lambda x: x['duration'], reverse=True),
+                'slowest': sorted(slowest, key=lambda x: x[0], reverse=True)[:SLOWEST_STATEMENTS],
+                'repeated': sorted(((endpoint, statement, count) for (endpoint, statement), count
+                                    in repeated.items()), key=lambda x: x[2], reverse=True)}
@@ -16,18 +16,30 @@
 #  You should have received a copy of the GNU General Public License
 #  along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from flask import render_template, g, abort, request
-from flask_babel import gettext as _
+from types import SimpleNamespace
+
+from flask import render_template, g, abort, request, current_app, stream_with_context, Response
+from flask_babel import gettext as _, get_locale
 from werkzeug.local import LocalProxy
 from .cw_login import current_user
 from sqlalchemy.sql.expression import or_
 
 from . import config, constants, logger, ub
+from .library_cache import LibraryCache
 from .ub import User
 
 
 log = logger.create()
 
+# template output pieces sent together as one chunk of a streamed response
+STREAM_BUFFER_SIZE = 100
+
+# rendered sidebars differ only by language, the few user properties used below and the kind of client
+sidebar_cache = LibraryCache(max_entries=128, name="sidebars")
+# shelves visible to a user, valid until any shelf is created, changed or deleted
+shelf_cache = LibraryCache(max_entries=512, name="shelf_lists")
+
+
 def get_sidebar_config(kwargs=None):
     kwargs = kwargs or []
     simple = bool([e for e in ['kindle', 'tolino', "kobo", "bookeen"]
@@ -37,6 +49,26 @@ def get_sidebar_config(kwargs=None):
         content = isinstance(content, (User, LocalProxy)) and not content.role_anonymous()
     else:
         content = 'conf' in kwargs
+    is_admin = bool(current_user.role_admin())
+    anonymous = bool(current_user.is_anonymous)
+    all_languages = current_user.filter_language() == 'all'
+    key = (str(get_locale()), content, simple, is_admin, anonymous, all_languages)
+    sidebar = sidebar_cache.get(key, lambda: _build_sidebar(content, simple, is_admin, anonymous, all_languages))
+    g.shelves_access = get_shelves_access()
+    return sidebar, simple
+
+
+def get_shelves_access():
+    """Returns the public shelves and the shelves of the current user as plain objects ordered by name"""
+    def load():
+        return [SimpleNamespace(id=shelf.id, name=shelf.name, is_public=shelf.is_public, user_id=shelf.user_id)
+                for shelf in ub.session.query(ub.Shelf).filter(or_(ub.Shelf.is_public == 1,
+                                                                   ub.Shelf.user_id == current_user.id))
+                .order_by(ub.Shelf.name)]
+    return shelf_cache.get((current_user.id, ub.shelf_generation), load)
+
+
+def _build_sidebar(content, simple, is_admin, anonymous, all_languages):
     sidebar = list()
     sidebar.append({"glyph": "glyphicon-book", "text": _('Books'), "link": 'web.index', "id": "new",
                     "visibility": constants.SIDEBAR_RECENT, 'public': True, "page": "root",
@@ -44,14 +76,14 @@ def get_sidebar_config(kwargs=None):
     sidebar.append({"glyph": "glyphicon-fire", "text": _('Hot Books'), "link": 'web.books_list', "id": "hot",
                     "visibility": constants.SIDEBAR_HOT, 'public': True, "page": "hot",
                     "show_text": _('Show Hot Books'), "config_show": True})
-    if current_user.role_admin():
+    if is_admin:
         sidebar.append({"glyph": "glyphicon-download", "text": _('Downloaded Books'), "link": 'web.download_list',
-                        "id": "download", "visibility": constants.SIDEBAR_DOWNLOAD, 'public': (not current_user.is_anonymous),
+                        "id": "download", "visibility": constants.SIDEBAR_DOWNLOAD, 'public': (not anonymous),
                         "page": "download", "show_text": _('Show Downloaded Books'),
                         "config_show": content})
     else:
         sidebar.append({"glyph": "glyphicon-download", "text": _('Downloaded Books'), "link": 'web.books_list',
-                        "id": "download", "visibility": constants.SIDEBAR_DOWNLOAD, 'public': (not current_user.is_anonymous),
+                        "id": "download", "visibility": constants.SIDEBAR_DOWNLOAD, 'public': (not anonymous),
                         "page": "download", "show_text": _('Show Downloaded Books'),
                         "config_show": content})
     sidebar.append({"glyph": "glyphicon-headphones", "text": _('Audiobooks'), "link": 'web.books_list',
@@ -63,11 +95,11 @@ def get_sidebar_config(kwargs=None):
          "visibility": constants.SIDEBAR_BEST_RATED, 'public': True, "page": "rated",
          "show_text": _('Show Top Rated Books'), "config_show": True})
     sidebar.append({"glyph": "glyphicon-eye-open", "text": _('Read Books'), "link": 'web.books_list', "id": "read",
-                    "visibility": constants.SIDEBAR_READ_AND_UNREAD, 'public': (not current_user.is_anonymous),
+                    "visibility": constants.SIDEBAR_READ_AND_UNREAD, 'public': (not anonymous),
                     "page": "read", "show_text": _('Show Read and Unread'), "config_show": content})
     sidebar.append(
         {"glyph": "glyphicon-eye-close", "text": _('Unread Books'), "link": 'web.books_list', "id": "unread",
-         "visibility": constants.SIDEBAR_READ_AND_UNREAD, 'public': (not current_user.is_anonymous), "page": "unread",
+         "visibility": constants.SIDEBAR_READ_AND_UNREAD, 'public': (not anonymous), "page": "unread",
          "show_text": _('Show unread'), "config_show": False})
     sidebar.append({"glyph": "glyphicon-random", "text": _('Discover'), "link": 'web.books_list', "id": "rand",
                     "visibility": constants.SIDEBAR_RANDOM, 'public': True, "page": "discover",
@@ -86,7 +118,7 @@ def get_sidebar_config(kwargs=None):
          "visibility": constants.SIDEBAR_PUBLISHER, 'public': True, "page": "publisher",
          "show_text": _('Show Publisher Section'), "config_show":True})
     sidebar.append({"glyph": "glyphicon-flag", "text": _('Languages'), "link": 'web.language_overview', "id": "lang",
-                    "visibility": constants.SIDEBAR_LANGUAGE, 'public': (current_user.filter_language() == 'all'),
+                    "visibility": constants.SIDEBAR_LANGUAGE, 'public': all_languages,
                     "page": "language",
                     "show_text": _('Show Language Section'), "config_show": True})
     sidebar.append({"glyph": "glyphicon-star-empty", "text": _('Ratings'), "link": 'web.ratings_list', "id": "rate",
@@ -97,24 +129,41 @@ def get_sidebar_config(kwargs=None):
                     "page": "format", "show_text": _('Show File Formats Section'), "config_show": True})
     sidebar.append(
         {"glyph": "glyphicon-trash", "text": _('Archived Books'), "link": 'web.books_list', "id": "archived",
-         "visibility": constants.SIDEBAR_ARCHIVED, 'public': (not current_user.is_anonymous), "page": "archived",
+         "visibility": constants.SIDEBAR_ARCHIVED, 'public': (not anonymous), "page": "archived",
          "show_text": _('Show Archived Books'), "config_show": content})
     if not simple:
         sidebar.append(
             {"glyph": "glyphicon-th-list", "text": _('Books List'), "link": 'web.books_table', "id": "list",
-             "visibility": constants.SIDEBAR_LIST, 'public': (not current_user.is_anonymous), "page": "list",
+             "visibility": constants.SIDEBAR_LIST, 'public': (not anonymous), "page": "list",
              "show_text": _('Show Books List'), "config_show": content})
 
     # Agregar enlace a Logros y Premios
     sidebar.append(
         {"glyph": "glyphicon-certificate", "text": _('Achievements'), "link": 'web.show_achievements', "id": "achievements",
-         "visibility": constants.SIDEBAR_ACHIEVEMENTS, 'public': (not current_user.is_anonymous), "page": "achievements",
+         "visibility": constants.SIDEBAR_ACHIEVEMENTS, 'public': (not anonymous), "page": "achievements",
          "show_text": _('Show Achievements & Awards'), "config_show": True})
+    return sidebar
 
-    g.shelves_access = ub.session.query(ub.Shelf).filter(
-        or_(ub.Shelf.is_public == 1, ub.Shelf.user_id == current_user.id)).order_by(ub.Shelf.name).all()
 
-    return sidebar, simple
+# Renders the template as a stream of chunks, so pages listing lots of books never exist as one big string
+def stream_template(template_name, mimetype="text/html", **context):
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    template = app.jinja_env.get_or_select_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return Response(stream_with_context(stream), mimetype=mimetype)
+
+
+# Streams the template and includes the instance name
+def stream_title_template(template_name, **kwargs):
+    sidebar, simple = get_sidebar_config(kwargs)
+    try:
+        return stream_template(template_name, instance=config.config_calibre_web_title, sidebar=sidebar,
+                               simple=simple, accept=config.config_upload_formats.split(','), **kwargs)
+    except PermissionError:
+        log.error("No permission to access {} file.".format(template_name))
+        abort(403)
 
 
 # Returns the template for rendering and includes the instance name
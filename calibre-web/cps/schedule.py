@@ -18,13 +18,16 @@
 
 import datetime
 
-from . import config, constants
+from . import config, constants, ub
 from .services.background_scheduler import BackgroundScheduler, CronTrigger, use_APScheduler
 from .tasks.database import TaskReconnectDatabase
 from .tasks.clean import TaskClean
 from .tasks.thumbnail import TaskGenerateCoverThumbnails, TaskGenerateSeriesThumbnails, TaskClearCoverThumbnailCache
 from .services.worker import WorkerThread
+from .services.task_journal import TaskJournal
 from .tasks.metadata_backup import TaskBackupMetadata
+from .tasks.export import TaskWarmExportCache
+from .tasks.metadata_enrich import TaskEnrichMetadata
 
 def get_scheduled_tasks(reconnect=True):
     tasks = list()
@@ -48,9 +51,27 @@ def get_scheduled_tasks(reconnect=True):
     if config.schedule_generate_series_covers:
         tasks.append([lambda: TaskGenerateSeriesThumbnails(), 'generate book covers', False])
 
+    # Export the most downloaded books with embedded metadata
+    if config.schedule_warm_export_cache:
+        tasks.append([lambda: TaskWarmExportCache(), 'warm export cache', False])
+
+    # Search the metadata providers for books without cover, description or identifiers
+    if config.schedule_enrich_metadata:
+        tasks.append([lambda: TaskEnrichMetadata(config.schedule_enrich_metadata_apply), 'enrich metadata', False])
+
     return tasks
 
 
+def configure_task_lanes():
+    WorkerThread.get_instance().configure_lanes(config.get_task_lane_settings())
+
+
+def resume_journaled_tasks():
+    # import all resumable tasks, so they are known to the worker
+    from .tasks import audiobook, convert, mail  # noqa: F401
+    WorkerThread.get_instance().resume(TaskJournal(ub.get_new_session_instance()))
+
+
 def end_scheduled_tasks():
     worker = WorkerThread.get_instance()
     for __, __, __, task, __ in worker.tasks:
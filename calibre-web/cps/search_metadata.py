@@ -16,14 +16,13 @@
 #  You should have received a copy of the GNU General Public License
 #  along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-import concurrent.futures
 import importlib
 import inspect
 import json
 import os
 import sys
 
-from flask import Blueprint, request, url_for, make_response, jsonify
+from flask import Blueprint, request, url_for, make_response, jsonify, abort
 from .cw_login import current_user
 from flask_babel import get_locale
 from sqlalchemy.exc import InvalidRequestError, OperationalError
@@ -31,6 +30,7 @@ from sqlalchemy.orm.attributes import flag_modified
 
 from cps.services.Metadata import Metadata
 from . import constants, logger, ub, web_server
+from .metadata_broker import broker
 from .usermanagement import user_login_required
 
 
@@ -113,11 +113,21 @@ def metadata_change_active_provider(prov_name):
         data = []
         provider = next((c for c in cl if c.__id__ == prov_name), None)
         if provider is not None:
-            data = provider.search(new_state.get("query", ""))
+            data = broker.search([provider], new_state.get("query", ""), "", get_locale())
         return make_response(jsonify([asdict(x) for x in data]))
     return ""
 
 
+@meta.route("/metadata/suggestions/<int:book_id>")
+@user_login_required
+def metadata_suggestions(book_id):
+    if not current_user.role_edit() and not current_user.role_admin():
+        abort(403)
+    suggestions = (ub.session.query(ub.MetadataSuggestion).filter(ub.MetadataSuggestion.book_id == book_id)
+                   .order_by(ub.MetadataSuggestion.score.desc()).all())
+    return make_response(jsonify([suggestion.record for suggestion in suggestions]))
+
+
 @meta.route("/metadata/search", methods=["POST"])
 @user_login_required
 def metadata_search():
@@ -127,13 +137,6 @@ def metadata_search():
     locale = get_locale()
     if query:
         static_cover = url_for("static", filename="generic_cover.jpg")
-        # ret = cl[0].search(query, static_cover, locale)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            meta = {
-                executor.submit(c.search, query, static_cover, locale): c
-                for c in cl
-                if active.get(c.__id__, True)
-            }
-            for future in concurrent.futures.as_completed(meta):
-                data.extend([asdict(x) for x in future.result() if x])
+        providers = [c for c in cl if active.get(c.__id__, True)]
+        data.extend([asdict(x) for x in broker.search(providers, query, static_cover, locale)])
     return  make_response(jsonify(data))
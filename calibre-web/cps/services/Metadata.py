@@ -21,8 +21,14 @@ import os
 import re
 from typing import Dict, Generator, List, Optional, Union
 
+import requests
+from requests.adapters import HTTPAdapter
+
 from cps import constants
 
+# seconds a single http request of a metadata provider may take
+REQUEST_TIMEOUT = 10
+
 
 @dataclasses.dataclass
 class MetaSourceInfo:
@@ -50,12 +56,27 @@ class MetaRecord:
     tags: Optional[List[str]] = dataclasses.field(default_factory=list)
 
 
+def create_session(headers=None):
+    """Returns a http session whose connections are kept open between the searches of a provider"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
 class Metadata:
     __name__ = "Generic"
     __id__ = "generic"
+    # shared by all searches of the provider, providers sending own headers create their own session
+    session = None
 
     def __init__(self):
         self.active = True
+        if self.session is None:
+            self.session = create_session()
 
     def set_status(self, state):
         self.active = state
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import exc
+
+from .. import logger, ub
+
+log = logger.create()
+
+# Checkpoints of a task are written at most every CHECKPOINT_INTERVAL seconds
+CHECKPOINT_INTERVAL = 10
+
+
+class TaskJournal:
+    """Persists waiting and running worker tasks in app.db, so they survive a restart of Calibre-Web
+
+    Every worker lane runs in its own thread, the scoped session hands out one database connection per thread
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.lock = threading.Lock()
+        self.last_update = dict()
+
+    def record(self, task, user, hidden):
+        descriptor = task.to_descriptor()
+        if descriptor is None:
+            return
+        entry = ub.TaskJournalEntry(task_class=type(task).__name__,
+                                    user=user,
+                                    hidden=hidden,
+                                    scheduled=task.scheduled,
+                                    descriptor=descriptor,
+                                    checkpoint=task.checkpoint)
+        with self.lock:
+            try:
+                self.session.add(entry)
+                self.session.commit()
+                task.journal_id = entry.id
+            except exc.SQLAlchemyError as ex:
+                self.session.rollback()
+                log.error("Can't add task to journal: {}".format(ex))
+
+    def update(self, task):
+        now = time.monotonic()
+        if now - self.last_update.get(task.journal_id, 0) < CHECKPOINT_INTERVAL:
+            return
+        self.last_update[task.journal_id] = now
+        with self.lock:
+            try:
+                self.session.query(ub.TaskJournalEntry).filter(ub.TaskJournalEntry.id == task.journal_id).update(
+                    {ub.TaskJournalEntry.checkpoint: task.checkpoint,
+                     ub.TaskJournalEntry.updated: datetime.now(timezone.utc)})
+                self.session.commit()
+            except exc.SQLAlchemyError as ex:
+                self.session.rollback()
+                log.error("Can't store checkpoint of task: {}".format(ex))
+
+    def remove(self, task):
+        self.delete(task.journal_id)
+        task.journal_id = None
+
+    def delete(self, entry_id):
+        self.last_update.pop(entry_id, None)
+        with self.lock:
+            try:
+                self.session.query(ub.TaskJournalEntry).filter(ub.TaskJournalEntry.id == entry_id).delete()
+                self.session.commit()
+            except exc.SQLAlchemyError as ex:
+                self.session.rollback()
+                log.error("Can't remove task from journal: {}".format(ex))
+
+    def pending(self):
+        with self.lock:
+            try:
+                return self.session.query(ub.TaskJournalEntry).order_by(ub.TaskJournalEntry.id).all()
+            except exc.SQLAlchemyError as ex:
+                self.session.rollback()
+                log.error("Can't read task journal: {}".format(ex))
+                return []
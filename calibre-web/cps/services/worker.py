@@ -20,15 +20,13 @@ import threading
 import abc
 import uuid
 import time
+import heapq
+import json
 
-try:
-    import queue
-except ImportError:
-    import Queue as queue
 from datetime import datetime
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 
-from cps import logger
+from cps import logger, metrics
 
 log = logger.create()
 
@@ -40,6 +38,37 @@ STAT_FINISH_SUCCESS = 3
 STAT_ENDED = 4
 STAT_CANCELLED = 5
 
+STAT_NAMES = {STAT_WAITING: "waiting", STAT_FAIL: "failed", STAT_STARTED: "started", STAT_FINISH_SUCCESS: "finished",
+              STAT_ENDED: "ended", STAT_CANCELLED: "cancelled"}
+
+task_duration = metrics.histogram("calibreweb_task_duration_seconds", "Run time of finished background tasks",
+                                  ("task", "status"),
+                                  buckets=(0.1, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0, 4 * 3600.0))
+task_queue_depth = metrics.gauge("calibreweb_task_queue_depth", "Background tasks waiting per lane", ("lane",))
+task_running = metrics.gauge("calibreweb_task_running", "Background tasks running per lane", ("lane",))
+
+# task 'lane' consts, every lane runs its tasks independent of the other lanes
+LANE_CONVERSION = 'conversion'
+LANE_MAIL = 'mail'
+LANE_THUMBNAILS = 'thumbnails'
+LANE_TTS = 'tts'
+LANE_MAINTENANCE = 'maintenance'
+
+# Number of tasks each lane runs in parallel unless configured otherwise
+DEFAULT_LANE_CONCURRENCY = OrderedDict([
+    (LANE_CONVERSION, 1),
+    (LANE_MAIL, 2),
+    (LANE_THUMBNAILS, 1),
+    (LANE_TTS, 1),
+    (LANE_MAINTENANCE, 1),
+])
+MAX_LANE_CONCURRENCY = 8
+
+# task 'priority' consts, within a lane tasks with lower values are started first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
 # Only retain this many tasks in dequeued list
 TASK_CLEANUP_TRIGGER = 20
 
@@ -53,14 +82,47 @@ def _get_main_thread():
     raise Exception("main thread not found?!")
 
 
-class ImprovedQueue(queue.Queue):
-    def to_list(self):
-        """
-        Returns a copy of all items in the queue without removing them.
-        """
+class TaskLane:
+    """Waiting tasks of one lane.
+
+    Tasks are kept in one priority heap per user, the next task is the most urgent head of all users. Users with
+    equally urgent tasks are served round-robin, so one user queueing a lot of tasks can't starve the others.
+    """
+
+    def __init__(self, name, concurrency):
+        self.name = name
+        self.concurrency = concurrency
+        self.runners = list()
+        self.pending = OrderedDict()
+        self.pending_keys = set()
+
+    def put(self, item):
+        heapq.heappush(self.pending.setdefault(item.user, list()), (item.task.priority, item.num, item))
+        if item.task.dedupe_key:
+            self.pending_keys.add(item.task.dedupe_key)
+
+    def is_pending(self, task):
+        return task.dedupe_key is not None and task.dedupe_key in self.pending_keys
+
+    def get(self):
+        best_user = None
+        best_priority = None
+        for user, items in self.pending.items():
+            if best_priority is None or items[0][0] < best_priority:
+                best_user = user
+                best_priority = items[0][0]
+        if best_user is None:
+            return None
+        items = self.pending.pop(best_user)
+        item = heapq.heappop(items)[2]
+        if items:
+            # move the user to the end of the rotation
+            self.pending[best_user] = items
+        self.pending_keys.discard(item.task.dedupe_key)
+        return item
 
-        with self.mutex:
-            return list(self.queue)
+    def to_list(self):
+        return [entry[2] for items in self.pending.values() for entry in items]
 
 
 # Class for all worker tasks in the background
@@ -79,30 +141,76 @@ class WorkerThread(threading.Thread):
         self.dequeued = list()
 
         self.doLock = threading.Lock()
-        self.queue = ImprovedQueue()
+        self.task_available = threading.Condition(self.doLock)
+        self.lanes = OrderedDict((name, TaskLane(name, concurrency))
+                                 for name, concurrency in DEFAULT_LANE_CONCURRENCY.items())
+        self.journal = None
         self.num = 0
+        metrics.register_collector(self._collect_metrics)
         self.start()
 
     @classmethod
     def add(cls, user, task, hidden=False):
         ins = cls.get_instance()
-        ins.num += 1
         username = user if user is not None else 'System'
-        log.debug("Add Task for user: {} - {}".format(username, task))
-        ins.queue.put(QueuedTask(
-            num=ins.num,
-            user=username,
-            added=datetime.now(),
-            task=task,
-            hidden=hidden
-        ))
+        # app.db is written outside of the lock, waiting for a locked database must not stall the lanes
+        journal = ins.journal
+        if journal and not task.journal_id:
+            journal.record(task, username, hidden)
+        with ins.task_available:
+            lane = ins._get_lane(task)
+            duplicate = lane.is_pending(task)
+            if not duplicate:
+                log.debug("Add Task for user: {} - {}".format(username, task))
+                ins.num += 1
+                lane.put(QueuedTask(
+                    num=ins.num,
+                    user=username,
+                    added=datetime.now(),
+                    task=task,
+                    hidden=hidden
+                ))
+                ins.task_available.notify_all()
+        if duplicate:
+            log.debug("Skip Task for user: {} - {}, identical task is already waiting".format(username, task))
+            if journal and task.journal_id:
+                journal.remove(task)
 
     @property
     def tasks(self):
         with self.doLock:
-            tasks = self.queue.to_list() + self.dequeued
+            tasks = [item for lane in self.lanes.values() for item in lane.to_list()] + self.dequeued
             return sorted(tasks, key=lambda x: x.num)
 
+    def configure_lanes(self, concurrency):
+        """Sets the number of parallel tasks per lane, lanes missing in concurrency keep their current value"""
+        with self.task_available:
+            for name, value in concurrency.items():
+                if name in self.lanes and value:
+                    self.lanes[name].concurrency = max(1, min(int(value), MAX_LANE_CONCURRENCY))
+            # wake up idle runners, so surplus ones can quit
+            self.task_available.notify_all()
+
+    def resume(self, journal):
+        """Enables the task journal and queues all tasks which were waiting or running at the last shutdown"""
+        self.journal = journal
+        for entry in journal.pending():
+            task_class = CalibreTask.registry.get(entry.task_class)
+            try:
+                task = task_class.from_descriptor(entry.descriptor)
+            except Exception as ex:
+                log.error("Can't resume {} task: {}".format(entry.task_class, ex))
+                journal.delete(entry.id)
+                continue
+            task.journal_id = entry.id
+            task.checkpoint = entry.checkpoint
+            task.scheduled = entry.scheduled
+            log.info("Resume Task for user: {} - {}".format(entry.user, task))
+            self.add(entry.user, task, entry.hidden)
+
+    def _get_lane(self, task):
+        return self.lanes.get(task.lane, self.lanes[LANE_MAINTENANCE])
+
     def cleanup_tasks(self):
         with self.doLock:
             dead = []
@@ -120,22 +228,36 @@ class WorkerThread(threading.Thread):
 
             self.dequeued = sorted(ret, key=lambda y: y.num)
 
-    # Main thread loop starting the different tasks
+    # Main thread loop keeping the runners of the different lanes alive
     def run(self):
         main_thread = _get_main_thread()
         while main_thread.is_alive():
-            try:
-                # this blocks until something is available. This can cause issues when the main thread dies - this
-                # thread will remain alive. We implement a timeout to unblock every second which allows us to check if
-                # the main thread is still alive.
-                # We don't use a daemon here because we don't want the tasks to just be abruptly halted, leading to
-                # possible file / database corruption
-                item = self.queue.get(timeout=1)
-            except queue.Empty:
-                time.sleep(1)
-                continue
-
             with self.doLock:
+                for lane in self.lanes.values():
+                    lane.runners = [runner for runner in lane.runners if runner.is_alive()]
+                    for __ in range(lane.concurrency - len(lane.runners)):
+                        runner = threading.Thread(target=self._run_lane, args=(lane,),
+                                                  name="Worker-{}".format(lane.name))
+                        lane.runners.append(runner)
+                        runner.start()
+            time.sleep(1)
+
+    # Runner loop starting the tasks of one lane
+    def _run_lane(self, lane):
+        main_thread = _get_main_thread()
+        while main_thread.is_alive():
+            with self.task_available:
+                # lane concurrency got reduced, surplus runners quit between tasks
+                if len(lane.runners) > lane.concurrency:
+                    lane.runners.remove(threading.current_thread())
+                    return
+                item = lane.get()
+                if item is None:
+                    # We implement a timeout to unblock every second which allows us to check if the main thread is
+                    # still alive. We don't use daemon threads here because we don't want the tasks to just be
+                    # abruptly halted, leading to possible file / database corruption
+                    self.task_available.wait(timeout=1)
+                    continue
                 # add to list so that in-progress tasks show up
                 self.dequeued.append(item)
 
@@ -147,12 +269,29 @@ class WorkerThread(threading.Thread):
             if item.task.stat is STAT_WAITING:
                 # CalibreTask.start() should wrap all exceptions in its own error handling
                 item.task.start(self)
+                if item.task.start_time:
+                    task_duration.observe(item.task.runtime.total_seconds(), item.task.__class__.__name__,
+                                          STAT_NAMES.get(item.task.stat, "unknown"))
+
+            # the task is finished (or was cancelled while waiting), no need to resume it after a restart
+            if self.journal and item.task.journal_id:
+                self.journal.remove(item.task)
 
             # remove self_cleanup tasks and hidden "System Tasks" from list
             if item.task.self_cleanup or item.hidden:
-                self.dequeued.remove(item)
+                with self.doLock:
+                    if item in self.dequeued:
+                        self.dequeued.remove(item)
 
-            self.queue.task_done()
+    def _collect_metrics(self):
+        with self.doLock:
+            running = dict.fromkeys(self.lanes, 0)
+            for item in self.dequeued:
+                if item.task.stat == STAT_STARTED and item.task.lane in running:
+                    running[item.task.lane] += 1
+            for name, lane in self.lanes.items():
+                task_queue_depth.set(sum(len(items) for items in lane.pending.values()), name)
+                task_running.set(running[name], name)
 
     def end_task(self, task_id):
         ins = self.get_instance()
@@ -164,6 +303,17 @@ class WorkerThread(threading.Thread):
 class CalibreTask:
     __metaclass__ = abc.ABCMeta
 
+    # lane the task is queued in and its urgency within that lane, overwritten by the different tasks
+    lane = LANE_MAINTENANCE
+    priority = PRIORITY_NORMAL
+
+    # all task classes by name, used to recreate journaled tasks after a restart
+    registry = dict()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        CalibreTask.registry[cls.__name__] = cls
+
     def __init__(self, message):
         self._progress = 0
         self.stat = STAT_WAITING
@@ -174,6 +324,9 @@ class CalibreTask:
         self.id = uuid.uuid4()
         self.self_cleanup = False
         self._scheduled = False
+        self.journal_id = None
+        self.checkpoint = None
+        self._dedupe_key = None
 
     @abc.abstractmethod
     def run(self, worker_thread):
@@ -190,6 +343,24 @@ class CalibreTask:
         """Does this task gracefully handle being cancelled (STAT_ENDED, STAT_CANCELLED)?"""
         raise NotImplementedError
 
+    def to_descriptor(self):
+        """Returns the (json serializable) arguments needed to recreate this task after a restart
+
+        Tasks returning None are neither journaled nor resumed
+        """
+        return None
+
+    @classmethod
+    def from_descriptor(cls, descriptor):
+        return cls(**descriptor)
+
+    def save_checkpoint(self, checkpoint):
+        """Stores how far the task got, a resumed task finds the value in self.checkpoint"""
+        self.checkpoint = checkpoint
+        journal = WorkerThread.get_instance().journal
+        if journal and self.journal_id:
+            journal.update(self)
+
     def start(self, *args):
         self.start_time = datetime.now()
         self.stat = STAT_STARTED
@@ -250,6 +421,15 @@ class CalibreTask:
     def self_cleanup(self, is_self_cleanup):
         self._self_cleanup = is_self_cleanup
 
+    @property
+    def dedupe_key(self):
+        """Identical waiting tasks share the same key, tasks without descriptor are never considered identical"""
+        if self._dedupe_key is None:
+            descriptor = self.to_descriptor()
+            if descriptor is not None:
+                self._dedupe_key = "{}:{}".format(type(self).__name__, json.dumps(descriptor, sort_keys=True))
+        return self._dedupe_key
+
     @property
     def scheduled(self):
         return self._scheduled
@@ -20,7 +20,6 @@
 #  You should have received a copy of the GNU General Public License
 #  along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-import sys
 from datetime import datetime, timezone
 
 from flask import Blueprint, flash, redirect, request, url_for, abort
@@ -30,7 +29,7 @@ from sqlalchemy.exc import InvalidRequestError, OperationalError
 from sqlalchemy.sql.expression import func, true
 
 from . import calibre_db, config, db, logger, ub
-from .render_template import render_title_template
+from .render_template import render_title_template, stream_title_template
 from .usermanagement import login_required_if_no_ano, user_login_required
 
 log = logger.create()
@@ -449,18 +448,7 @@ def render_show_shelf(shelf_type, shelf_id, page_no, sort_param):
                     change_shelf_order(shelf_id, [db.Books.author_sort.desc(),
                                                   db.Series.name.desc(),
                                                   db.Books.series_index.desc()])
-            page = "shelf.html"
-            pagesize = 0
-        else:
-            pagesize = sys.maxsize
-            page = 'shelfdown.html'
 
-        result, __, pagination = calibre_db.fill_indexpage(page_no, pagesize,
-                                                           db.Books,
-                                                           ub.BookShelf.shelf == shelf_id,
-                                                           [ub.BookShelf.order.asc()],
-                                                           True, config.config_read_column,
-                                                           ub.BookShelf, ub.BookShelf.book_id == db.Books.id)
         # delete shelf entries where book is not existent anymore, can happen if book is deleted outside calibre-web
         wrong_entries = calibre_db.session.query(ub.BookShelf) \
             .join(db.Books, ub.BookShelf.book_id == db.Books.id, isouter=True) \
@@ -475,7 +463,28 @@ def render_show_shelf(shelf_type, shelf_id, page_no, sort_param):
                 log.error_or_exception("Settings Database error: {}".format(e))
                 flash(_("Oops! Database Error: %(error)s.", error=e.orig), category="error")
 
-        return render_title_template(page,
+        if shelf_type != 1:
+            # the download page lists the whole shelf, it's rendered while the books are fetched
+            result = calibre_db.stream_indexpage(db.Books,
+                                                 ub.BookShelf.shelf == shelf_id,
+                                                 [ub.BookShelf.order.asc()],
+                                                 True, config.config_read_column,
+                                                 ub.BookShelf, ub.BookShelf.book_id == db.Books.id)
+            return stream_title_template('shelfdown.html',
+                                         entries=result,
+                                         title=_("Shelf: '%(name)s'", name=shelf.name),
+                                         shelf=shelf,
+                                         page="shelf",
+                                         status=status,
+                                         order=sort_param)
+
+        result, __, pagination = calibre_db.fill_indexpage(page_no, 0,
+                                                           db.Books,
+                                                           ub.BookShelf.shelf == shelf_id,
+                                                           [ub.BookShelf.order.asc()],
+                                                           True, config.config_read_column,
+                                                           ub.BookShelf, ub.BookShelf.book_id == db.Books.id)
+        return render_title_template("shelf.html",
                                      entries=result,
                                      pagination=pagination,
                                      title=_("Shelf: '%(name)s'", name=shelf.name),
@@ -113,6 +113,27 @@ $(function () {
         }
     }
 
+    // metadata found for this book by the scheduled metadata search
+    function showSuggestions(url) {
+        $("#suggestion-list").empty();
+        $("#meta-suggestions").addClass("hidden");
+        $.ajax({
+            url: url,
+            type: "get",
+            dataType: "json",
+            success: function success(data) {
+                data.forEach(function(book) {
+                    var $book = $(templates.bookResult(book));
+                    $book.find("img").on("click", function () {
+                        populateForm(book);
+                    });
+                    $("#suggestion-list").append($book);
+                });
+                $("#meta-suggestions").toggleClass("hidden", !data.length);
+            }
+        });
+    }
+
     function populate_provider() {
         $("#metadata_provider").empty();
         $.ajax({
@@ -172,6 +193,7 @@ $(function () {
 
     $("#get_meta").click(function () {
         populate_provider();
+        showSuggestions($(this).data("suggestions"));
         var bookTitle = $("#title").val();
         $("#keyword").val(bookTitle);
         keyword = bookTitle;
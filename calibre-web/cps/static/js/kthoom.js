@@ -63,6 +63,8 @@ var imageFiles = [];
 var imageFilenames = [];
 var totalImages = 0;
 var prevScrollPosition = 0;
+// Pages loaded ahead of the current one, only used if the server sends the pages one by one
+var prefetchPages = 0;
 
 var settings = {
     hflip: false,
@@ -260,6 +262,41 @@ function loadFromArrayBuffer(ab) {
     });
 }
 
+// The server sends an index of all pages, the pages themselves are loaded around the current one
+function loadFromPageIndex(index) {
+    prefetchPages = index.prefetch;
+    totalImages = index.pages.length;
+    index.pages.forEach(function(page, i) {
+        imageFilenames.push(page.name);
+        imageFiles.push({filename: page.name, mimeType: page.mimetype, dataURI: page.url, loaded: false});
+        $("#thumbnails").append(
+            "<li>" +
+            "<a data-page='" + (i + 1) + "'>" +
+            "<img loading='lazy' src='" + page.preview + "'/>" +
+            "<span>" + (i + 1) + "</span>" +
+            "</a>" +
+            "</li>"
+        );
+        drawCanvas();
+    });
+    updateProgress(100);
+    updateDirectionButtons();
+    updatePage();
+}
+
+function loadPageWindow() {
+    if (!prefetchPages) {
+        return;
+    }
+    var last = Math.min(currentImage + prefetchPages, imageFiles.length - 1);
+    for (var i = Math.max(currentImage - 1, 0); i <= last; i++) {
+        if (!imageFiles[i].loaded) {
+            imageFiles[i].loaded = true;
+            setImage(imageFiles[i].dataURI, $(".mainImage")[i]);
+        }
+    }
+}
+
 function scrollTocToActive() {
     $(".page").text((currentImage + 1 ) + "/" + totalImages);
 
@@ -279,6 +316,7 @@ function scrollTocToActive() {
 }
 
 function updatePage() {
+    loadPageWindow();
     scrollTocToActive();
     scrollCurrentImageIntoView();
     updateProgress();
@@ -423,6 +461,9 @@ function setImage(url, _canvas) {
 // reloadImages is a slow process when multiple images are involved. Only used when rotating/mirroring
 function reloadImages() {
     for(i=0; i < imageFiles.length; i++) {
+        if (imageFiles[i].loaded === false) {
+            continue;
+        }
         setImage(imageFiles[i].dataURI, $(".mainImage")[i]);
     }
 }
@@ -659,7 +700,7 @@ function updateArrows() {
     }
 };
 
-function init(filename) {
+function loadArchive(filename) {
     var request = new XMLHttpRequest();
     request.open("GET", filename);
     request.responseType = "arraybuffer";
@@ -670,10 +711,21 @@ function init(filename) {
             console.warn(request.statusText, request.responseText);
         }
     });
+    request.send();
+}
+
+// pageIndex is the url of the page index, without it the whole archive is unpacked in the browser
+function init(filename, pageIndex) {
     kthoom.loadSettings();
     setTheme();
     updateScale();
-    request.send();
+    if (pageIndex) {
+        $.getJSON(pageIndex).done(loadFromPageIndex).fail(function () {
+            loadArchive(filename);
+        });
+    } else {
+        loadArchive(filename);
+    }
     initProgressClick();
     document.body.className += /AppleWebKit/.test(navigator.userAgent) ? " webkit" : "";
 
@@ -818,6 +870,7 @@ function init(filename) {
                         currentImage = imageFiles.length - 1;
                     }
                     console.log(currentImage);
+                    loadPageWindow();
                     scrollTocToActive();
                     updateProgress();
                 }
@@ -828,6 +881,7 @@ function init(filename) {
                 if (currentImageOffset(currentImage - 1) >= 0) {
                     currentImage = Math.floor((imageFiles.length) / (viewLength-viewLength/(imageFiles.length)) * scroll, 0);
                     console.log(currentImage);
+                    loadPageWindow();
                     scrollTocToActive();
                     updateProgress();
                 }
@@ -201,26 +201,61 @@ $(function() {
         }
     });
 
+    function editSelectedData(dryRun) {
+        return JSON.stringify({
+            "selections": selections,
+            "title": $("#title_input").val(),
+            "title_sort": $("#title_sort_input").val(),
+            "author_sort": $("#author_sort_input").val(),
+            "authors": $("#authors_input").val(),
+            "categories": $("#categories_input").val(),
+            "series": $("#series_input").val(),
+            "languages": $("#languages_input").val(),
+            "publishers": $("#publishers_input").val(),
+            "comments": $("#comments_input").val().toString(),
+            "checkA": $('#autoupdate_authorsort').prop('checked'),
+            "checkT": $('#autoupdate_titlesort').prop('checked'),
+            "dry_run": dryRun
+        });
+    }
+
+    $("#edit_selected_preview").click(function(event) {
+        $.ajax({
+            method:"post",
+            contentType: "application/json; charset=utf-8",
+            dataType: "json",
+            url: getPath() + "/ajax/editselectedbooks",
+            data: editSelectedData(true),
+            success: function success(data) {
+                var changes = $("#edit_selected_changes").empty();
+                if (!data.changes) {
+                    return;
+                }
+                data.errors.forEach(function(item) {
+                    changes.append($('<p class="text-danger"></p>').text(item.msg));
+                });
+                data.changes.forEach(function(item) {
+                    changes.append($("<p></p>").text(item.title + ": " + item.field + ": " + item.old + " \u2192 " + item.new));
+                });
+                if (data.count > data.changes.length) {
+                    changes.append($("<p></p>").text("\u2026 (" + data.count + ")"));
+                }
+            }
+        });
+    });
+
+    $("#edit_selected_abort").click(function() {
+        $("#edit_selected_changes").empty();
+    });
+
     $("#edit_selected_confirm").click(function(event) {
+        $("#edit_selected_changes").empty();
         $.ajax({
             method:"post",
             contentType: "application/json; charset=utf-8",
             dataType: "json",
             url: getPath() + "/ajax/editselectedbooks",
-            data: JSON.stringify({
-                "selections": selections,
-                "title": $("#title_input").val(),
-                "title_sort": $("#title_sort_input").val(),
-                "author_sort": $("#author_sort_input").val(),
-                "authors": $("#authors_input").val(),
-                "categories": $("#categories_input").val(),
-                "series": $("#series_input").val(),
-                "languages": $("#languages_input").val(),
-                "publishers": $("#publishers_input").val(),
-                "comments": $("#comments_input").val().toString(),
-                "checkA": $('#autoupdate_authorsort').prop('checked'),
-                "checkT": $('#autoupdate_titlesort').prop('checked')
-            }),
+            data: editSelectedData(false),
             success: function success(data) {
                 let result = "";
                 $("#books-table").bootstrapTable("refresh");
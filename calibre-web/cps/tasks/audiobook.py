@@ -22,7 +22,7 @@ from time import time
 from flask_babel import lazy_gettext as N_, gettext as _
 from sqlalchemy.exc import SQLAlchemyError
 
-from cps.services.worker import CalibreTask
+from cps.services.worker import CalibreTask, LANE_TTS
 from cps import db, app, logger, config
 from cps.subproc_wrapper import process_open
 from cps.ub import init_db_thread
@@ -36,6 +36,7 @@ class TaskGenerateAudiobook(CalibreTask):
     Background task to generate an audiobook from a book's text using macOS 'say' command.
     The audiobook is split into multiple parts for easier handling.
     """
+    lane = LANE_TTS
 
     def __init__(self, book_id, book_format, voice='Alex', words_per_part=5000, user=None):
         """
@@ -57,6 +58,13 @@ class TaskGenerateAudiobook(CalibreTask):
         self.title = ""
         self.worker_thread = None
 
+    def to_descriptor(self):
+        return {'book_id': self.book_id,
+                'book_format': self.book_format,
+                'voice': self.voice,
+                'words_per_part': self.words_per_part,
+                'user': self.user}
+
     def run(self, worker_thread):
         """Execute the audiobook generation task"""
         self.worker_thread = worker_thread
@@ -21,7 +21,7 @@ import datetime
 from flask_babel import lazy_gettext as N_
 from sqlalchemy.sql.expression import or_
 
-from cps import logger, file_helper, ub
+from cps import logger, file_helper, ub, db, app, config
 from cps.services.worker import CalibreTask
 
 
@@ -46,15 +46,44 @@ class TaskClean(CalibreTask):
             self.app_db_session.query(ub.User_Sessions).filter(or_(ub.User_Sessions.expiry < expiry,
                                                                ub.User_Sessions.expiry == None)).delete()
             self.app_db_session.commit()
+            ub.invalidate_user_sessions()
         except Exception as ex:
             self.log.debug('Error deleting expired session keys: ' + str(ex))
             self._handleError('Error deleting expired session keys: ' + str(ex))
             self.app_db_session.rollback()
             return
+        # delete downloads and download counters of books which are no longer in the library
+        try:
+            self.delete_orphaned_downloads()
+        except Exception as ex:
+            self.log.debug('Error deleting orphaned downloads: ' + str(ex))
+            self._handleError('Error deleting orphaned downloads: ' + str(ex))
+            return
 
         self._handleSuccess()
         self.app_db_session.remove()
 
+    @staticmethod
+    def delete_orphaned_downloads():
+        # opening an unconfigured library would invalidate the configuration from this thread
+        if not config.db_configured:
+            return
+        # app.db is attached to the calibre session, so both tables can be compared in one statement
+        with app.app_context():
+            calibre_db = db.CalibreDB(app)
+            if not calibre_db.session:
+                return
+            try:
+                book_ids = calibre_db.session.query(db.Books.id)
+                calibre_db.session.query(ub.Downloads).filter(ub.Downloads.book_id.notin_(book_ids))\
+                    .delete(synchronize_session=False)
+                calibre_db.session.query(ub.BookDownloadCount).filter(ub.BookDownloadCount.book_id.notin_(book_ids))\
+                    .delete(synchronize_session=False)
+                calibre_db.session.commit()
+            except Exception:
+                calibre_db.session.rollback()
+                raise
+
     @property
     def name(self):
         return "Clean up"
@@ -27,7 +27,7 @@ from uuid import uuid4
 from sqlalchemy.exc import SQLAlchemyError
 from flask_babel import lazy_gettext as N_
 
-from cps.services.worker import CalibreTask
+from cps.services.worker import CalibreTask, LANE_CONVERSION
 from cps import db, app
 from cps import logger, config
 from cps.subproc_wrapper import process_open
@@ -47,6 +47,8 @@ current_milli_time = lambda: int(round(time() * 1000))
 
 
 class TaskConvert(CalibreTask):
+    lane = LANE_CONVERSION
+
     def __init__(self, file_path, book_id, task_message, settings, ereader_mail, user=None):
         super(TaskConvert, self).__init__(task_message)
         self.worker_thread = None
@@ -59,6 +61,21 @@ class TaskConvert(CalibreTask):
 
         self.results = dict()
 
+    def to_descriptor(self):
+        # mail server credentials are taken from the current configuration when resuming
+        return {'file_path': self.file_path,
+                'book_id': self.book_id,
+                'task_message': str(self.message),
+                'settings': {k: v for k, v in self.settings.items() if not k.startswith('mail_')},
+                'ereader_mail': self.ereader_mail,
+                'user': self.user}
+
+    @classmethod
+    def from_descriptor(cls, descriptor):
+        if descriptor['ereader_mail']:
+            descriptor['settings'].update(config.get_mail_settings())
+        return cls(**descriptor)
+
     def run(self, worker_thread):
         df_cover = None
         cur_book = None
@@ -82,9 +99,9 @@ class TaskConvert(CalibreTask):
                                                       cur_book.path, "cover.jpg")
                     if not os.path.exists(os.path.join(config.get_book_path(), cur_book.path)):
                         os.makedirs(os.path.join(config.get_book_path(), cur_book.path))
-                    df.GetContentFile(datafile)
+                    gdriveutils.copyFileToLocal(df, datafile)
                     if df_cover:
-                        df_cover.GetContentFile(datafile_cover)
+                        gdriveutils.copyFileToLocal(df_cover, datafile_cover)
                     # worker_db.session.close()
                 else:
                     # ToDo Include cover in error handling
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from flask_babel import lazy_gettext as N_
+
+from cps import config, db, logger, ub, app
+from cps.services.worker import CalibreTask, STAT_CANCELLED, STAT_ENDED, PRIORITY_LOW
+from cps.embed_helper import do_calibre_export
+from cps.export_cache import export_cache, artifact_key, source_state
+
+# number of most downloaded books whose formats are exported in advance
+WARM_BOOKS = 50
+
+
+class TaskWarmExportCache(CalibreTask):
+    """Exports the formats of the most downloaded books with embedded metadata into the export cache
+
+    Kepub files embed metadata in the language of the downloading user and are exported on first download only,
+    the same applies to libraries on Google Drive, as their files would have to be fetched first
+    """
+    priority = PRIORITY_LOW
+
+    def __init__(self, task_message=N_('Prepare downloads of popular books')):
+        super(TaskWarmExportCache, self).__init__(task_message)
+        self.log = logger.create()
+
+    def run(self, worker_thread):
+        if (not config.config_embed_metadata or not config.config_binariesdir or config.config_use_google_drive
+                or not export_cache.max_size):
+            self._handleSuccess()
+            return
+        with app.app_context():
+            calibre_dbb = db.CalibreDB(app)
+            try:
+                hot_books = (calibre_dbb.session.query(ub.BookDownloadCount.book_id)
+                             .order_by(ub.BookDownloadCount.count.desc()).limit(WARM_BOOKS))
+                books = calibre_dbb.session.query(db.Books).filter(db.Books.id.in_(hot_books)).all()
+                for index, book in enumerate(books):
+                    self.export_book(calibre_dbb.session, book)
+                    self.progress = (1.0 / len(books)) * (index + 1)
+                    if self.stat == STAT_CANCELLED or self.stat == STAT_ENDED:
+                        self.log.info('Warming of export cache has been stopped.')
+                        return
+                self._handleSuccess()
+            except Exception as ex:
+                self.log.debug('Error warming export cache: ' + str(ex))
+                self._handleError('Error warming export cache: ' + str(ex))
+
+    def export_book(self, session, book):
+        for data in book.data:
+            book_format = data.format.lower()
+            if book_format == "kepub":
+                continue
+            state = source_state(os.path.join(config.get_book_path(), book.path, data.name + "." + book_format))
+            if state is None:
+                continue
+            key = artifact_key(session, book, book_format, state)
+            if not export_cache.contains(key + "." + book_format):
+                export_cache.get(key, book_format, lambda: do_calibre_export(book.id, book_format))
+
+    @property
+    def name(self):
+        return "Warm export cache"
+
+    @property
+    def is_cancellable(self):
+        return True
@@ -29,7 +29,7 @@ from email.utils import formatdate, parseaddr, make_msgid
 from email.generator import Generator
 from flask_babel import lazy_gettext as N_
 
-from cps.services.worker import CalibreTask
+from cps.services.worker import CalibreTask, LANE_MAIL
 from cps.services import gmail
 from cps.embed_helper import do_calibre_export
 from cps import logger, config
@@ -110,6 +110,8 @@ class EmailSSL(EmailBase, smtplib.SMTP_SSL):
 
 
 class TaskEmail(CalibreTask):
+    lane = LANE_MAIL
+
     def __init__(self, subject, filepath, attachment, settings, recipient, task_message, text, id=0, internal=False):
         super(TaskEmail, self).__init__(task_message)
         self.subject = subject
@@ -122,6 +124,25 @@ class TaskEmail(CalibreTask):
         self.book_id = id
         self.results = dict()
 
+    def to_descriptor(self):
+        # plain text mails (registration, password reset, test) may contain passwords, they are not persisted
+        if not self.attachment:
+            return None
+        # mail server credentials are taken from the current configuration when resuming
+        return {'subject': str(self.subject),
+                'filepath': self.filepath,
+                'attachment': self.attachment,
+                'settings': {k: v for k, v in self.settings.items() if not k.startswith('mail_')},
+                'recipient': self.recipient,
+                'task_message': str(self.message),
+                'text': str(self.text),
+                'id': self.book_id}
+
+    @classmethod
+    def from_descriptor(cls, descriptor):
+        descriptor['settings'].update(config.get_mail_settings())
+        return cls(**descriptor)
+
     # from calibre code:
     # https://github.com/kovidgoyal/calibre/blob/731ccd92a99868de3e2738f65949f19768d9104c/src/calibre/utils/smtp.py#L60
     def get_msgid_domain(self):
@@ -253,7 +274,7 @@ class TaskEmail(CalibreTask):
                 datafile = os.path.join(calibre_path, book_path, filename)
                 if not os.path.exists(os.path.join(calibre_path, book_path)):
                     os.makedirs(os.path.join(calibre_path, book_path))
-                df.GetContentFile(datafile)
+                gdriveutils.copyFileToLocal(df, datafile)
             else:
                 return None
             if config.config_binariesdir and config.config_embed_metadata:
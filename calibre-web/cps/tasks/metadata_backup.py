@@ -39,6 +39,13 @@ class TaskBackupMetadata(CalibreTask):
         self.translated_title = translated_title
         self.set_dirty = set_dirty
 
+    def to_descriptor(self):
+        # Books are removed from the dirtied list one by one, a resumed backup continues where it stopped
+        return {'export_language': str(self.export_language),
+                'translated_title': str(self.translated_title),
+                'set_dirty': self.set_dirty,
+                'task_message': str(self.message)}
+
     def run(self, worker_thread):
         if self.set_dirty:
             self.set_all_books_dirty()
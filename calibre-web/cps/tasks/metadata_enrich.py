@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import time
+from dataclasses import asdict
+from datetime import datetime, timedelta, timezone
+from difflib import SequenceMatcher
+
+from flask_babel import lazy_gettext as N_
+from sqlalchemy import or_
+
+from cps import config, db, logger, ub, app, helper
+from cps.clean_html import clean_string
+from cps.metadata_broker import background_broker
+from cps.services.worker import CalibreTask, STAT_CANCELLED, STAT_ENDED, LANE_MAINTENANCE, PRIORITY_LOW
+
+# books loaded from the library at once
+BATCH_SIZE = 200
+# seconds between two searches of the same provider, providers not listed use DEFAULT_PROVIDER_INTERVAL
+PROVIDER_INTERVALS = {
+    'amazon': 10,
+    'googlescholar': 30,
+}
+DEFAULT_PROVIDER_INTERVAL = 2
+# identifiers shared with the book make a match certain, other matches need a similar title and author
+SCORE_IDENTIFIER = 1.0
+STAGE_SCORE = 0.8
+STAGED_PER_BOOK = 3
+# books which were searched are skipped by the following runs for this many days
+SEARCH_RETRY_DAYS = 30
+
+
+def _normalize(text):
+    return " ".join(re.sub(r"[^\w\s]", " ", text or "").casefold().split())
+
+
+def _normalize_identifier(value):
+    return re.sub(r"[^0-9a-z]", "", str(value).casefold())
+
+
+def match_score(book, record):
+    book_identifiers = {identifier.type.lower(): _normalize_identifier(identifier.val)
+                        for identifier in book.identifiers}
+    for id_type, value in (record.identifiers or {}).items():
+        if value and book_identifiers.get(id_type.lower()) == _normalize_identifier(value):
+            return SCORE_IDENTIFIER
+    score = SequenceMatcher(None, _normalize(book.title), _normalize(record.title)).ratio()
+    book_authors = set(word for author in book.authors for word in _normalize(author.name).split())
+    record_authors = set(word for author in record.authors or [] for word in _normalize(author).split())
+    # a record without any author of the book counts half
+    return score if book_authors & record_authors else score / 2
+
+
+class TaskEnrichMetadata(CalibreTask):
+    """Searches the metadata providers for books without cover, description or identifiers
+
+    Matches sharing an identifier with the book fill the missing fields if apply is set, all other good matches are
+    staged as suggestions, which are shown in the metadata dialog of the book. Each provider is queried at most once
+    per interval, books are searched with the providers available at that moment. Every search is recorded, so the
+    next scheduled run continues with the books which weren't searched recently
+    """
+    lane = LANE_MAINTENANCE
+    priority = PRIORITY_LOW
+
+    def __init__(self, apply=False, task_message=N_('Fetch missing metadata')):
+        super(TaskEnrichMetadata, self).__init__(task_message)
+        self.log = logger.create()
+        self.apply = apply
+        self.next_search = dict()
+        self.applied = 0
+        self.staged = 0
+
+    def to_descriptor(self):
+        return {'apply': self.apply}
+
+    def run(self, worker_thread):
+        # importing the providers at module level would load the metadata blueprint with the worker
+        from cps.search_metadata import cl as providers
+        if not providers:
+            self._handleSuccess()
+            return
+        self.app_db_session = ub.get_new_session_instance()
+        with app.app_context():
+            calibre_dbb = db.CalibreDB(app)
+            try:
+                query = self.missing_metadata(calibre_dbb.session)
+                total = query.count()
+                done = 0
+                while True:
+                    # a resumed task continues after the last book it processed
+                    book_ids = [book_id for book_id, in query.with_entities(db.Books.id)
+                                .filter(db.Books.id > (self.checkpoint or 0)).order_by(db.Books.id)
+                                .limit(BATCH_SIZE)]
+                    if not book_ids:
+                        break
+                    # books searched by an earlier run, with or without result, wait for SEARCH_RETRY_DAYS
+                    searched = self.recently_searched(book_ids)
+                    pending = [book_id for book_id in book_ids if book_id not in searched]
+                    books = {book.id: book for book in query.filter(db.Books.id.in_(pending))} if pending else {}
+                    for book_id in book_ids:
+                        if book_id in books:
+                            self.enrich_book(calibre_dbb, providers, books[book_id])
+                            self.record_search(book_id)
+                        self.save_checkpoint(book_id)
+                        done += 1
+                        self.progress = min(1.0, done / max(total, 1))
+                        if self.stat == STAT_CANCELLED or self.stat == STAT_ENDED:
+                            self.log.info('Metadata enrichment has been stopped.')
+                            return
+                    calibre_dbb.session.expunge_all()
+                self.message = N_('Applied metadata to %(applied)s books, %(staged)s suggestions to review',
+                                  applied=self.applied, staged=self.staged)
+                self._handleSuccess()
+            except Exception as ex:
+                self.log.error_or_exception(ex)
+                self._handleError('Error fetching missing metadata: ' + str(ex))
+            finally:
+                self.app_db_session.remove()
+
+    @staticmethod
+    def missing_metadata(session):
+        return (session.query(db.Books)
+                .filter(or_(db.Books.has_cover == 0,
+                            ~db.Books.comments.any(),
+                            ~db.Books.identifiers.any())))
+
+    def recently_searched(self, book_ids):
+        retry = datetime.now(timezone.utc) - timedelta(days=SEARCH_RETRY_DAYS)
+        return set(book_id for book_id, in self.app_db_session.query(ub.MetadataSearch.book_id)
+                   .filter(ub.MetadataSearch.book_id.in_(book_ids), ub.MetadataSearch.searched > retry))
+
+    def record_search(self, book_id):
+        self.app_db_session.merge(ub.MetadataSearch(book_id=book_id, searched=datetime.now(timezone.utc)))
+        self.app_db_session.commit()
+
+    def ready_providers(self, providers):
+        """Returns the providers which may be searched now, waits for the next one if none may"""
+        now = time.monotonic()
+        ready = [provider for provider in providers if self.next_search.get(provider.__id__, 0) <= now]
+        if not ready:
+            time.sleep(max(0, min(self.next_search.values()) - now))
+            return self.ready_providers(providers)
+        for provider in ready:
+            self.next_search[provider.__id__] = now + PROVIDER_INTERVALS.get(provider.__id__,
+                                                                             DEFAULT_PROVIDER_INTERVAL)
+        return ready
+
+    def enrich_book(self, calibre_dbb, providers, book):
+        search = book.title
+        if book.authors:
+            search += " " + book.authors[0].name
+        records = background_broker.search(self.ready_providers(providers), search, "",
+                                           config.config_default_locale)
+        scored = sorted(((match_score(book, record), record) for record in records),
+                        key=lambda scored_record: scored_record[0], reverse=True)
+        if scored and scored[0][0] >= SCORE_IDENTIFIER and self.apply:
+            if self.apply_record(calibre_dbb, book, scored[0][1]):
+                self.applied += 1
+            return
+        candidates = [(score, record) for score, record in scored if score >= STAGE_SCORE][:STAGED_PER_BOOK]
+        if candidates:
+            self.stage(book.id, candidates)
+
+    def stage(self, book_id, candidates):
+        self.app_db_session.query(ub.MetadataSuggestion).filter(ub.MetadataSuggestion.book_id == book_id).delete()
+        for score, record in candidates:
+            self.app_db_session.add(ub.MetadataSuggestion(book_id=book_id, provider=record.source.id, score=score,
+                                                          record=asdict(record)))
+        self.app_db_session.commit()
+        self.staged += len(candidates)
+
+    def apply_record(self, calibre_dbb, book, record):
+        """Fills the fields of the book which are empty, existing metadata is never changed"""
+        modified = False
+        if not book.has_cover and record.cover and record.cover.startswith("http"):
+            result, error = helper.save_cover_from_url(record.cover, book.path)
+            if result is True:
+                book.has_cover = 1
+                modified = True
+                helper.replace_cover_thumbnail_cache(book.id)
+            else:
+                self.log.debug("Cover of book %s not saved: %s", book.id, error)
+        if not book.comments and record.description:
+            book.comments.append(db.Comments(comment=clean_string(record.description, book.id), book=book.id))
+            modified = True
+        present = set(identifier.type.lower() for identifier in book.identifiers)
+        for id_type, value in (record.identifiers or {}).items():
+            if value and id_type.lower() not in present:
+                book.identifiers.append(db.Identifiers(str(value), id_type.lower(), book.id))
+                modified = True
+        if modified:
+            book.last_modified = datetime.now(timezone.utc)
+            calibre_dbb.set_metadata_dirty(book.id)
+            calibre_dbb.session.commit()
+        return modified
+
+    @property
+    def name(self):
+        return N_('Fetch Metadata')
+
+    @property
+    def is_cancellable(self):
+        return True
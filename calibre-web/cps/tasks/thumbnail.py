@@ -23,8 +23,8 @@ from io import BytesIO
 from datetime import datetime, timezone
 
 from .. import constants
-from cps import config, db, fs, gdriveutils, logger, ub, app
-from cps.services.worker import CalibreTask, STAT_CANCELLED, STAT_ENDED
+from cps import config, db, fs, gdriveutils, logger, ub, app, comic_pages
+from cps.services.worker import CalibreTask, STAT_CANCELLED, STAT_ENDED, LANE_THUMBNAILS, PRIORITY_HIGH
 from sqlalchemy import func, text, or_
 from flask_babel import lazy_gettext as N_
 
@@ -65,10 +65,15 @@ def get_best_fit(width, height, image_width, image_height):
 
 
 class TaskGenerateCoverThumbnails(CalibreTask):
+    lane = LANE_THUMBNAILS
+
     def __init__(self, book_id=-1, task_message=''):
         super(TaskGenerateCoverThumbnails, self).__init__(task_message)
         self.log = logger.create()
         self.book_id = book_id
+        # thumbnails of a single (edited or uploaded) book are visible to the user right away
+        if book_id > 0:
+            self.priority = PRIORITY_HIGH
         self.app_db_session = ub.get_new_session_instance()
         self.cache = fs.FileSystem()
         self.resolutions = [
@@ -77,10 +82,14 @@ class TaskGenerateCoverThumbnails(CalibreTask):
             constants.COVER_THUMBNAIL_LARGE
         ]
 
+    def to_descriptor(self):
+        return {'book_id': self.book_id}
+
     def run(self, worker_thread):
         if use_IM and self.stat != STAT_CANCELLED and self.stat != STAT_ENDED:
             self.message = 'Scanning Books'
-            books_with_covers = self.get_books_with_covers(self.book_id)
+            # a resumed task continues after the last book it processed
+            books_with_covers = self.get_books_with_covers(self.book_id, self.checkpoint or 0)
             count = len(books_with_covers)
 
             total_generated = 0
@@ -88,6 +97,7 @@ class TaskGenerateCoverThumbnails(CalibreTask):
 
                 # Generate new thumbnails for missing covers
                 generated = self.create_book_cover_thumbnails(book)
+                self.save_checkpoint(book.id)
 
                 # Increment the progress
                 self.progress = (1.0 / count) * i
@@ -112,11 +122,15 @@ class TaskGenerateCoverThumbnails(CalibreTask):
         self.app_db_session.remove()
 
     @staticmethod
-    def get_books_with_covers(book_id=-1):
+    def get_books_with_covers(book_id=-1, after_book_id=0):
         filter_exp = (db.Books.id == book_id) if book_id != -1 else True
         with app.app_context():
             calibre_db = db.CalibreDB(app) #, expire_on_commit=False, init=True)
-            books_cover = calibre_db.session.query(db.Books).filter(db.Books.has_cover == 1).filter(filter_exp).all()
+            books_cover = (calibre_db.session.query(db.Books)
+                           .filter(db.Books.has_cover == 1)
+                           .filter(filter_exp)
+                           .filter(db.Books.id > after_book_id)
+                           .order_by(db.Books.id).all())
             # calibre_db.session.close()
         return books_cover
 
@@ -244,6 +258,8 @@ class TaskGenerateCoverThumbnails(CalibreTask):
 
 
 class TaskGenerateSeriesThumbnails(CalibreTask):
+    lane = LANE_THUMBNAILS
+
     def __init__(self, task_message=''):
         super(TaskGenerateSeriesThumbnails, self).__init__(task_message)
         self.log = logger.create()
@@ -255,6 +271,9 @@ class TaskGenerateSeriesThumbnails(CalibreTask):
             constants.COVER_THUMBNAIL_MEDIUM,
         ]
 
+    def to_descriptor(self):
+        return {}
+
     def run(self, worker_thread):
         with app.app_context():
             calibre_db = db.CalibreDB(app)
@@ -456,13 +475,21 @@ class TaskGenerateSeriesThumbnails(CalibreTask):
 
 
 class TaskClearCoverThumbnailCache(CalibreTask):
+    lane = LANE_THUMBNAILS
+
     def __init__(self, book_id, task_message=N_('Clearing cover thumbnail cache')):
         super(TaskClearCoverThumbnailCache, self).__init__(task_message)
         self.log = logger.create()
         self.book_id = book_id
+        # has to stay in front of the regeneration of the same book's thumbnails
+        if book_id > 0:
+            self.priority = PRIORITY_HIGH
         self.app_db_session = ub.get_new_session_instance()
         self.cache = fs.FileSystem()
 
+    def to_descriptor(self):
+        return {'book_id': self.book_id}
+
     def run(self, worker_thread):
         if self.app_db_session:
             # delete superfluous thumbnails
@@ -527,3 +554,69 @@ class TaskClearCoverThumbnailCache(CalibreTask):
     @property
     def is_cancellable(self):
         return False
+
+
+class TaskGenerateComicPreviews(CalibreTask):
+    lane = LANE_THUMBNAILS
+    # previews are shown while the comic is read
+    priority = PRIORITY_HIGH
+
+    def __init__(self, path, book_format, task_message=N_('Generating comic page previews')):
+        super(TaskGenerateComicPreviews, self).__init__(task_message)
+        self.log = logger.create()
+        self.path = path
+        self.book_format = book_format
+
+    def to_descriptor(self):
+        return {'path': self.path, 'book_format': self.book_format}
+
+    def run(self, worker_thread):
+        if not use_IM:
+            self._handleSuccess()
+            return
+        try:
+            index = comic_pages.get_index(self.path, self.book_format)
+            # another task generates the previews of this archive right now
+            if not index or not index.start_previews():
+                self._handleSuccess()
+                return
+            try:
+                count = len(index.pages)
+                for number in range(count):
+                    if self.stat == STAT_CANCELLED or self.stat == STAT_ENDED:
+                        self.log.info('GenerateComicPreviews task has been stopped.')
+                        return
+                    if not comic_pages.preview_cache.contains(index.preview_name(number)):
+                        self.generate_preview(index, number)
+                    self.progress = (1.0 / count) * (number + 1)
+            finally:
+                index.end_previews()
+        except Exception as ex:
+            self.log.debug('Error generating comic page previews: ' + str(ex))
+            self._handleError('Error generating comic page previews: ' + str(ex))
+            return
+        self._handleSuccess()
+
+    def generate_preview(self, index, number):
+        try:
+            with Image(blob=index.read_page(number)) as img:
+                if img.height > comic_pages.PREVIEW_HEIGHT:
+                    width = max(1, int(img.width * comic_pages.PREVIEW_HEIGHT / img.height))
+                    img.resize(width=width, height=comic_pages.PREVIEW_HEIGHT, filter='lanczos')
+                img.format = 'jpeg'
+                comic_pages.preview_cache.store_data(img.make_blob(), index.preview_name(number))
+        except Exception as ex:
+            # a broken page doesn't stop the previews of the other pages, and doesn't queue them again
+            index.failed_previews.add(number)
+            self.log.debug('Error generating preview of page {} of {}: {}'.format(number, self.path, ex))
+
+    @property
+    def name(self):
+        return N_('Comic Previews')
+
+    def __str__(self):
+        return "Generate comic page previews for " + self.path
+
+    @property
+    def is_cancellable(self):
+        return True
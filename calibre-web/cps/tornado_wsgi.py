@@ -24,6 +24,8 @@ from tornado import httputil
 from tornado.ioloop import IOLoop
 from tornado.log import access_log
 
+from . import metrics
+
 from typing import List, Tuple, Optional, Callable, Any, Dict, Text
 from types import TracebackType
 import typing
@@ -98,9 +100,11 @@ class MyWSGIContainer(WSGIContainer):
             environ = WSGIContainer.environ(request)
         environ['RAW_URI'] = request.path
         self.env = environ
+        request.wsgi_environ = environ
         return environ
 
     def _log(self, status_code: int, request: httputil.HTTPServerRequest) -> None:
+        metrics.observe_request(getattr(request, "wsgi_environ", {}), status_code, request.request_time())
         if status_code < 400:
             log_method = access_log.info
         elif status_code < 500:
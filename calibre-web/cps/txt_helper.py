@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Serves text files as UTF-8, transcoded while they are streamed"""
+
+import codecs
+import itertools
+
+import chardet  # dependency of requests
+from flask import Response, request, stream_with_context
+from werkzeug.datastructures import ContentRange, Headers
+
+from . import logger
+from .library_cache import LibraryCache
+
+log = logger.create()
+
+# the encoding is detected from the beginning of the file
+DETECT_BYTES = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+PASSTHROUGH_ENCODINGS = ('utf-8', 'ascii')
+# used for the rest of a file which turns out not to be UTF-8 after its beginning was
+FALLBACK_ENCODING = 'cp1252'
+
+# keyed by book, format and modification of the file
+text_encodings = LibraryCache(1024, name="text_encodings")
+
+
+class TextInfo:
+    def __init__(self, encoding, confirmed):
+        self.encoding = encoding
+        # the encoding was detected from the whole file or the file was checked once
+        self.confirmed = confirmed
+        # length of the UTF-8 output, known after the file was transcoded once
+        self.length = None
+
+    @property
+    def passthrough(self):
+        return self.confirmed and self.encoding in PASSTHROUGH_ENCODINGS
+
+
+def detect_encoding(prefix):
+    encoding = chardet.detect(prefix[:DETECT_BYTES])['encoding']
+    try:
+        return codecs.lookup(encoding).name if encoding else 'utf-8'
+    except LookupError:
+        log.warning("Unknown text encoding %s detected, using utf-8", encoding)
+        return 'utf-8'
+
+
+def transcode(chunks, encoding):
+    """Decodes the byte chunks incrementally and yields them encoded as UTF-8
+
+    Text detected as UTF-8 or ASCII is decoded as UTF-8 up to the first invalid byte, the rest as FALLBACK_ENCODING
+    """
+    if encoding in PASSTHROUGH_ENCODINGS:
+        chunks = iter(chunks)
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        # None marks the end of the file, the bytes still buffered by the decoder have to be complete there
+        for chunk in itertools.chain(chunks, [None]):
+            try:
+                text = decoder.decode(chunk or b'', final=chunk is None)
+            except UnicodeDecodeError as ex:
+                # the error holds the bytes buffered by the decoder and the chunk
+                yield ex.object[:ex.start].decode('utf-8').encode('utf-8')
+                chunks = itertools.chain([ex.object[ex.start:]], chunks)
+                encoding = FALLBACK_ENCODING
+                break
+            if text:
+                yield text.encode('utf-8')
+        else:
+            return
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text.encode('utf-8', 'surrogatepass')
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text.encode('utf-8', 'surrogatepass')
+
+
+def slice_stream(chunks, start, stop):
+    """Yields the bytes start to stop (exclusive) of a stream of chunks"""
+    position = 0
+    for chunk in chunks:
+        end = position + len(chunk)
+        if end > start:
+            yield chunk[max(start - position, 0):stop - position]
+        position = end
+        if position >= stop:
+            return
+
+
+def serve_text(key, size, read, headers=None):
+    """Returns a streamed response of a text file in UTF-8 which honours byte ranges of the request
+
+    read(start, stop) has to yield the raw bytes of the file, size is its length in bytes. Files in UTF-8 are sent
+    unchanged, other encodings are transcoded. Their length is only known after they have been sent completely once,
+    until then ranges are answered with the whole text. Files detected as UTF-8 from their beginning are checked the
+    same way while they are sent the first time
+    """
+    info = text_encodings.get(key, lambda: TextInfo(detect_encoding(b"".join(read(0, min(size, DETECT_BYTES)))),
+                                                    size <= DETECT_BYTES))
+    headers = headers or Headers()
+    headers["Content-Type"] = "text/plain; charset=utf-8"
+    headers["Accept-Ranges"] = "bytes"
+    length = size if info.passthrough else info.length
+    start, stop, status = 0, length, 200
+    if request.range and length is not None:
+        byte_range = request.range.range_for_length(length)
+        if byte_range is None:
+            headers["Content-Range"] = ContentRange("bytes", None, None, length).to_header()
+            return Response(status=416, headers=headers)
+        start, stop = byte_range
+        status = 206
+        headers["Content-Range"] = ContentRange("bytes", start, stop, length).to_header()
+    if length is not None:
+        headers["Content-Length"] = str(stop - start)
+
+    def stream():
+        if info.passthrough:
+            yield from read(start, stop)
+            return
+        if length is not None:
+            yield from slice_stream(transcode(read(0, size), info.encoding), start, stop)
+            return
+        written = 0
+        for chunk in transcode(read(0, size), info.encoding):
+            written += len(chunk)
+            yield chunk
+        info.length = written
+        # UTF-8 comes out unchanged, other bytes are longer after transcoding
+        if info.encoding in PASSTHROUGH_ENCODINGS and written == size:
+            info.confirmed = True
+    return Response(stream_with_context(stream()), status=status, headers=headers)
+
+
+def read_file(path):
+    """Returns a reader of byte ranges of a local file for serve_text"""
+    def read(start, stop):
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+    return read
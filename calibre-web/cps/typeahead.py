@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""In memory index of names for the typeahead of the edit forms
+
+Names are folded to lower case ascii like the lcase function of the database. Names starting with the query are
+found by bisecting the sorted names, names containing it through an index of the trigrams of all names
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+
+import unidecode
+
+# number of names returned for a query
+TYPEAHEAD_LIMIT = 10
+GRAM_LENGTH = 3
+
+
+def fold(text):
+    return unidecode.unidecode(text.lower())
+
+
+def _grams(folded):
+    return set(folded[i:i + GRAM_LENGTH] for i in range(len(folded) - GRAM_LENGTH + 1))
+
+
+class TypeaheadIndex:
+    def __init__(self, names):
+        entries = sorted(set((fold(name), name) for name in names))
+        self.folded = [folded for folded, __ in entries]
+        self.names = [name for __, name in entries]
+        grams = defaultdict(list)
+        for position, folded in enumerate(self.folded):
+            for gram in _grams(folded):
+                grams[gram].append(position)
+        self.grams = dict(grams)
+
+    def search(self, query, limit=TYPEAHEAD_LIMIT, visible=None):
+        """Returns up to limit names containing query, names starting with it first
+
+        visible is an optional predicate on the names, names for which it returns False are left out
+        """
+        query = fold(query)
+        found = list()
+        start = position = bisect_left(self.folded, query)
+        while position < len(self.folded) and self.folded[position].startswith(query):
+            if visible is None or visible(self.names[position]):
+                found.append(self.names[position])
+                if len(found) >= limit:
+                    return found
+            position += 1
+        for candidate in self._infix_candidates(query):
+            if start <= candidate < position or query not in self.folded[candidate]:
+                continue
+            if visible is None or visible(self.names[candidate]):
+                found.append(self.names[candidate])
+                if len(found) >= limit:
+                    break
+        return found
+
+    def _infix_candidates(self, query):
+        if len(query) < GRAM_LENGTH:
+            return range(len(self.folded))
+        postings = sorted((self.grams.get(gram, []) for gram in _grams(query)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(posting)
+        return sorted(candidates)
+
+    def __len__(self):
+        return len(self.names)
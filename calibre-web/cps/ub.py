@@ -50,10 +50,11 @@ try:
     from sqlalchemy.orm import declarative_base
 except ImportError:
     from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import backref, relationship, sessionmaker, Session, scoped_session
+from sqlalchemy.orm import backref, relationship, sessionmaker, Session, scoped_session, object_session
 from werkzeug.security import generate_password_hash
 
 from . import constants, logger
+from .library_cache import TimedCache
 from .string_helper import strip_whitespaces
 
 log = logger.create()
@@ -65,6 +66,28 @@ searched_ids = {}
 
 logged_in = dict()
 
+# seconds a user with a valid session is served from memory without asking the database
+USER_SESSION_TTL = 60
+# users of valid sessions keyed by user id, random and session key of the flask session
+user_session_cache = TimedCache(USER_SESSION_TTL, max_entries=1024, name="user_sessions")
+
+
+# changes whenever a shelf is created, changed or deleted, cached shelf lists are keyed by it
+shelf_generation = 0
+
+
+def invalidate_shelves():
+    global shelf_generation
+    shelf_generation += 1
+
+
+def invalidate_user_sessions(user_id=None):
+    """Forgets the cached sessions of one user or of all users if no user_id is given"""
+    if user_id is None:
+        user_session_cache.clear()
+    else:
+        user_session_cache.discard(lambda key: key[0] == int(user_id))
+
 
 def signal_store_user_session(object, user):
     store_user_session()
@@ -97,6 +120,7 @@ def delete_user_session(user_id, session_key):
         session.query(User_Sessions).filter(User_Sessions.user_id == user_id,
                                             User_Sessions.session_key == session_key).delete()
         session.commit()
+        invalidate_user_sessions(user_id)
     except (exc.OperationalError, exc.InvalidRequestError) as ex:
         session.rollback()
         log.exception(ex)
@@ -271,6 +295,14 @@ class User(UserBase, Base):
     })
 
 
+# Password, role and restriction changes have to be effective with the next request of the user
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def receive_user_change(mapper, connection, target):
+    # forgotten after the commit, a request in between would cache the old user again
+    object_session(target).info.setdefault('users_changed', set()).add(target.id)
+
+
 if oauth_support:
     class OAuth(OAuthConsumerMixin, Base):
         provider_user_id = Column(String(256))
@@ -394,6 +426,28 @@ class Shelf(Base):
         return '<Shelf %d:%r>' % (self.id, self.name)
 
 
+@event.listens_for(Shelf, 'after_insert')
+@event.listens_for(Shelf, 'after_update')
+@event.listens_for(Shelf, 'after_delete')
+def receive_shelf_change(mapper, connection, target):
+    # invalidated after the commit, requests in between would cache the old shelves under the new generation
+    object_session(target).info['shelves_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def receive_commit(session):
+    if session.info.pop('shelves_changed', False):
+        invalidate_shelves()
+    for user_id in session.info.pop('users_changed', ()):
+        invalidate_user_sessions(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def receive_rollback(session):
+    session.info.pop('shelves_changed', None)
+    session.info.pop('users_changed', None)
+
+
 # Baseclass representing Relationship between books and Shelfs in Calibre-Web in app.db (N:M)
 class BookShelf(Base):
     __tablename__ = 'book_shelf_link'
@@ -531,6 +585,14 @@ class Downloads(Base):
         return '<Download %r' % self.book_id
 
 
+# Number of users who downloaded a book, maintained together with Downloads for sorting the hot books list
+class BookDownloadCount(Base):
+    __tablename__ = 'book_download_count'
+
+    book_id = Column(Integer, primary_key=True)
+    count = Column(Integer, default=0, index=True)
+
+
 # Baseclass representing allowed domains for registration
 class Registration(Base):
     __tablename__ = 'registration'
@@ -584,6 +646,41 @@ class Thumbnail(Base):
     expiration = Column(DateTime, nullable=True)
 
 
+# Metadata found by the bulk enrichment task, waiting to be reviewed in the edit dialog of the book
+class MetadataSuggestion(Base):
+    __tablename__ = 'metadata_suggestion'
+
+    id = Column(Integer, primary_key=True)
+    book_id = Column(Integer, index=True)
+    provider = Column(String)
+    score = Column(Float)
+    record = Column(JSON)
+    added = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+# Last search of a book by the metadata enrichment, books are searched again after some time
+class MetadataSearch(Base):
+    __tablename__ = 'metadata_search'
+
+    book_id = Column(Integer, primary_key=True)
+    searched = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+# Background tasks which were waiting or running, resumed after a restart
+class TaskJournalEntry(Base):
+    __tablename__ = 'task_journal'
+
+    id = Column(Integer, primary_key=True)
+    task_class = Column(String)
+    user = Column(String)
+    hidden = Column(Boolean, default=False)
+    scheduled = Column(Boolean, default=False)
+    descriptor = Column(JSON, default={})
+    checkpoint = Column(JSON, nullable=True)
+    added = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    updated = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+
 # Achievement definitions
 class AchievementDefinition(Base):
     __tablename__ = 'achievement_definition'
@@ -698,6 +795,10 @@ def add_missing_tables(engine, _session):
         UserSeriesProgress.__table__.create(bind=engine)
     if not engine.dialect.has_table(engine.connect(), "user_recommendation"):
         UserRecommendation.__table__.create(bind=engine)
+    if not engine.dialect.has_table(engine.connect(), "task_journal"):
+        TaskJournalEntry.__table__.create(bind=engine)
+    if not engine.dialect.has_table(engine.connect(), "book_download_count"):
+        BookDownloadCount.__table__.create(bind=engine)
 
 
 # migrate all settings missing in registration table
@@ -727,6 +828,20 @@ def migrate_user_session_table(engine, _session):
             trans.commit()
 
 
+# fill download counters from existing downloads
+def migrate_download_count_table(engine, _session):
+    try:
+        if not _session.query(BookDownloadCount).first() and _session.query(Downloads).first():
+            with engine.connect() as conn:
+                trans = conn.begin()
+                conn.execute(text("INSERT INTO book_download_count (book_id, count) "
+                                  "SELECT book_id, count(*) FROM downloads GROUP BY book_id"))
+                trans.commit()
+    except exc.OperationalError:  # Database is not writeable
+        print('Settings database is not writeable. Exiting...')
+        sys.exit(2)
+
+
 def migrate_user_table_notifications(engine, _session):
     """Add notification fields to user table if they don't exist"""
     try:
@@ -775,6 +890,7 @@ def migrate_Database(_session):
     migrate_registration_table(engine, _session)
     migrate_user_session_table(engine, _session)
     migrate_user_table_notifications(engine, _session)
+    migrate_download_count_table(engine, _session)
 
 
 def clean_database(_session):
@@ -796,6 +912,9 @@ def update_download(book_id, user_id):
     if not check:
         new_download = Downloads(user_id=user_id, book_id=book_id)
         session.add(new_download)
+        if not session.query(BookDownloadCount).filter(BookDownloadCount.book_id == book_id)\
+                .update({BookDownloadCount.count: BookDownloadCount.count + 1}, synchronize_session=False):
+            session.add(BookDownloadCount(book_id=book_id, count=1))
         try:
             session.commit()
         except exc.OperationalError:
@@ -805,11 +924,21 @@ def update_download(book_id, user_id):
 # Delete non-existing downloaded books in calibre-web's own database
 def delete_download(book_id):
     session.query(Downloads).filter(book_id == Downloads.book_id).delete()
+    session.query(BookDownloadCount).filter(book_id == BookDownloadCount.book_id).delete()
     try:
         session.commit()
     except exc.OperationalError:
         session.rollback()
 
+
+# Delete the downloads of a user and take them out of the download counters, committed by the caller
+def delete_user_downloads(user_id):
+    book_ids = [download.book_id for download in session.query(Downloads).filter(Downloads.user_id == user_id)]
+    if book_ids:
+        session.query(BookDownloadCount).filter(BookDownloadCount.book_id.in_(book_ids))\
+            .update({BookDownloadCount.count: BookDownloadCount.count - 1}, synchronize_session=False)
+    session.query(Downloads).filter(Downloads.user_id == user_id).delete()
+
 # Generate user Guest (translated text), as anonymous user, no rights
 def create_anonymous_user(_session):
     user = User()
@@ -127,7 +127,15 @@ def load_user_from_reverse_proxy_header(req):
 
 @lm.user_loader
 def load_user(user_id, random, session_key):
+    # OPDS readers and Kobo devices send many requests in a row, their user and session are kept for a short time
+    return ub.user_session_cache.get((int(user_id), random, session_key),
+                                     lambda: _load_user(user_id, random, session_key))
+
+
+def _load_user(user_id, random, session_key):
     user = ub.session.query(ub.User).filter(ub.User.id == int(user_id)).first()
+    if not user:
+        return None
     if session_key:
         entry = ub.session.query(ub.User_Sessions).filter(ub.User_Sessions.random == random,
                                                           ub.User_Sessions.session_key == session_key).first()
@@ -138,4 +146,3 @@ def load_user(user_id, random, session_key):
         if not entry or entry.user_id != user.id:
             return None
     return user
-
@@ -21,13 +21,13 @@
 import os
 import json
 import mimetypes
-import chardet  # dependency of requests
-import copy
 import time
+from collections import namedtuple
+from types import SimpleNamespace
 from importlib.metadata import metadata
 
 from flask import Blueprint, jsonify, request, redirect, send_from_directory, make_response, flash, abort, url_for
-from flask import session as flask_session
+from flask import session as flask_session, Response, stream_with_context
 from flask_babel import gettext as _
 from flask_babel import get_locale
 from .cw_login import login_user, logout_user, current_user
@@ -45,9 +45,10 @@ from . import db, ub, config, app
 from . import calibre_db, kobo_sync_status
 from .search import render_search_results, render_adv_search_results
 from .gdriveutils import getFileFromEbooksFolder, do_gdrive_download
+from .txt_helper import serve_text, read_file
 from .helper import check_valid_domain, check_email, check_username, \
     get_book_cover, get_series_cover_thumbnail, get_download_link, send_mail, generate_random_password, \
-    send_registration_mail, check_send_to_ereader, check_read_formats, tags_filters, reset_password, valid_email, \
+    send_registration_mail, check_send_to_ereader, check_read_formats, tags_visible, reset_password, valid_email, \
     edit_book_read_status, valid_password
 from .pagination import Pagination
 from .redirect import get_redirect_location
@@ -61,6 +62,15 @@ from .services.worker import WorkerThread
 from .tasks_status import render_task_status
 from .usermanagement import user_login_required
 from .string_helper import strip_whitespaces
+from .library_cache import LibraryCache
+from .typeahead import TypeaheadIndex
+from . import comic_pages, zip_index
+from .tasks.thumbnail import TaskGenerateComicPreviews
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 feature_support = {
@@ -213,57 +223,114 @@ def update_view():
     return "1", 200
 
 
-'''
-@web.route("/ajax/getcomic/<int:book_id>/<book_format>/<int:page>")
-@user_login_required
-def get_comic_book(book_id, book_format, page):
-    book = calibre_db.get_book(book_id)
-    if not book:
-        return "", 204
-    else:
-        for bookformat in book.data:
-            if bookformat.format.lower() == book_format.lower():
-                cbr_file = os.path.join(config.config_calibre_dir, book.path, bookformat.name) + "." + book_format
-                if book_format in ("cbr", "rar"):
-                    if feature_support['rar'] == True:
-                        rarfile.UNRAR_TOOL = config.config_rarfile_location
-                        try:
-                            rf = rarfile.RarFile(cbr_file)
-                            names = sort(rf.namelist())
-                            extract = lambda page: rf.read(names[page])
-                        except:
-                            # rarfile not valid
-                            log.error('Unrar binary not found, or unable to decompress file %s', cbr_file)
-                            return "", 204
-                    else:
-                        log.info('Unrar is not supported please install python rarfile extension')
-                        # no support means return nothing
-                        return "", 204
-                elif book_format in ("cbz", "zip"):
-                    zf = zipfile.ZipFile(cbr_file)
-                    names=sort(zf.namelist())
-                    extract = lambda page: zf.read(names[page])
-                elif book_format in ("cbt", "tar"):
-                    tf = tarfile.TarFile(cbr_file)
-                    names=sort(tf.getnames())
-                    extract = lambda page: tf.extractfile(names[page]).read()
-                else:
-                    log.error('unsupported comic format')
-                    return "", 204
-
-                b64 = codecs.encode(extract(page), 'base64').decode()
-                ext = names[page].rpartition('.')[-1]
-                if ext not in ('png', 'gif', 'jpg', 'jpeg', 'webp'):
-                    ext = 'png'
-                extractedfile="data:image/" + ext + ";base64," + b64
-                fileData={"name": names[page], "page":page, "last":len(names)-1, "content": extractedfile}
-                return make_response(json.dumps(fileData))
-        return "", 204
-'''
+def _get_comic_index(book_id, book_format):
+    # comics on Google Drive are read as a whole by the browser
+    book = calibre_db.get_filtered_book(book_id) if not config.config_use_google_drive else None
+    data = calibre_db.get_book_format(book_id, book_format.upper()) if book else None
+    if not data:
+        abort(404)
+    file_path = os.path.join(config.get_book_path(), book.path, data.name + "." + book_format.lower())
+    try:
+        index = comic_pages.get_index(file_path, book_format)
+    except Exception as ex:
+        log.error("Reading comic archive %s failed: %s", file_path, ex)
+        index = None
+    if not index:
+        abort(404)
+    return index
+
+
+def _archive_entry_response(response, etag):
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = comic_pages.PAGE_MAX_AGE
+    return response
+
+
+@web.route("/ajax/comic/<int:book_id>/<book_format>")
+@login_required_if_no_ano
+@viewer_required
+def get_comic_pages(book_id, book_format):
+    index = _get_comic_index(book_id, book_format)
+    if index.previews_missing():
+        WorkerThread.add(current_user.name, TaskGenerateComicPreviews(index.path, book_format.lower()), hidden=True)
+    return jsonify({
+        "prefetch": comic_pages.PREFETCH_PAGES,
+        "pages": [{"name": page.name,
+                   "mimetype": page.mimetype,
+                   "url": url_for("web.get_comic_page", book_id=book_id, book_format=book_format, page=number),
+                   "preview": url_for("web.get_comic_preview", book_id=book_id, book_format=book_format,
+                                      page=number)}
+                  for number, page in enumerate(index.pages)]
+    })
+
+
+@web.route("/ajax/comic/<int:book_id>/<book_format>/page/<int:page>")
+@login_required_if_no_ano
+@viewer_required
+def get_comic_page(book_id, book_format, page):
+    index = _get_comic_index(book_id, book_format)
+    if page >= len(index.pages):
+        abort(404)
+    etag = "{}-{}".format(index.key, page)
+    if request.if_none_match.contains(etag):
+        return _archive_entry_response(make_response("", 304), etag)
+    try:
+        content = index.read_page(page)
+    except Exception as ex:
+        log.error("Reading page %s of comic archive %s failed: %s", page, index.path, ex)
+        abort(404)
+    response = make_response(content)
+    response.headers["Content-Type"] = index.pages[page].mimetype
+    return _archive_entry_response(response, etag)
+
+
+@web.route("/ajax/comic/<int:book_id>/<book_format>/preview/<int:page>")
+@login_required_if_no_ano
+@viewer_required
+def get_comic_preview(book_id, book_format, page):
+    index = _get_comic_index(book_id, book_format)
+    preview = comic_pages.preview_cache.lookup(index.preview_name(page))
+    if not preview:
+        # the full page is shown until the preview is generated
+        return redirect(url_for("web.get_comic_page", book_id=book_id, book_format=book_format, page=page))
+    response = make_response(send_from_directory(os.path.dirname(preview), os.path.basename(preview)))
+    return _archive_entry_response(response, "{}-{}-preview".format(index.key, page))
+
+
+@web.route("/ajax/epub/<int:book_id>/<book_format>/", defaults={'entry': ''})
+@web.route("/ajax/epub/<int:book_id>/<book_format>/<path:entry>")
+@login_required_if_no_ano
+@viewer_required
+def get_epub_entry(book_id, book_format, entry):
+    # epubs on Google Drive are read as a whole by the browser
+    book = calibre_db.get_filtered_book(book_id) if not config.config_use_google_drive else None
+    data = calibre_db.get_book_format(book_id, book_format.upper()) if book else None
+    if not data or book_format.lower() not in ("epub", "kepub"):
+        abort(404)
+    file_path = os.path.join(config.get_book_path(), book.path, data.name + "." + book_format.lower())
+    try:
+        index = zip_index.get_index(file_path)
+    except Exception as ex:
+        log.error("Reading epub %s failed: %s", file_path, ex)
+        abort(404)
+    zip_entry = index.get(entry)
+    if not zip_entry:
+        abort(404)
+    etag = "{}-{}".format(index.key, entry)
+    if request.if_none_match.contains(etag):
+        return _archive_entry_response(make_response("", 304), etag)
+    response = Response(stream_with_context(index.stream(zip_entry)),
+                        mimetype=mimetypes.guess_type(entry)[0] or "application/octet-stream")
+    response.headers["Content-Length"] = str(zip_entry.file_size)
+    return _archive_entry_response(response, etag)
 
 
 # ################################### Typeahead ##################################################################
 
+# the language names don't depend on the library, only on the locale
+language_indexes = LibraryCache(max_entries=16, name="language_typeahead")
+
 
 @web.route("/get_authors_json", methods=['GET'])
 @login_required_if_no_ano
@@ -280,7 +347,7 @@ def get_publishers_json():
 @web.route("/get_tags_json", methods=['GET'])
 @login_required_if_no_ano
 def get_tags_json():
-    return calibre_db.get_typeahead(db.Tags, request.args.get('q'), tag_filter=tags_filters())
+    return calibre_db.get_typeahead(db.Tags, request.args.get('q'), visible=tags_visible())
 
 
 @web.route("/get_series_json", methods=['GET'])
@@ -292,15 +359,10 @@ def get_series_json():
 @web.route("/get_languages_json", methods=['GET'])
 @login_required_if_no_ano
 def get_languages_json():
-    query = (request.args.get('q') or '').lower()
-    language_names = isoLanguages.get_language_names(get_locale())
-    entries_start = [s for key, s in language_names.items() if s.lower().startswith(query.lower())]
-    if len(entries_start) < 5:
-        entries = [s for key, s in language_names.items() if query in s.lower()]
-        entries_start.extend(entries[0:(5 - len(entries_start))])
-        entries_start = list(set(entries_start))
-    json_dumps = json.dumps([dict(name=r) for r in entries_start[0:5]])
-    return json_dumps
+    locale = get_locale()
+    index = language_indexes.get(str(locale),
+                                 lambda: TypeaheadIndex((isoLanguages.get_language_names(locale) or {}).values()))
+    return json.dumps([dict(name=name) for name in index.search(request.args.get('q') or '', limit=5)])
 
 
 @web.route("/get_matching_tags", methods=['GET'])
@@ -330,6 +392,22 @@ def get_matching_tags():
     return json_dumps
 
 
+# Listing pages only change with the library and the books visible to the user, so they are cached per
+# library generation and visibility signature. Entries are plain copies, safe to share between requests
+list_cache = LibraryCache(max_entries=256, name="category_lists")
+ListEntry = namedtuple('ListEntry', 'item, count, name, format', defaults=(None, None))
+GridEntry = namedtuple('GridEntry', 'book, count')
+
+
+def get_cached_list(view, loader):
+    key = (view, str(get_locale()), calibre_db.library_generation(), calibre_db.common_filters_signature())
+    return list_cache.get(key, loader)
+
+
+def copy_list_item(item, *columns):
+    return SimpleNamespace(**{column: getattr(item, column) for column in columns})
+
+
 def generate_char_list(entries): # data_colum, db_link):
     char_list = list()
     for entry in entries:
@@ -343,7 +421,7 @@ def query_char_list(data_colum, db_link):
     results = (calibre_db.session.query(func.upper(func.substr(data_colum, 1, 1)).label('char'))
             .join(db_link).join(db.Books).filter(calibre_db.common_filters())
             .group_by(func.upper(func.substr(data_colum, 1, 1))).all())
-    return results
+    return [tuple(result) for result in results]
 
 
 def get_sort_function(sort_param, data):
@@ -373,9 +451,9 @@ def get_sort_function(sort_param, data):
     if sort_param == 'seriesdesc':
         order = [db.Books.series_index.desc()]
     if sort_param == 'hotdesc':
-        order = [func.count(ub.Downloads.book_id).desc()]
+        order = [ub.BookDownloadCount.count.desc(), db.Books.id.desc()]
     if sort_param == 'hotasc':
-        order = [func.count(ub.Downloads.book_id).asc()]
+        order = [ub.BookDownloadCount.count.asc(), db.Books.id.asc()]
     if sort_param is None:
         sort_param = "new"
     return order, sort_param
@@ -451,9 +529,9 @@ def render_rated_books(page, book_id, order):
 
 def render_discover_books(book_id):
     if current_user.check_visibility(constants.SIDEBAR_RANDOM):
-        entries, __, ___ = calibre_db.fill_indexpage(1, 0, db.Books, True, [func.randomblob(2)],
-                                                            join_archive_read=True,
-                                                            config_read_column=config.config_read_column)
+        entries = calibre_db.order_authors(calibre_db.get_random_books(config.config_read_column, db.Books,
+                                                                       config.config_books_per_page),
+                                           True, True)
         pagination = Pagination(1, config.config_books_per_page, config.config_books_per_page)
         return render_title_template('index.html', random=false(), entries=entries, pagination=pagination, id=book_id,
                                      title=_("Discover (Random Books)"), page="discover")
@@ -464,33 +542,16 @@ def render_discover_books(book_id):
 def render_hot_books(page, order):
     if current_user.check_visibility(constants.SIDEBAR_HOT):
         if order[1] not in ['hotasc', 'hotdesc']:
-            # Unary expression comparison only working (for this expression) in sqlalchemy 1.4+
-            # if not (order[0][0].compare(func.count(ub.Downloads.book_id).desc()) or
-            #        order[0][0].compare(func.count(ub.Downloads.book_id).asc())):
-            order = [func.count(ub.Downloads.book_id).desc()], 'hotdesc'
-        if current_user.show_detail_random():
-            random_query = calibre_db.generate_linked_query(config.config_read_column, db.Books)
-            random = (random_query.filter(calibre_db.common_filters())
-                     .order_by(func.random())
-                     .limit(config.config_random_books).all())
-        else:
-            random = false()
-
-        off = int(int(config.config_books_per_page) * (page - 1))
-        all_books = ub.session.query(ub.Downloads, func.count(ub.Downloads.book_id)) \
-            .order_by(*order[0]).group_by(ub.Downloads.book_id)
-        hot_books = all_books.offset(off).limit(config.config_books_per_page)
-        entries = list()
-        for book in hot_books:
-            query = calibre_db.generate_linked_query(config.config_read_column, db.Books)
-            download_book = query.filter(calibre_db.common_filters()).filter(
-                book.Downloads.book_id == db.Books.id).first()
-            if download_book:
-                entries.append(download_book)
-            else:
-                ub.delete_download(book.Downloads.book_id)
-        num_books = entries.__len__()
-        pagination = Pagination(page, config.config_books_per_page, num_books)
+            order = [ub.BookDownloadCount.count.desc(), db.Books.id.desc()], 'hotdesc'
+        # download counters of deleted books are removed by the clean-up task
+        entries, random, pagination = calibre_db.fill_indexpage(page,
+                                                                0,
+                                                                db.Books,
+                                                                ub.BookDownloadCount.count > 0,
+                                                                order[0],
+                                                                True, config.config_read_column,
+                                                                ub.BookDownloadCount,
+                                                                db.Books.id == ub.BookDownloadCount.book_id)
         return render_title_template('index.html', random=random, entries=entries, pagination=pagination,
                                      title=_("Hot Books (Most Downloaded)"), page="hot", order=order[1])
     else:
@@ -898,7 +959,10 @@ def list_books():
     join = tuple()
 
     if sort_param == "state":
-        state = json.loads(request.args.get("state", "[]"))
+        try:
+            state = [int(book_id) for book_id in json.loads(request.args.get("state", "[]"))]
+        except (ValueError, TypeError):
+            state = []
     elif sort_param == "tags":
         order = [db.Tags.name.asc()] if order == "asc" else [db.Tags.name.desc()]
         join = db.books_tags_link, db.Books.id == db.books_tags_link.c.book, db.Tags
@@ -925,19 +989,22 @@ def list_books():
         calibre_db.common_filters(allow_show_archived=True)).count()
     if state is not None:
         if search_param:
-            books = calibre_db.search_query(search_param, config).all()
-            filtered_count = len(books)
+            query = calibre_db.search_query(search_param, config)
+            filtered_count = query.count()
         else:
-            query = calibre_db.generate_linked_query(config.config_read_column, db.Books)
-            books = query.filter(calibre_db.common_filters(allow_show_archived=True)).all()
-        entries = calibre_db.get_checkbox_sorted(books, state, off, limit, order, True)
+            query = calibre_db.generate_linked_query(config.config_read_column, db.Books) \
+                .filter(calibre_db.common_filters(allow_show_archived=True))
+        entries = query.order_by(*calibre_db.get_checkbox_sort_order(state, db.Books.id, order)) \
+            .options(*calibre_db.load_options('table')).offset(off).limit(limit).all()
+        entries = calibre_db.order_authors(entries, True, True)
     elif search_param:
         entries, filtered_count, __ = calibre_db.get_search_results(search_param,
                                                                     config,
                                                                     off,
                                                                     [order, ''],
                                                                     limit,
-                                                                    *join)
+                                                                    *join,
+                                                                    load_profile='table')
     else:
         entries, __, __ = calibre_db.fill_indexpage_with_archived_books((int(off) / (int(limit)) + 1),
                                                                         db.Books,
@@ -947,26 +1014,48 @@ def list_books():
                                                                         True,
                                                                         True,
                                                                         config.config_read_column,
-                                                                        *join)
+                                                                        *join,
+                                                                        load_profile='table')
 
-    result = list()
-    for entry in entries:
-        val = entry[0]
-        val.is_archived = entry[1] is True
-        val.read_status = entry[2] == ub.ReadBook.STATUS_FINISHED
-        for lang_index in range(0, len(val.languages)):
-            val.languages[lang_index].language_name = isoLanguages.get_language_name(get_locale(), val.languages[
-                lang_index].lang_code)
-        result.append(val)
+    cc = calibre_db.get_cc_columns(config, filter_config_custom_read=True)
+    locale = get_locale()
+    result = [book_table_row(entry, cc, locale) for entry in entries]
 
     table_entries = {'totalNotFiltered': total_count, 'total': filtered_count, "rows": result}
-    js_list = json.dumps(table_entries, cls=db.AlchemyEncoder)
+    if orjson:
+        js_list = orjson.dumps(table_entries)
+    else:
+        js_list = json.dumps(table_entries)
 
     response = make_response(js_list)
     response.headers["Content-Type"] = "application/json; charset=utf-8"
     return response
 
 
+# Only the columns shown in the books table are sent, instead of complete books with all relations
+def book_table_row(entry, cc, locale):
+    book = entry[0]
+    row = {'id': book.id,
+           'title': book.title,
+           'sort': book.sort,
+           'author_sort': book.author_sort,
+           'authors': " & ".join(author.name for author in book.authors),
+           'tags': ",".join(tag.name for tag in book.tags),
+           'series': ",".join(serie.name for serie in book.series),
+           'series_index': book.series_index,
+           'languages': ",".join(isoLanguages.get_language_name(locale, language.lang_code)
+                                 for language in book.languages),
+           'publishers': ",".join(publisher.name for publisher in book.publishers),
+           'comments': ",".join(comment.text or "" for comment in book.comments),
+           'is_archived': entry[1] is True,
+           'read_status': entry[2] == ub.ReadBook.STATUS_FINISHED}
+    for c in cc:
+        values = getattr(book, 'custom_column_' + str(c.id))
+        row['custom_column_' + str(c.id)] = ",".join(str(value.value) if hasattr(value, 'value') else str(value.get())
+                                                     for value in values)
+    return row
+
+
 @web.route("/ajax/table_settings", methods=['POST'])
 @user_login_required
 def update_table_settings():
@@ -987,27 +1076,30 @@ def update_table_settings():
 @login_required_if_no_ano
 def author_list():
     if current_user.check_visibility(constants.SIDEBAR_AUTHOR):
-        if current_user.get_view_property('author', 'dir') == 'desc':
-            order = db.Authors.sort.desc()
-            order_no = 0
-        else:
-            order = db.Authors.sort.asc()
-            order_no = 1
-        entries = calibre_db.session.query(db.Authors, func.count('books_authors_link.book').label('count')) \
-            .join(db.books_authors_link).join(db.Books).filter(calibre_db.common_filters()) \
-            .group_by(text('books_authors_link.author')).order_by(order).all()
-        char_list = query_char_list(db.Authors.sort, db.books_authors_link)
-        # If not creating a copy, readonly databases can not display authornames with "|" in it as changing the name
-        # starts a change session
-        author_copy = copy.deepcopy(entries)
-        for entry in author_copy:
-            entry.Authors.name = entry.Authors.name.replace('|', ',')
-        return render_title_template('list.html', entries=author_copy, folder='web.books_list', charlist=char_list,
+        order_no = 0 if current_user.get_view_property('author', 'dir') == 'desc' else 1
+        entries, char_list = get_cached_list('author', _author_list_entries)
+        if not order_no:
+            entries = entries[::-1]
+        return render_title_template('list.html', entries=entries, folder='web.books_list', charlist=char_list,
                                      title="Authors", page="authorlist", data='author', order=order_no)
     else:
         abort(404)
 
 
+def _author_list_entries():
+    entries = calibre_db.session.query(db.Authors, func.count('books_authors_link.book').label('count')) \
+        .join(db.books_authors_link).join(db.Books).filter(calibre_db.common_filters()) \
+        .group_by(text('books_authors_link.author')).order_by(db.Authors.sort.asc()).all()
+    # Work on copies, readonly databases can not display authornames with "|" in it as changing the name
+    # starts a change session
+    author_copy = list()
+    for author, count in entries:
+        author = copy_list_item(author, 'id', 'name', 'sort')
+        author.name = author.name.replace('|', ',')
+        author_copy.append(ListEntry(author, count))
+    return author_copy, query_char_list(db.Authors.sort, db.books_authors_link)
+
+
 @web.route("/downloadlist")
 @login_required_if_no_ano
 def download_list():
@@ -1032,31 +1124,33 @@ def download_list():
 @web.route("/publisher")
 @login_required_if_no_ano
 def publisher_list():
-    if current_user.get_view_property('publisher', 'dir') == 'desc':
-        order = db.Publishers.name.desc()
-        order_no = 0
-    else:
-        order = db.Publishers.name.asc()
-        order_no = 1
+    order_no = 0 if current_user.get_view_property('publisher', 'dir') == 'desc' else 1
     if current_user.check_visibility(constants.SIDEBAR_PUBLISHER):
-        entries = calibre_db.session.query(db.Publishers, func.count('books_publishers_link.book').label('count')) \
-            .join(db.books_publishers_link).join(db.Books).filter(calibre_db.common_filters()) \
-            .group_by(text('books_publishers_link.publisher')).order_by(order).all()
-        no_publisher_count = (calibre_db.session.query(db.Books)
-                           .outerjoin(db.books_publishers_link).outerjoin(db.Publishers)
-                           .filter(db.Publishers.name == None)
-                           .filter(calibre_db.common_filters())
-                           .count())
-        if no_publisher_count:
-            entries.append([db.Category(_("None"), "-1"), no_publisher_count])
-        entries = sorted(entries, key=lambda x: x[0].name.lower(), reverse=not order_no)
-        char_list = generate_char_list(entries)
+        entries, char_list = get_cached_list('publisher', _publisher_list_entries)
+        if not order_no:
+            entries = entries[::-1]
         return render_title_template('list.html', entries=entries, folder='web.books_list', charlist=char_list,
                                      title=_("Publishers"), page="publisherlist", data="publisher", order=order_no)
     else:
         abort(404)
 
 
+def _publisher_list_entries():
+    entries = calibre_db.session.query(db.Publishers, func.count('books_publishers_link.book').label('count')) \
+        .join(db.books_publishers_link).join(db.Books).filter(calibre_db.common_filters()) \
+        .group_by(text('books_publishers_link.publisher')).all()
+    entries = [ListEntry(copy_list_item(publisher, 'id', 'name'), count) for publisher, count in entries]
+    no_publisher_count = (calibre_db.session.query(db.Books)
+                       .outerjoin(db.books_publishers_link).outerjoin(db.Publishers)
+                       .filter(db.Publishers.name == None)
+                       .filter(calibre_db.common_filters())
+                       .count())
+    if no_publisher_count:
+        entries.append(ListEntry(db.Category(_("None"), "-1"), no_publisher_count))
+    entries = sorted(entries, key=lambda x: x[0].name.lower())
+    return entries, generate_char_list(entries)
+
+
 @web.route("/series")
 @login_required_if_no_ano
 def series_list():
@@ -1067,19 +1161,12 @@ def series_list():
         else:
             order = db.Series.sort.asc()
             order_no = 1
-        char_list = query_char_list(db.Series.sort, db.books_series_link)
+        char_list = get_cached_list('series_chars',
+                                    lambda: query_char_list(db.Series.sort, db.books_series_link))
         if current_user.get_view_property('series', 'series_view') == 'list':
-            entries = calibre_db.session.query(db.Series, func.count('books_series_link.book').label('count')) \
-                .join(db.books_series_link).join(db.Books).filter(calibre_db.common_filters()) \
-                .group_by(text('books_series_link.series')).order_by(order).all()
-            no_series_count = (calibre_db.session.query(db.Books)
-                            .outerjoin(db.books_series_link).outerjoin(db.Series)
-                            .filter(db.Series.name == None)
-                            .filter(calibre_db.common_filters())
-                            .count())
-            if no_series_count:
-                entries.append([db.Category(_("None"), "-1"), no_series_count])
-            entries = sorted(entries, key=lambda x: x[0].name.lower(), reverse=not order_no)
+            entries = get_cached_list('series', _series_list_entries)
+            if not order_no:
+                entries = entries[::-1]
             return render_title_template('list.html',
                                          entries=entries,
                                          folder='web.books_list',
@@ -1088,13 +1175,21 @@ def series_list():
                                          page="serieslist",
                                          data="series", order=order_no)
         else:
-            entries = (calibre_db.session.query(db.Books, func.count('books_series_link').label('count'),
-                                                func.max(db.Books.series_index), db.Books.id)
+            # only the columns shown in the grid are queried, the cover book of each series is the one with
+            # the highest series index
+            entries = (calibre_db.session.query(db.Books.id, db.Books.title, db.Books.sort, db.Books.last_modified,
+                                                db.Series.id.label('series_id'), db.Series.name.label('series_name'),
+                                                func.count('books_series_link').label('count'),
+                                                func.max(db.Books.series_index))
                        .join(db.books_series_link).join(db.Series).filter(calibre_db.common_filters())
                        .group_by(text('books_series_link.series'))
                        .having(or_(func.max(db.Books.series_index), db.Books.series_index==""))
                        .order_by(order)
                        .all())
+            entries = [GridEntry(SimpleNamespace(id=entry.id, title=entry.title, sort=entry.sort,
+                                                 last_modified=entry.last_modified,
+                                                 series=[SimpleNamespace(id=entry.series_id, name=entry.series_name)]),
+                                 entry.count) for entry in entries]
             return render_title_template('grid.html', entries=entries, folder='web.books_list', charlist=char_list,
                                          title=_("Series"), page="serieslist", data="series", bodyClass="grid-view",
                                          order=order_no)
@@ -1102,103 +1197,132 @@ def series_list():
         abort(404)
 
 
+def _series_list_entries():
+    entries = calibre_db.session.query(db.Series, func.count('books_series_link.book').label('count')) \
+        .join(db.books_series_link).join(db.Books).filter(calibre_db.common_filters()) \
+        .group_by(text('books_series_link.series')).all()
+    entries = [ListEntry(copy_list_item(series, 'id', 'name', 'sort'), count) for series, count in entries]
+    no_series_count = (calibre_db.session.query(db.Books)
+                    .outerjoin(db.books_series_link).outerjoin(db.Series)
+                    .filter(db.Series.name == None)
+                    .filter(calibre_db.common_filters())
+                    .count())
+    if no_series_count:
+        entries.append(ListEntry(db.Category(_("None"), "-1"), no_series_count))
+    return sorted(entries, key=lambda x: x[0].name.lower())
+
+
 @web.route("/ratings")
 @login_required_if_no_ano
 def ratings_list():
     if current_user.check_visibility(constants.SIDEBAR_RATING):
-        if current_user.get_view_property('ratings', 'dir') == 'desc':
-            order = db.Ratings.rating.desc()
-            order_no = 0
-        else:
-            order = db.Ratings.rating.asc()
-            order_no = 1
-        entries = calibre_db.session.query(db.Ratings, func.count('books_ratings_link.book').label('count'),
-                                           (db.Ratings.rating / 2).label('name')) \
-            .join(db.books_ratings_link).join(db.Books).filter(calibre_db.common_filters()) \
-            .filter(db.Ratings.rating > 0) \
-            .group_by(text('books_ratings_link.rating')).order_by(order).all()
-        no_rating_count = (calibre_db.session.query(db.Books)
-                           .outerjoin(db.books_ratings_link).outerjoin(db.Ratings)
-                           .filter(or_(db.Ratings.rating == None, db.Ratings.rating == 0))
-                           .filter(calibre_db.common_filters())
-                           .count())
-        if no_rating_count:
-            entries.append([db.Category(_("None"), "-1", -1), no_rating_count])
-        entries = sorted(entries, key=lambda x: x[0].rating, reverse=not order_no)
+        order_no = 0 if current_user.get_view_property('ratings', 'dir') == 'desc' else 1
+        entries = get_cached_list('ratings', _ratings_list_entries)
+        if not order_no:
+            entries = entries[::-1]
         return render_title_template('list.html', entries=entries, folder='web.books_list', charlist=list(),
                                      title=_("Ratings list"), page="ratingslist", data="ratings", order=order_no)
     else:
         abort(404)
 
 
+def _ratings_list_entries():
+    entries = calibre_db.session.query(db.Ratings, func.count('books_ratings_link.book').label('count'),
+                                       (db.Ratings.rating / 2).label('name')) \
+        .join(db.books_ratings_link).join(db.Books).filter(calibre_db.common_filters()) \
+        .filter(db.Ratings.rating > 0) \
+        .group_by(text('books_ratings_link.rating')).all()
+    entries = [ListEntry(copy_list_item(rating, 'id', 'rating'), count, name) for rating, count, name in entries]
+    no_rating_count = (calibre_db.session.query(db.Books)
+                       .outerjoin(db.books_ratings_link).outerjoin(db.Ratings)
+                       .filter(or_(db.Ratings.rating == None, db.Ratings.rating == 0))
+                       .filter(calibre_db.common_filters())
+                       .count())
+    if no_rating_count:
+        entries.append(ListEntry(db.Category(_("None"), "-1", -1), no_rating_count))
+    return sorted(entries, key=lambda x: x[0].rating)
+
+
 @web.route("/formats")
 @login_required_if_no_ano
 def formats_list():
     if current_user.check_visibility(constants.SIDEBAR_FORMAT):
-        if current_user.get_view_property('formats', 'dir') == 'desc':
-            order = db.Data.format.desc()
-            order_no = 0
-        else:
-            order = db.Data.format.asc()
-            order_no = 1
-        entries = calibre_db.session.query(db.Data,
-                                           func.count('data.book').label('count'),
-                                           db.Data.format.label('format')) \
-            .join(db.Books).filter(calibre_db.common_filters()) \
-            .group_by(db.Data.format).order_by(order).all()
-        no_format_count = (calibre_db.session.query(db.Books).outerjoin(db.Data)
-                           .filter(db.Data.format == None)
-                           .filter(calibre_db.common_filters())
-                           .count())
-        if no_format_count:
-            entries.append([db.Category(_("None"), "-1"), no_format_count])
+        order_no = 0 if current_user.get_view_property('formats', 'dir') == 'desc' else 1
+        entries = get_cached_list('formats', _formats_list_entries)
+        if not order_no:
+            # the "None" entry stays at the end
+            entries = [entry for entry in entries[::-1] if entry.format] + \
+                      [entry for entry in entries if not entry.format]
         return render_title_template('list.html', entries=entries, folder='web.books_list', charlist=list(),
                                      title=_("File formats list"), page="formatslist", data="formats", order=order_no)
     else:
         abort(404)
 
 
+def _formats_list_entries():
+    entries = calibre_db.session.query(db.Data,
+                                       func.count('data.book').label('count'),
+                                       db.Data.format.label('format')) \
+        .join(db.Books).filter(calibre_db.common_filters()) \
+        .group_by(db.Data.format).order_by(db.Data.format.asc()).all()
+    entries = [ListEntry(copy_list_item(data, 'id', 'format'), count, format=data_format)
+               for data, count, data_format in entries]
+    no_format_count = (calibre_db.session.query(db.Books).outerjoin(db.Data)
+                       .filter(db.Data.format == None)
+                       .filter(calibre_db.common_filters())
+                       .count())
+    if no_format_count:
+        entries.append(ListEntry(db.Category(_("None"), "-1"), no_format_count))
+    return entries
+
+
 @web.route("/language")
 @login_required_if_no_ano
 def language_overview():
     if current_user.check_visibility(constants.SIDEBAR_LANGUAGE) and current_user.filter_language() == "all":
         order_no = 0 if current_user.get_view_property('language', 'dir') == 'desc' else 1
-        languages = calibre_db.speaking_language(reverse_order=not order_no, with_count=True)
-        char_list = generate_char_list(languages)
+        languages, char_list = get_cached_list('language', _language_list_entries)
+        if not order_no:
+            languages = languages[::-1]
         return render_title_template('list.html', entries=languages, folder='web.books_list', charlist=char_list,
                                      title=_("Languages"), page="langlist", data="language", order=order_no)
     else:
         abort(404)
 
 
+def _language_list_entries():
+    languages = [ListEntry(language, count) for language, count in calibre_db.speaking_language(with_count=True)]
+    return languages, generate_char_list(languages)
+
+
 @web.route("/category")
 @login_required_if_no_ano
 def category_list():
     if current_user.check_visibility(constants.SIDEBAR_CATEGORY):
-        if current_user.get_view_property('category', 'dir') == 'desc':
-            order = db.Tags.name.desc()
-            order_no = 0
-        else:
-            order = db.Tags.name.asc()
-            order_no = 1
-        entries = calibre_db.session.query(db.Tags, func.count('books_tags_link.book').label('count')) \
-            .join(db.books_tags_link).join(db.Books).order_by(order).filter(calibre_db.common_filters()) \
-            .group_by(db.Tags.id).all()
-        no_tag_count = (calibre_db.session.query(db.Books)
-                         .outerjoin(db.books_tags_link).outerjoin(db.Tags)
-                        .filter(db.Tags.name == None)
-                         .filter(calibre_db.common_filters())
-                         .count())
-        if no_tag_count:
-            entries.append([db.Category(_("None"), "-1"), no_tag_count])
-        entries = sorted(entries, key=lambda x: x[0].name.lower(), reverse=not order_no)
-        char_list = generate_char_list(entries)
+        order_no = 0 if current_user.get_view_property('category', 'dir') == 'desc' else 1
+        entries, char_list = get_cached_list('category', _category_list_entries)
+        if not order_no:
+            entries = entries[::-1]
         return render_title_template('list.html', entries=entries, folder='web.books_list', charlist=char_list,
                                      title=_("Categories"), page="catlist", data="category", order=order_no)
     else:
         abort(404)
 
 
+def _category_list_entries():
+    entries = calibre_db.session.query(db.Tags, func.count('books_tags_link.book').label('count')) \
+        .join(db.books_tags_link).join(db.Books).filter(calibre_db.common_filters()) \
+        .group_by(db.Tags.id).all()
+    entries = [ListEntry(copy_list_item(tag, 'id', 'name'), count) for tag, count in entries]
+    no_tag_count = (calibre_db.session.query(db.Books)
+                     .outerjoin(db.books_tags_link).outerjoin(db.Tags)
+                    .filter(db.Tags.name == None)
+                     .filter(calibre_db.common_filters())
+                     .count())
+    if no_tag_count:
+        entries.append(ListEntry(db.Category(_("None"), "-1"), no_tag_count))
+    entries = sorted(entries, key=lambda x: x[0].name.lower())
+    return entries, generate_char_list(entries)
 
 
 # ################################### Download/Send ##################################################################
@@ -1269,22 +1393,14 @@ def serve_book(book_id, book_format, anyname):
             return "File Not Found"
     else:
         if book_format.upper() == 'TXT':
+            file_path = os.path.join(config.get_book_path(), book.path, data.name + "." + book_format)
             try:
-                rawdata = open(os.path.join(config.get_book_path(), book.path, data.name + "." + book_format),
-                               "rb").read()
-                result = chardet.detect(rawdata)
-                try:
-                    text_data = rawdata.decode(result['encoding']).encode('utf-8')
-                except UnicodeDecodeError as e:
-                    log.error("Encoding error in text file {}: {}".format(book.id, e))
-                    if "surrogate" in e.reason:
-                        text_data = rawdata.decode(result['encoding'], 'surrogatepass').encode('utf-8', 'surrogatepass')
-                    else:
-                        text_data = rawdata.decode(result['encoding'], 'ignore').encode('utf-8', 'ignore')
-                return make_response(text_data)
+                stat = os.stat(file_path)
             except FileNotFoundError:
                 log.error("File Not Found")
                 return "File Not Found"
+            return serve_text((book.id, book_format.upper(), stat.st_mtime_ns, stat.st_size), stat.st_size,
+                              read_file(file_path))
         # enable byte range read of pdf
         response = make_response(
             send_from_directory(os.path.join(config.get_book_path(), book.path), data.name + "." + book_format))
@@ -1666,8 +1782,9 @@ def read_book(book_id, book_format):
                                                              ub.Bookmark.format == book_format.upper())).first()
     if book_format.lower() == "epub" or book_format.lower() == "kepub":
         log.debug("Start [k]epub reader for %d", book_id)
+        # local epubs are read entry by entry
         return render_title_template('read.html', bookid=book_id, title=book.title, bookmark=bookmark,
-                                     book_format=book_format)
+                                     book_format=book_format, unpacked=not config.config_use_google_drive)
     elif book_format.lower() == "pdf":
         log.debug("Start pdf reader for %d", book_id)
         return render_title_template('readpdf.html', pdffile=book_id, title=book.title)
@@ -1694,8 +1811,10 @@ def read_book(book_id, book_format):
                     if book.series_index:
                         title = title + " #" + '{0:.2f}'.format(book.series_index).rstrip('0').rstrip('.')
                 log.debug("Start comic reader for %d", book_id)
+                # local archives readable on the server are sent page by page
+                paged = not config.config_use_google_drive and comic_pages.archive_type(fileExt) is not None
                 return render_title_template('readcbr.html', comicfile=all_name, title=title,
-                                             extension=fileExt, bookmark=bookmark)
+                                             extension=fileExt, bookmark=bookmark, paged=paged)
         log.debug("Selected book is unavailable. File does not exist or is not accessible")
         flash(_("Oops! Selected book is unavailable. File does not exist or is not accessible"),
               category="error")
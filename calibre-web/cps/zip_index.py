@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+#  This file is part of the Calibre-Web (https://github.com/janeczku/calibre-web)
+#    Copyright (C) 2026 Calibre-Web contributors
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Single entries of zip archives, read from their offset in the file
+
+The central directory of an archive is parsed once per file version, afterwards an entry is read with one seek to its
+local header. Stored entries are copied in chunks, deflated entries are inflated while they are streamed
+"""
+
+import hashlib
+import os
+import struct
+import zipfile
+import zlib
+from collections import namedtuple
+
+from .library_cache import LibraryCache
+
+CHUNK_SIZE = 64 * 1024
+
+ZIP_LOCAL_HEADER = struct.Struct('<4s22xHH')
+
+# compression is None for entries which have to be read through the zip library
+ZipEntry = namedtuple('ZipEntry', 'name, offset, compressed_size, file_size, compression')
+
+zip_indexes = LibraryCache(64, name="zip_indexes")
+
+
+def file_key(path):
+    """Returns a key which changes with every new version of the file"""
+    stat = os.stat(path)
+    return hashlib.sha1("{}:{}:{}".format(path, stat.st_mtime_ns, stat.st_size).encode()).hexdigest()
+
+
+def zip_entry(info):
+    # encrypted entries and other compressions are left to the zip library
+    compression = info.compress_type
+    if info.flag_bits & 0x1 or compression not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        compression = None
+    return ZipEntry(info.filename, info.header_offset, info.compress_size, info.file_size, compression)
+
+
+def stream_entry(path, entry):
+    """Yields the uncompressed content of the entry of the zip archive at path in chunks"""
+    if entry.compression is not None:
+        with open(path, 'rb') as f:
+            f.seek(entry.offset)
+            signature, name_length, extra_length = ZIP_LOCAL_HEADER.unpack(f.read(ZIP_LOCAL_HEADER.size))
+            if signature == b'PK\x03\x04':
+                f.seek(name_length + extra_length, os.SEEK_CUR)
+                decompressor = zlib.decompressobj(-15) if entry.compression == zipfile.ZIP_DEFLATED else None
+                remaining = entry.compressed_size
+                while remaining > 0:
+                    chunk = f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield decompressor.decompress(chunk) if decompressor else chunk
+                if decompressor:
+                    yield decompressor.flush()
+                return
+    with zipfile.ZipFile(path) as zf:
+        with zf.open(entry.name) as member:
+            for chunk in iter(lambda: member.read(CHUNK_SIZE), b''):
+                yield chunk
+
+
+def read_entry(path, entry):
+    return b"".join(stream_entry(path, entry))
+
+
+class ZipIndex:
+    def __init__(self, path, key, entries):
+        self.path = path
+        # changes with the file, used for etags
+        self.key = key
+        self.entries = entries
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def stream(self, entry):
+        return stream_entry(self.path, entry)
+
+
+def _parse(path, key):
+    with zipfile.ZipFile(path) as zf:
+        entries = {info.filename: zip_entry(info) for info in zf.infolist() if not info.is_dir()}
+    return ZipIndex(path, key, entries)
+
+
+def get_index(path):
+    """Returns the cached index of the entries of the zip archive at path"""
+    key = file_key(path)
+    return zip_indexes.get(key, lambda: _parse(path, key))
@@ -0,0 +1,76 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+from cps import comic_pages
+from cps.comic_pages import ComicIndex, _parse, archive_type
+
+PAGES = {"page10.jpg": b"ten", "page02.png": b"two", "page01.jpg": b"one", "__MACOSX/page01.jpg": b"mac",
+         "notes.txt": b"text"}
+
+
+@pytest.fixture
+def cbz(tmp_path):
+    path = str(tmp_path / "comic.cbz")
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, data in PAGES.items():
+            zf.writestr(name, data, zipfile.ZIP_DEFLATED)
+    return path
+
+
+@pytest.fixture
+def cbt(tmp_path):
+    path = str(tmp_path / "comic.cbt")
+    with tarfile.open(path, "w") as tf:
+        for name, data in PAGES.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return path
+
+
+def test_archive_type():
+    assert archive_type("CBZ") == "zip"
+    assert archive_type("cbt") == "tar"
+    assert archive_type("epub") is None
+
+
+@pytest.mark.parametrize("fixture, archive", [("cbz", "zip"), ("cbt", "tar")])
+def test_pages_are_sorted_and_read(request, fixture, archive):
+    path = request.getfixturevalue(fixture)
+    pages = _parse(path, archive)
+    assert [page.name for page in pages] == ["page01.jpg", "page02.png", "page10.jpg"]
+    assert [page.mimetype for page in pages] == ["image/jpeg", "image/png", "image/jpeg"]
+    index = ComicIndex(path, archive, "key", pages)
+    assert [index.read_page(number) for number in range(len(pages))] == [b"one", b"two", b"ten"]
+
+
+class PreviewCache:
+    def __init__(self, names):
+        self.names = set(names)
+
+    def contains(self, name):
+        return name in self.names
+
+
+def test_previews_missing(cbz, monkeypatch):
+    monkeypatch.setattr(comic_pages, "preview_cache", PreviewCache([]))
+    index = ComicIndex(cbz, "zip", "key", _parse(cbz, "zip"))
+    assert index.previews_missing()
+    # a running task is not queued again
+    assert index.start_previews()
+    assert not index.start_previews()
+    assert not index.previews_missing()
+    index.end_previews()
+    assert index.previews_missing()
+    comic_pages.preview_cache.names.add(index.preview_name(2))
+    assert not index.previews_missing()
+
+
+def test_failed_last_page_does_not_queue_previews(cbz, monkeypatch):
+    monkeypatch.setattr(comic_pages, "preview_cache", PreviewCache([]))
+    index = ComicIndex(cbz, "zip", "key", _parse(cbz, "zip"))
+    index.failed_previews.add(len(index.pages) - 1)
+    assert not index.previews_missing()
+    assert not ComicIndex(cbz, "zip", "key", []).previews_missing()
@@ -0,0 +1,69 @@
+import pytest
+from cps import library_cache
+from cps.library_cache import LibraryCache, TimedCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(library_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_library_cache_evicts_least_recently_used():
+    cache = LibraryCache(2)
+    cache.get("a", lambda: 1)
+    cache.get("b", lambda: 2)
+    assert cache.get("a", lambda: None) == 1
+    cache.get("c", lambda: 3)
+    assert len(cache) == 2
+    assert cache.get("b", lambda: "reloaded") == "reloaded"
+    assert cache.hits == 1
+
+
+def test_timed_cache_expires(clock):
+    cache = TimedCache(ttl=10)
+    assert cache.get("user", lambda: "old") == "old"
+    clock.now += 9
+    assert cache.get("user", lambda: "new") == "old"
+    clock.now += 2
+    assert cache.get("user", lambda: "new") == "new"
+
+
+def test_timed_cache_does_not_store_none(clock):
+    cache = TimedCache(ttl=10)
+    assert cache.get("missing", lambda: None) is None
+    assert len(cache) == 0
+    assert cache.get("missing", lambda: "found") == "found"
+
+
+def test_timed_cache_invalidation(clock):
+    cache = TimedCache(ttl=10)
+    cache.get(("user", 1), lambda: "one")
+    cache.get(("user", 2), lambda: "two")
+    cache.discard(lambda key: key == ("user", 1))
+    assert cache.get(("user", 1), lambda: "changed") == "changed"
+    assert cache.get(("user", 2), lambda: "changed") == "two"
+    cache.clear()
+    assert cache.get(("user", 2), lambda: "changed") == "changed"
+
+
+def test_timed_cache_skips_value_loaded_during_invalidation(clock):
+    cache = TimedCache(ttl=10)
+
+    def stale_loader():
+        # another thread commits a change of the user while it is loaded
+        cache.discard(lambda key: key == "user")
+        return "stale"
+
+    assert cache.get("user", stale_loader) == "stale"
+    assert cache.get("user", lambda: "fresh") == "fresh"
+    assert cache.get("user", lambda: "other") == "fresh"
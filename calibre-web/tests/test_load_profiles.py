@@ -0,0 +1,54 @@
+import datetime
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import sessionmaker
+
+from cps import db
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+
+    @event.listens_for(engine, 'connect')
+    def attach(connection, __):
+        connection.execute("ATTACH ':memory:' AS calibre")
+
+    db.Base.metadata.create_all(engine, tables=[table for name, table in db.Base.metadata.tables.items()
+                                                if not name.startswith('custom_column')])
+    session = sessionmaker(bind=engine)()
+    now = datetime.datetime(2020, 1, 1)
+    book = db.Books('Title', 'Title', 'Author', now, now, 1, now, 'Author/Title', None, [], [])
+    book.uuid = '1'
+    book.authors.append(db.Authors('Author', 'Author'))
+    book.tags.append(db.Tags('Tag'))
+    session.add(book)
+    session.commit()
+    session.expunge_all()
+    yield session
+    session.close()
+
+
+def test_load_profile_loads_listed_relations(session):
+    calibre_db = db.CalibreDB()
+    calibre_db.strict_loading = True
+    book = session.query(db.Books).options(*calibre_db.load_options('table')).one()
+    assert [author.name for author in book.authors] == ['Author']
+    assert [tag.name for tag in book.tags] == ['Tag']
+
+
+def test_strict_loading_raises_on_lazy_load(session):
+    calibre_db = db.CalibreDB()
+    calibre_db.strict_loading = True
+    book = session.query(db.Books).options(*calibre_db.load_options('list')).one()
+    assert [author.name for author in book.authors] == ['Author']
+    with pytest.raises(InvalidRequestError):
+        book.tags
+
+
+def test_lazy_loading_without_strict_loading(session):
+    calibre_db = db.CalibreDB()
+    book = session.query(db.Books).options(*calibre_db.load_options('list')).one()
+    assert [tag.name for tag in book.tags] == ['Tag']
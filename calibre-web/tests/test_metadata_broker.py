@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+from cps import metadata_broker
+from cps.metadata_broker import MetadataBroker, normalize_query
+
+
+class Provider:
+    def __init__(self, provider_id, records, delay=0.0):
+        self.__id__ = provider_id
+        self.__name__ = provider_id
+        self.records = records
+        self.delay = delay
+        self.calls = 0
+
+    def search(self, query, generic_cover, locale):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.records
+
+
+@pytest.fixture
+def busy_broker():
+    # the only worker of the pool is blocked until the test ends
+    broker = MetadataBroker(1, "test_broker")
+    release = threading.Event()
+    broker._executor.submit(release.wait)
+    yield broker
+    release.set()
+
+
+def test_normalize_query():
+    assert normalize_query("  The  Hobbit ") == "the hobbit"
+
+
+def test_cached_results_bypass_pool(busy_broker):
+    provider = Provider("cached", ["cached record"])
+    busy_broker.results.get(("cached", "hobbit", "en", ""), lambda: ["cached record"])
+    started = time.monotonic()
+    assert busy_broker.search([provider], "Hobbit", "", "en") == ["cached record"]
+    assert time.monotonic() - started < 0.5
+    assert provider.calls == 0
+
+
+def test_queued_time_does_not_count_as_timeout(monkeypatch):
+    monkeypatch.setattr(metadata_broker, "PROVIDER_TIMEOUT", 0.4)
+    monkeypatch.setattr(metadata_broker, "QUEUE_POLL", 0.05)
+    broker = MetadataBroker(1, "test_queue")
+    broker._executor.submit(time.sleep, 0.6)
+    provider = Provider("queued", ["record"], delay=0.1)
+    assert broker.search([provider], "query", "", "en") == ["record"]
+    assert broker.breaker(provider).failures == 0
+
+
+def test_slow_provider_is_left_out(monkeypatch):
+    monkeypatch.setattr(metadata_broker, "PROVIDER_TIMEOUT", 0.2)
+    broker = MetadataBroker(2, "test_slow")
+    slow = Provider("slow", ["late"], delay=0.5)
+    fast = Provider("fast", ["early"])
+    assert broker.search([slow, fast], "query", "", "en") == ["early"]
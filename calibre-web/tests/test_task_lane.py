@@ -0,0 +1,106 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from cps.services import worker
+from cps.services.worker import (TaskLane, QueuedTask, WorkerThread, MAX_LANE_CONCURRENCY, PRIORITY_HIGH,
+                                 PRIORITY_NORMAL, PRIORITY_LOW)
+
+
+def queued(num, user, priority=PRIORITY_NORMAL, dedupe_key=None):
+    task = SimpleNamespace(priority=priority, dedupe_key=dedupe_key)
+    return QueuedTask(num=num, user=user, added=datetime.now(), task=task, hidden=False)
+
+
+def drain(lane):
+    items = list()
+    item = lane.get()
+    while item is not None:
+        items.append(item)
+        item = lane.get()
+    return items
+
+
+def test_empty_lane_returns_none():
+    assert TaskLane("mail", 2).get() is None
+
+
+def test_users_are_served_round_robin():
+    lane = TaskLane("conversion", 1)
+    for num in range(4):
+        lane.put(queued(num, "alice"))
+    lane.put(queued(4, "bob"))
+    lane.put(queued(5, "bob"))
+    assert [(item.user, item.num) for item in drain(lane)] == [("alice", 0), ("bob", 4), ("alice", 1),
+                                                               ("bob", 5), ("alice", 2), ("alice", 3)]
+
+
+def test_priority_before_rotation():
+    lane = TaskLane("conversion", 1)
+    lane.put(queued(0, "alice", PRIORITY_LOW))
+    lane.put(queued(1, "bob"))
+    lane.put(queued(2, "alice", PRIORITY_HIGH))
+    assert [item.num for item in drain(lane)] == [2, 1, 0]
+
+
+def test_dedupe_key_pending_until_taken():
+    lane = TaskLane("thumbnails", 1)
+    lane.put(queued(0, "System", dedupe_key="cover-1"))
+    assert lane.is_pending(SimpleNamespace(dedupe_key="cover-1"))
+    assert not lane.is_pending(SimpleNamespace(dedupe_key=None))
+    assert [item.num for item in lane.to_list()] == [0]
+    lane.get()
+    assert not lane.is_pending(SimpleNamespace(dedupe_key="cover-1"))
+
+
+@pytest.fixture
+def worker_thread(monkeypatch):
+    # the lanes are configured without starting the worker
+    monkeypatch.setattr(WorkerThread, "start", lambda self: None)
+    return WorkerThread()
+
+
+def test_configure_lanes_clamps_concurrency(worker_thread):
+    worker_thread.configure_lanes({"conversion": 3, "mail": 100, "thumbnails": -2, "unknown": 4})
+    assert worker_thread.lanes["conversion"].concurrency == 3
+    assert worker_thread.lanes["mail"].concurrency == MAX_LANE_CONCURRENCY
+    assert worker_thread.lanes["thumbnails"].concurrency == 1
+
+
+def test_configure_lanes_keeps_defaults_for_empty_config(worker_thread):
+    worker_thread.configure_lanes({})
+    worker_thread.configure_lanes({"conversion": None, "mail": 0})
+    assert {name: lane.concurrency for name, lane in worker_thread.lanes.items()} == \
+        dict(worker.DEFAULT_LANE_CONCURRENCY)
+
+
+class Journal:
+    def __init__(self, worker_thread):
+        self.worker_thread = worker_thread
+        self.entries = set()
+
+    def record(self, task, user, hidden):
+        # writing app.db must not block the lanes
+        assert not self.worker_thread.doLock.locked()
+        task.journal_id = len(self.entries) + 1
+        self.entries.add(task.journal_id)
+
+    def remove(self, task):
+        assert not self.worker_thread.doLock.locked()
+        self.entries.discard(task.journal_id)
+        task.journal_id = None
+
+
+def test_add_journals_outside_lock_and_drops_duplicates(worker_thread, monkeypatch):
+    monkeypatch.setattr(WorkerThread, "_instance", worker_thread)
+    worker_thread.journal = Journal(worker_thread)
+
+    def task():
+        return SimpleNamespace(lane="thumbnails", priority=PRIORITY_NORMAL, dedupe_key="cover-1", journal_id=None)
+
+    first, duplicate = task(), task()
+    WorkerThread.add("alice", first)
+    WorkerThread.add("alice", duplicate)
+    assert [item.task for item in worker_thread.lanes["thumbnails"].to_list()] == [first]
+    assert worker_thread.journal.entries == {first.journal_id}
+    assert duplicate.journal_id is None
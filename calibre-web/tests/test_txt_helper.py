@@ -0,0 +1,78 @@
+import pytest
+from flask import Flask
+from cps import txt_helper
+from cps.txt_helper import DETECT_BYTES, detect_encoding, serve_text, slice_stream, transcode
+
+
+def chunked(data, size=7):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_detect_encoding():
+    assert detect_encoding(b"plain text") == "ascii"
+    assert detect_encoding("Grüße aus Köln, schöne Grüße".encode("utf-8")) == "utf-8"
+    assert detect_encoding(b"") == "utf-8"
+
+
+def test_transcode_utf8_split_across_chunks():
+    text = "naïve café – ünïcödé " * 10
+    assert b"".join(transcode(chunked(text.encode("utf-8")), "utf-8")) == text.encode("utf-8")
+
+
+def test_transcode_other_encoding():
+    text = "Grüße, schöne Äpfel"
+    assert b"".join(transcode(chunked(text.encode("cp1252")), "windows-1252")) == text.encode("utf-8")
+
+
+def test_transcode_encoding_change_past_sample():
+    data = b"a" * (DETECT_BYTES + 10) + "café € end".encode("cp1252")
+    assert detect_encoding(data) == "ascii"
+    result = b"".join(transcode(chunked(data, txt_helper.CHUNK_SIZE), "ascii"))
+    assert result == b"a" * (DETECT_BYTES + 10) + "café € end".encode("utf-8")
+
+
+def test_transcode_invalid_byte_at_end():
+    assert b"".join(transcode([b"ab", b"c\xe9"], "utf-8")) == "abcé".encode("utf-8")
+
+
+def test_slice_stream():
+    chunks = [b"abc", b"defg", b"hi"]
+    assert b"".join(slice_stream(chunks, 0, 9)) == b"abcdefghi"
+    assert b"".join(slice_stream(chunks, 2, 5)) == b"cde"
+    assert b"".join(slice_stream(chunks, 3, 7)) == b"defg"
+    assert b"".join(slice_stream(chunks, 8, 20)) == b"i"
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def serve(app, key, data, headers=None):
+    def read(start, stop):
+        yield from chunked(data[start:stop], txt_helper.CHUNK_SIZE)
+    with app.test_request_context(headers=headers):
+        response = serve_text(key, len(data), read)
+        return response.status_code, response.headers, response.get_data()
+
+
+def test_serve_text_ranges_after_first_pass(app):
+    data = b"a" * (DETECT_BYTES + 10) + "café".encode("cp1252")
+    expected = b"a" * (DETECT_BYTES + 10) + "café".encode("utf-8")
+    status, headers, body = serve(app, "past-sample", data, {"Range": "bytes=0-9"})
+    assert status == 200
+    assert body == expected
+    status, headers, body = serve(app, "past-sample", data, {"Range": "bytes=-5"})
+    assert status == 206
+    assert headers["Content-Range"] == "bytes {}-{}/{}".format(len(expected) - 5, len(expected) - 1, len(expected))
+    assert body == "café".encode("utf-8")[-5:]
+
+
+def test_serve_text_confirms_utf8_after_first_pass(app):
+    data = b"a" * (DETECT_BYTES + 10) + "café".encode("utf-8")
+    status, headers, body = serve(app, "utf-8-past-sample", data, {"Range": "bytes=0-9"})
+    assert status == 200
+    assert body == data
+    status, headers, body = serve(app, "utf-8-past-sample", data, {"Range": "bytes=0-9"})
+    assert status == 206
+    assert body == b"a" * 10
@@ -0,0 +1,42 @@
+import pytest
+from cps.typeahead import TypeaheadIndex, fold
+
+
+@pytest.fixture
+def index():
+    return TypeaheadIndex(["Science Fiction", "Fantasy", "Fairy Tales", "Historical Fiction", "Ärger",
+                           "Garçon", "Sci-Fi"])
+
+
+def test_fold_like_lcase():
+    assert fold("Ärger") == "arger"
+    assert fold("GARÇON") == "garcon"
+
+
+def test_search_prefix_before_infix(index):
+    result = index.search("fic")
+    assert result == ["Historical Fiction", "Science Fiction"]
+    result = index.search("sci")
+    assert result == ["Sci-Fi", "Science Fiction"]
+
+
+def test_search_non_ascii_names(index):
+    assert index.search("arg") == ["Ärger"]
+    assert index.search("ÄRG") == ["Ärger"]
+    assert index.search("garcon") == ["Garçon"]
+    assert index.search("rço") == ["Garçon"]
+
+
+def test_search_short_query_matches_infix(index):
+    assert index.search("fa") == ["Fairy Tales", "Fantasy"]
+    assert index.search("y") == ["Fairy Tales", "Fantasy"]
+
+
+def test_search_limit_and_visible(index):
+    assert len(index.search("a", limit=2)) == 2
+    assert index.search("fa", visible=lambda name: name != "Fantasy") == ["Fairy Tales"]
+    assert index.search("zzz") == []
+
+
+def test_duplicate_names_are_indexed_once():
+    assert len(TypeaheadIndex(["Tag", "Tag", "tag"])) == 2
@@ -0,0 +1,60 @@
+import os
+import zipfile
+
+import pytest
+from cps import zip_index
+from cps.zip_index import get_index, read_entry, stream_entry, zip_entry
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = str(tmp_path / "book.epub")
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("mimetype", b"application/epub+zip", zipfile.ZIP_STORED)
+        zf.writestr("OEBPS/chapter1.xhtml", os.urandom(zip_index.CHUNK_SIZE * 2 + 17), zipfile.ZIP_STORED)
+        zf.writestr("OEBPS/chapter2.xhtml", b"<p>text</p>" * 20000, zipfile.ZIP_DEFLATED)
+        zf.writestr("OEBPS/image.svg", b"<svg/>" * 100, zipfile.ZIP_BZIP2)
+        zf.writestr("OEBPS/", b"")
+    return path
+
+
+def expected(path, name):
+    with zipfile.ZipFile(path) as zf:
+        return zf.read(name)
+
+
+def test_entries_are_read_from_their_offset(archive):
+    index = get_index(archive)
+    assert index.get("OEBPS/") is None
+    for name in ("mimetype", "OEBPS/chapter1.xhtml", "OEBPS/chapter2.xhtml"):
+        entry = index.get(name)
+        assert entry.compression is not None
+        assert read_entry(archive, entry) == expected(archive, name)
+
+
+def test_stored_entry_is_streamed_in_chunks(archive):
+    entry = get_index(archive).get("OEBPS/chapter1.xhtml")
+    chunks = list(stream_entry(archive, entry))
+    assert [len(chunk) for chunk in chunks] == [zip_index.CHUNK_SIZE, zip_index.CHUNK_SIZE, 17]
+
+
+def test_other_compressions_use_zip_library(archive):
+    entry = get_index(archive).get("OEBPS/image.svg")
+    assert entry.compression is None
+    assert read_entry(archive, entry) == b"<svg/>" * 100
+
+
+def test_wrong_offset_falls_back_to_zip_library(archive):
+    with zipfile.ZipFile(archive) as zf:
+        entry = zip_entry(zf.getinfo("OEBPS/chapter2.xhtml"))
+    assert read_entry(archive, entry._replace(offset=entry.offset + 1)) == expected(archive, entry.name)
+
+
+def test_index_changes_with_file(archive):
+    index = get_index(archive)
+    assert get_index(archive) is index
+    with zipfile.ZipFile(archive, "a") as zf:
+        zf.writestr("OEBPS/chapter3.xhtml", b"new")
+    changed = get_index(archive)
+    assert changed.key != index.key
+    assert read_entry(archive, changed.get("OEBPS/chapter3.xhtml")) == b"new"